@@ -1,12 +1,12 @@
 import collections
 import math
 from argparse import ArgumentParser
-from typing import List, Optional, Union, Any
+from typing import List, Optional, Union, Any, Iterable
 
 import numpy as np
-from matplotlib import pyplot as plt
 
 from .experiment import Experiment
+from .filters import mean, get_property, is_excluded_from_string, is_excluded
 
 
 def table(data, column_header=None, row_header=None):
@@ -64,12 +64,6 @@ def add_arguments(parser: ArgumentParser):
     parser.add_argument("-w", "--write_to", type=str, default=None)
 
 
-def mean(iterable):
-    if any(e is None for e in iterable):
-        return None
-    return sum(iterable) / len(iterable)
-
-
 def mean_scores(scores):
     return [
         mean([scores[r][c] for r in range(len(scores))]) for c in range(len(scores[0]))
@@ -100,142 +94,6 @@ def show_from_args(experiments, args):
     show(experiments, *parse_args(args))
 
 
-def get_property(index: int, experiment: Experiment, property_name: str):
-    parts = property_name.split("__")
-    if len(parts) > 1:
-        operator = parts[-1]
-        remaining = "__".join(parts[:-1])
-        if operator == "mean":
-            return mean(get_property(index, experiment, remaining))
-        if operator == "len":
-            return len(get_property(index, experiment, remaining))
-        if operator == "sum":
-            return sum(get_property(index, experiment, remaining))
-        if operator == "max":
-            return max(get_property(index, experiment, remaining))
-        if operator == "min":
-            return min(get_property(index, experiment, remaining))
-        if operator == "test":
-            return 1 if is_excluded_from_string(remaining, experiment) else 0
-        if operator.startswith("batch"):
-            bin_size = float(operator[5:])
-            return (
-                int(get_property(index, experiment, remaining) / bin_size) * bin_size
-                - bin_size / 2
-            )
-        else:
-            try:
-                index = int(operator)
-                return get_property(index, experiment, remaining)[index]
-            except ValueError:
-                pass
-
-    if property_name == "id":
-        return index
-
-    if property_name == "*":
-        return "all"
-
-    if property_name == "group":
-        return experiment.group
-
-    if property_name == "completed":
-        return experiment.completed
-
-    try:
-        return experiment.get(property_name)
-    except ValueError:
-        pass
-
-    if "." in property_name:
-        parts = property_name.split(".")
-        return getattr(get_property(index, experiment, ".".join(parts[:-1])), parts[-1])
-
-    properties = (
-        ["id", "*"]
-        + sorted(
-            map(lambda s: "config.{s}".format(s=s), experiment.config.parameters.keys())
-        )
-        + sorted(
-            map(
-                lambda s: "parameter.{s}".format(s=s),
-                experiment.parameters.parameters.keys(),
-            )
-        )
-        + sorted(
-            map(lambda s: "result.{s}".format(s=s), experiment.result.parameters.keys())
-        )
-        + sorted(
-            map(
-                lambda s: "derived.{s}".format(s=s), experiment.derived_callbacks.keys()
-            )
-        )
-    )
-
-    raise ValueError(
-        "Could not find property: {}, choose a valid property ({}) or a filter".format(
-            property_name, properties
-        )
-    )
-
-
-def is_excluded_from_string(filter_string, experiment):
-    if filter_string.startswith("~"):
-        return not is_excluded_from_string(filter_string[1:], experiment)
-
-    if "<=" in filter_string:
-        parts = filter_string.split("<=", 2)
-        value = float(parts[1])
-        return get_property(0, experiment, parts[0]) <= value
-    if ">=" in filter_string:
-        parts = filter_string.split(">=", 2)
-        value = float(parts[1])
-        return get_property(0, experiment, parts[0]) >= value
-    if "<" in filter_string:
-        parts = filter_string.split("<", 2)
-        value = float(parts[1])
-        return get_property(0, experiment, parts[0]) < value
-    if ">" in filter_string:
-        parts = filter_string.split(">", 2)
-        value = float(parts[1])
-        return get_property(0, experiment, parts[0]) > value
-    if "!=" in filter_string:
-        parts = filter_string.split("!=", 2)
-        try:
-            value = float(parts[1])
-        except ValueError:
-            value = parts[1]
-        return get_property(0, experiment, parts[0]) != value
-    if "=" in filter_string:
-        parts = filter_string.split("=", 2)
-        try:
-            value = float(parts[1])
-        except ValueError:
-            value = parts[1]
-        return get_property(0, experiment, parts[0]) == value
-
-    if filter_string.startswith("~"):
-        return not bool(get_property(0, experiment, filter_string[1:]))
-    return bool(get_property(0, experiment, filter_string))
-
-
-def is_excluded(experiment: Experiment, exclude: Optional[List]):
-    if exclude is None:
-        exclude = []
-
-    if not isinstance(exclude, collections.Iterable):
-        exclude = [exclude]
-
-    for f in exclude:
-        if callable(f):
-            if f(experiment):
-                return True
-        else:
-            if is_excluded_from_string(str(f), experiment):
-                return True
-    return False
-
-
 def partition(dicts, *attributes):
     result = collections.defaultdict(list)
     for d in dicts:
@@ -294,6 +152,13 @@ def plot_lines(dicts, partitions: list[str], group_by: str, results: list[str]):
     return groups_to_plot_lines(grouped, group_by)
 
 
+def current_axes():
+    # Importing pyplot is slow, it is only imported when plotting
+    from matplotlib import pyplot as plt
+
+    return plt.gca()
+
+
 def plot(
     dicts,
     partitions: list[str],
@@ -304,7 +169,7 @@ def plot(
     make_legend=True,
 ):
     x, y, e = plot_lines(dicts, partitions, group_by, results)
-    ax = ax or plt.gca()
+    ax = ax or current_axes()
 
     if errors:
         for key in y:
@@ -334,6 +199,40 @@ def plot(
         ax.legend()
 
 
+def trace_at(experiments, name, times, aggregator=None):
+    """
+    Aggregates (mean by default) the values reported for the given trace at each of the
+    given times.
+    """
+    aggregator = aggregator or mean
+    samples = [[e.get_trace_value(name, t) for e in experiments] for t in times]
+    return [
+        aggregator([v for v in values if v is not None] or [None]) for values in samples
+    ]
+
+
+def plot_trace(experiments, name, times, errors=True, ax=None, label=None):
+    experiments = list(experiments)
+    ax = ax or current_axes()
+    samples = [
+        np.array(
+            [
+                v
+                for v in (e.get_trace_value(name, t) for e in experiments)
+                if v is not None
+            ]
+        )
+        for t in times
+    ]
+    y = np.array([s.mean() if len(s) > 0 else np.nan for s in samples])
+    if errors:
+        e = np.array(
+            [s.std() / math.sqrt(len(s)) if len(s) > 0 else np.nan for s in samples]
+        )
+        ax.fill_between(times, y - e, y + e, alpha=0.35, linewidth=0)
+    ax.plot(times, y, label=label or name)
+
+
 # def gen_colors(n):
 #     iterator = iter(cm.get_cmap("rainbow")(numpy.linspace(0, 1, n)))
 #     return [next(iterator) for _ in range(n)]
@@ -350,8 +249,16 @@ def plot(
 #     plt.show()
 
 
+def required_properties(targets=None, group_by=None, sort=None):
+    # The properties that show needs to access (filters are handled by the storage)
+    names = list(targets or []) + list(group_by or [])
+    if sort is not None:
+        names.append(sort.strip().lstrip("-"))
+    return names
+
+
 def show(
-    experiments: List[Experiment],
+    experiments: Iterable[Experiment],
     targets=None,
     group_by=None,
     aggregator=None,
@@ -369,7 +276,7 @@ def show(
     else:
         raise RuntimeError("Unknown aggregator {}".format(aggregator))
 
-    experiments = [e for e in experiments if not is_excluded(e, exclude)]
+    experiments = (e for e in experiments if not is_excluded(e, exclude))
 
     # if plot and len(targets) != 1:
     #     raise ValueError(
@@ -395,7 +302,7 @@ def show(
         experiments = [
             t[1]
             for t in sorted(
-                zip(range(len(experiments)), experiments),
+                enumerate(experiments),
                 key=lambda t: get_property(t[0], t[1], sort),
                 reverse=reverse,
             )
@@ -1,26 +1,71 @@
+import os
+import sys
 from argparse import ArgumentParser
-from typing import Type, TYPE_CHECKING, Optional
+from typing import Type, TYPE_CHECKING, Optional, List, Tuple
 
-from .observe import ProgressObserver
-from .settings import DEFAULT_GROUP_NAME
-from .analyze import is_excluded_from_string
-from .runner import import_runner, PrintCountObserver
-from .storage import import_storage
-from .analyze import add_arguments, show_from_args
+from .settings import (
+    BATCH_TARGET_TIME,
+    DEFAULT_GROUP_NAME,
+    DEFAULT_LEASE,
+    LOG_MAX_BYTES,
+)
+from .storage import import_storage, run_experiment
 
 if TYPE_CHECKING:
     from .experiment import Experiment
+    from .storage import Storage
+
+
+def parse_run(argv):
+    # type: (List[str]) -> Optional[Tuple[str, List[int]]]
+    """
+    Parses the arguments of the run mode ([-s STORAGE] run EXP_ID...), returns None for
+    other arguments.
+    """
+    storage = "sqlite"
+    if len(argv) > 2 and argv[0] in ("-s", "--storage"):
+        storage, argv = argv[1], argv[2:]
+    elif len(argv) > 0 and argv[0].startswith("--storage="):
+        storage, argv = argv[0].partition("=")[2], argv[1:]
+    if len(argv) >= 2 and argv[0] == "run" and all(a.isdigit() for a in argv[1:]):
+        return storage, [int(a) for a in argv[1:]]
+    return None
+
+
+def run(cls, storage, identifiers):
+    # type: (Type[Experiment], Storage, List[int]) -> None
+    if len(identifiers) == 1:
+        run_experiment(storage, cls, identifiers[0])
+    else:
+        from .runner import CommandLineRunner
+
+        CommandLineRunner.run_batch(storage, cls, identifiers)
 
 
 def parse_cli(cls, cmd=None):
     # type: (Type[Experiment], Optional[str]) -> None
+    # Runners start a process in run mode for every experiment, it skips building the
+    # parser and importing the modules used by other modes (e.g., for plotting)
+    run_args = parse_run(sys.argv[1:])
+    if run_args is not None:
+        run(cls, import_storage(run_args[0]), run_args[1])
+        return
+
+    from .analyze import add_arguments, show_from_args, required_properties
+    from .filters import is_excluded_from_string
+    from .resources import parse_memory
+    from .runner import import_runner, PrintCountObserver
+    from .trajectory import parse_shard
+
     parser = ArgumentParser()
     parser.add_argument(
         "-s",
         "--storage",
         default="sqlite",
         type=str,
-        help="Which type of storage to use.  Default (and currently only option) is 'sqlite'.",
+        help="Which type of storage to use.  Default (and currently only option) is "
+        "'sqlite', options can be passed as query string, e.g., "
+        "'sqlite?concurrent=1&busy_timeout=60&filename=experiments.sqlite'.",
     )
 
     sub_parser = parser.add_subparsers(
@@ -30,10 +75,18 @@ def parse_cli(cls, cmd=None):
         "[analyze] Analyze results, "
         "[explore] Queue experiments to explore parameter values, "
         "[list] Lists experiments in the database, "
-        "[remove] Remove experiments from the database",
+        "[remove] Remove experiments from the database, "
+        "[derive] Compute and store derived values of stored experiments, "
+        "[profile] Show the hotspots of profiled experiments, "
+        "[merge] Merge the experiments of other storage files (e.g., of shards run "
+        "on other machines), "
+        "[worker] Run experiments queued in the storage (e.g., by the queue engine), "
+        "[logs] Show the captured output of an experiment",
     )
     run_parser = sub_parser.add_parser("run")
-    run_parser.add_argument("exp_id", type=int)
+    run_parser.add_argument(
+        "exp_id", type=int, nargs="+", help="Experiments to run (one after the other)"
+    )
 
     analyze_parser = sub_parser.add_parser("analyze")
     analyze_parser.add_argument("-n", "--names", nargs="+", type=str)
@@ -66,6 +119,76 @@ def parse_cli(cls, cmd=None):
     explore_parser.add_argument(
         "-t", "--timeout", type=int, default=None, help="Timeout for the execution"
     )
+    explore_parser.add_argument(
+        "--profile",
+        choices=["cpu", "memory"],
+        default=None,
+        help="Profile the experiments",
+    )
+    explore_parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        default=None,
+        help="Only explore one shard of the experiments, given as index/count (e.g., "
+        "0/4), every machine that is given another index obtains a disjoint part",
+    )
+    explore_parser.add_argument(
+        "--shard_by",
+        default=None,
+        help="Balance the shards by the runtimes of the experiments of this (finished) "
+        "group, every machine has to be given the same group",
+    )
+    explore_parser.add_argument(
+        "--log_size",
+        nargs="?",
+        type=int,
+        const=LOG_MAX_BYTES,
+        default=None,
+        help="Log the output of every experiment (in a directory next to the storage "
+        "file), keeping at most this many bytes (default: {})".format(LOG_MAX_BYTES),
+    )
+    explore_parser.add_argument(
+        "--cpus", type=int, default=None, help="Cores every experiment needs"
+    )
+    explore_parser.add_argument(
+        "--memory",
+        type=parse_memory,
+        default=None,
+        help="Memory every experiment needs (e.g., 512M or 4G)",
+    )
+    explore_parser.add_argument(
+        "--limit_memory",
+        action="store_true",
+        help="Limit every experiment to the memory it needs",
+    )
+    explore_parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=None,
+        help="Number of processes (default: number of CPUs)",
+    )
+    explore_parser.add_argument(
+        "--batch",
+        nargs="?",
+        type=float,
+        const=BATCH_TARGET_TIME,
+        default=None,
+        help="Run short experiments in batches that take about this many seconds per "
+        "process (default: {}), only for the cli engine".format(BATCH_TARGET_TIME),
+    )
+    explore_parser.add_argument(
+        "--longest_first",
+        action="store_true",
+        help="Run the experiments in order of decreasing runtime, predicted from "
+        "earlier runs",
+    )
+    explore_parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Only print the makespan (time until all pending experiments are done) "
+        "predicted from earlier runs",
+    )
 
     list_parser = sub_parser.add_parser("list")
     list_parser.add_argument("name", nargs="?", default=None)
@@ -76,6 +199,77 @@ def parse_cli(cls, cmd=None):
     remove_parser.add_argument("-e", "--exclude", nargs="+", type=str, default=None)
     remove_parser.add_argument("--dry_run", action="store_true")
 
+    derive_parser = sub_parser.add_parser("derive")
+    derive_parser.add_argument(
+        "derived", nargs="+", type=str, help="The derived values to store"
+    )
+    derive_parser.add_argument("-n", "--name", type=str, default=DEFAULT_GROUP_NAME)
+    derive_parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=None,
+        help="Number of processes (default: number of CPUs)",
+    )
+    derive_parser.add_argument("-c", "--chunk_size", type=int, default=100)
+
+    profile_parser = sub_parser.add_parser("profile")
+    profile_parser.add_argument(
+        "exp_id",
+        type=int,
+        nargs="?",
+        default=None,
+        help="Experiment id (default: aggregate the group)",
+    )
+    profile_parser.add_argument("-n", "--name", type=str, default=DEFAULT_GROUP_NAME)
+    profile_parser.add_argument(
+        "-k", "--kind", choices=["cpu", "memory"], default="cpu"
+    )
+    profile_parser.add_argument(
+        "-t", "--top", type=int, default=20, help="Number of hotspots"
+    )
+    profile_parser.add_argument(
+        "-s",
+        "--sort",
+        type=str,
+        default="cumulative",
+        help="Sort order of CPU hotspots (see pstats)",
+    )
+
+    merge_parser = sub_parser.add_parser("merge")
+    merge_parser.add_argument(
+        "files", nargs="+", type=str, help="The SQLite files to merge into the storage"
+    )
+
+    worker_parser = sub_parser.add_parser("worker")
+    worker_parser.add_argument(
+        "-n",
+        "--name",
+        type=str,
+        default=None,
+        help="Only run experiments of this group (default: all groups)",
+    )
+    worker_parser.add_argument(
+        "--lease",
+        type=float,
+        default=DEFAULT_LEASE,
+        help="Seconds after which a crashed worker's experiment is rerun",
+    )
+    worker_parser.add_argument(
+        "--poll",
+        type=float,
+        default=1.0,
+        help="Seconds between checks for queued experiments",
+    )
+    worker_parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="Keep waiting for experiments to be queued (instead of stopping)",
+    )
+
+    logs_parser = sub_parser.add_parser("logs")
+    logs_parser.add_argument("exp_id", type=int, help="Experiment id")
+
     # groups_parser = sub_parser.add_parser("groups")
 
     # python product_experiment.py sqlite analyze
@@ -84,20 +278,22 @@ def parse_cli(cls, cmd=None):
     storage = import_storage(args.storage)
 
     if args.mode == "run":
-        exp_id = args.exp_id
-        experiment = storage.get_experiment(cls, exp_id)
-        experiment.run_wrapped(True)
+        run(cls, storage, args.exp_id)
     elif args.mode == "analyze":
-        experiments = []
         names = args.names or [DEFAULT_GROUP_NAME]
-        for name in names:
-            for experiment in storage.get_experiments(cls, name):
-                experiments.append(experiment)
-
-        try:
-            show_from_args(experiments, args)
-        except KeyboardInterrupt:
-            pass
+        fields = required_properties(args.targets, args.group_by, args.sort)
+        with storage.snapshot():
+            experiments = (
+                experiment
+                for name in names
+                for experiment in storage.iter_experiments(
+                    cls, name, fields=fields, exclude=args.exclude
+                )
+            )
+            try:
+                show_from_args(experiments, args)
+            except KeyboardInterrupt:
+                pass
     elif args.mode == "explore":
         from .trajectory import product, Trajectory
 
@@ -114,20 +310,60 @@ def parse_cli(cls, cmd=None):
                     settings = product(settings, local_settings)
         trajectory = Trajectory(args.name)
         trajectory.explore(cls, settings)
+        if args.shard:
+            trajectory = trajectory.shard(
+                *args.shard, storage=storage, runtime_group=args.shard_by
+            )
+        if args.profile:
+            for e in trajectory.experiments:
+                e.config["@profile"] = args.profile
+        if args.log_size:
+            for e in trajectory.experiments:
+                e.config["@log_size"] = args.log_size
+        for key in ("timeout", "cpus", "memory", "limit_memory"):
+            if getattr(args, key):
+                for e in trajectory.experiments:
+                    e.config["@" + key] = getattr(args, key)
         print(*trajectory.experiments, sep="\n")
-        if args.engine:
-            engine = import_runner(args.engine, trajectory, storage, args.timeout, cmd)
+        if args.dry_run:
+            from .prediction import predict_runtimes, makespan_summary
+            from .runner import existing_identifiers
+
+            # Settings that were run already are skipped when running
+            identifiers = existing_identifiers(
+                storage, trajectory.name, trajectory.experiments
+            )
+            pending = [
+                e
+                for e, identifier in zip(trajectory.experiments, identifiers)
+                if identifier is None
+            ]
+            print(
+                "{} of {} experiments are pending".format(
+                    len(pending), len(trajectory.experiments)
+                )
+            )
+            runtimes = predict_runtimes(storage, pending)
+            print(makespan_summary(runtimes, args.processes or os.cpu_count() or 1))
+        elif args.engine:
+            engine = import_runner(
+                args.engine,
+                trajectory,
+                storage,
+                args.timeout,
+                cmd,
+                args.processes,
+                args.longest_first,
+                args.batch,
+            )
             engine.set_observer(PrintCountObserver())
             engine.run()
     elif args.mode == "list":
 
         def print_experiments(group_name, exclusion_filter=None):
-            experiments_to_print = [
-                e
-                for e in storage.get_experiments(cls, group_name)
-                if not exclusion_filter
-                or not any(is_excluded_from_string(f, e) for f in exclusion_filter)
-            ]
+            experiments_to_print = storage.get_experiments(
+                cls, group_name, exclude=exclusion_filter
+            )
             if len(experiments_to_print) > 0:
                 print(*experiments_to_print, sep="\n")
             else:
@@ -154,3 +390,61 @@ def parse_cli(cls, cmd=None):
                         )
         else:
             storage.remove(args.name, dry_run=args.dry_run)
+    elif args.mode == "derive":
+        from .derive import derive
+
+        count = derive(
+            cls,
+            args.name,
+            args.derived,
+            storage,
+            args.processes,
+            args.chunk_size,
+            lambda done, total: print(
+                "Derived {} of {} experiments".format(done, total)
+            ),
+        )
+        if count == 0:
+            print("No experiments to update.")
+    elif args.mode == "profile":
+        from .profiling import hotspots
+
+        if args.exp_id is not None:
+            identifiers = [args.exp_id]
+        else:
+            identifiers = [
+                e.identifier
+                for e in storage.iter_experiments(cls, args.name, fields=[])
+            ]
+        profiles = storage.get_profiles(identifiers, args.kind)
+        print(hotspots(args.kind, profiles, args.top, args.sort))
+    elif args.mode == "merge":
+        for filename in args.files:
+            print(
+                "Merged {} experiments from {}".format(
+                    storage.merge(filename), filename
+                )
+            )
+    elif args.mode == "worker":
+        from .work_queue import work
+
+        count = work(
+            storage,
+            [cls],
+            args.name,
+            args.lease,
+            args.poll,
+            args.wait,
+            observer=lambda _, identifier: print(
+                "Ran experiment {}".format(identifier)
+            ),
+        )
+        print("Worker stopped after running {} experiments".format(count))
+    elif args.mode == "logs":
+        from .logs import read_log
+
+        path = storage.get_experiment(cls, args.exp_id)["@log"]
+        if path and os.path.exists(path):
+            print(read_log(path), end="")
+        else:
+            print("No log stored for experiment {}.".format(args.exp_id))
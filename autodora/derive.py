@@ -0,0 +1,74 @@
+from multiprocessing.pool import Pool
+from typing import TYPE_CHECKING, List, Optional, Type
+
+if TYPE_CHECKING:
+    from .experiment import Experiment
+    from .storage import Storage
+
+
+def derived_keys(cls, names):
+    # type: (Type[Experiment], List[str]) -> List[str]
+    prototype = cls("")
+    keys = []
+    for name in names:
+        section, key = prototype.resolve(name)
+        if section != "derived":
+            raise ValueError("{} is not a derived value".format(name))
+        if not prototype.get_derived_callbacks()[key].cache:
+            raise ValueError(
+                "Derived value {} is not cached, it cannot be stored".format(name)
+            )
+        keys.append(key)
+    return keys
+
+
+def derive_chunk(args):
+    storage, cls, keys, identifiers = args
+    experiments = [
+        storage.get_experiment(cls, identifier) for identifier in identifiers
+    ]
+    for experiment in experiments:
+        for key in keys:
+            experiment.get_derived(key)
+    storage.save_derived(experiments)
+    return len(experiments)
+
+
+def derive(cls, group, names, storage, processes=None, chunk_size=100, observer=None):
+    # type: (Type[Experiment], Optional[str], List[str], Storage, Optional[int], int, Optional[callable]) -> int
+    """
+    Computes and stores the given (cached) derived values for all stored experiments of
+    the group.  Experiments that already store all values are skipped, every chunk of
+    experiments is stored on its own, so an interrupted run can simply be repeated.
+    Returns the number of updated experiments, observer is called with the number of
+    experiments updated so far and the total.
+    """
+    keys = derived_keys(cls, names)
+    with storage.snapshot():
+        identifiers = [
+            e.identifier
+            for e in storage.iter_experiments(cls, group, fields=["derived"])
+            if any(key not in e.derived for key in keys)
+        ]
+    chunks = [
+        (storage, cls, keys, identifiers[i : i + chunk_size])
+        for i in range(0, len(identifiers), chunk_size)
+    ]
+
+    done = 0
+    if processes == 1 or len(chunks) <= 1:
+        results = map(derive_chunk, chunks)
+        pool = None
+    else:
+        pool = Pool(processes=processes)
+        results = pool.imap_unordered(derive_chunk, chunks)
+    try:
+        for count in results:
+            done += count
+            if observer is not None:
+                observer(done, len(identifiers))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return done
@@ -1,15 +1,35 @@
+import bisect
+import hashlib
+import json
+import os
+import re
+import signal
+import sys
+import threading
 import time
 import traceback
+import weakref
+from array import array
 from datetime import datetime
-from typing import Union, Any, Dict, List, Optional, TYPE_CHECKING
+from typing import Union, Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 if TYPE_CHECKING:
     from storage import Storage
 
-from .trajectory import Trajectory
+from .resources import Resources
+from .settings import REPORT_FLUSH_INTERVAL
+from .trajectory import Trajectory, LazyTrajectory, Settings
 
 
 class Parameter(object):
+    # The group of an experiment that stores the values of this parameter
+    section = "parameters"
+
     def __init__(
         self, p_type, default=None, description=None, name=None, arg_name=None, key=None
     ):
@@ -24,19 +44,43 @@ class Parameter(object):
     def arg_name(self):
         return self.specific_arg_name or self.name
 
+    # Declared on an experiment class, parameters give direct access to their values:
+    # experiment.<key>
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance.__dict__[self.section][self.name]
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.section].set_value(self.name, value)
+
 
 class Result(Parameter):
-    pass
+    section = "result"
 
 
 class Config(Parameter):
-    pass
+    section = "config"
 
 
 class Group(object):
-    def __init__(self, name):
+    # Whether the parameters dictionary is shared (with the class schema) and needs to
+    # be copied before modifying it
+    shared = False
+    # Collects (group name, key) of the values that are read, while a derived value is
+    # computed
+    reads = None  # type: Optional[set]
+    # Weak reference to the method that is called with the group name and key whenever
+    # a value is changed (the experiment owns its groups, so it must not be kept alive
+    # by them)
+    listener = None  # type: Optional[weakref.WeakMethod]
+
+    def __init__(self, name, parameters=None):
         self.name = name
-        self.parameters = dict()  # type: Dict[str, Parameter]
+        self.parameters = (
+            dict() if parameters is None else parameters
+        )  # type: Dict[str, Parameter]
+        self.shared = parameters is not None
         self.values = dict()  # type: Dict[str, Any]
 
     def add_parameter(
@@ -45,6 +89,9 @@ class Group(object):
         self.add(Parameter(p_type, default, description, name, arg_name))
 
     def add(self, parameter):
+        if self.shared:
+            self.parameters = dict(self.parameters)
+            self.shared = False
         self.parameters[parameter.name] = parameter
 
     def set_values(self, **kwargs):
@@ -55,11 +102,23 @@ class Group(object):
         if name not in self.parameters:
             raise ValueError("No parameter called {name}".format(name=name))
         self.values[name] = value
+        listener = self.listener() if self.listener is not None else None
+        if listener is not None:
+            listener(self.name, name)
+
+    def load_values(self, values):
+        # type: (Dict[str, Any]) -> None
+        for name in values:
+            if name not in self.parameters:
+                raise ValueError("No parameter called {name}".format(name=name))
+        self.values = values
 
     def __setitem__(self, key, value):
         self.set_value(key, value)
 
     def __getitem__(self, item):
+        if self.reads is not None:
+            self.reads.add((self.name, item))
         return (
             self.values[item] if item in self.values else self.parameters[item].default
         )
@@ -90,10 +149,17 @@ class Group(object):
 
     def copy(self):
         group = self.__new__(self.__class__)
+        group.name = self.name
         group.parameters = dict(self.parameters)
         group.values = dict(self.values)
         return group
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state.pop("reads", None)
+        state.pop("listener", None)
+        return state
+
     def __str__(self):
         values = ", ".join(
             "{}: {}".format(key, self.values.get(key, "")) for key in self.parameters
@@ -105,10 +171,21 @@ class Derived(object):
     def __init__(self, callback, cache):
         self.callback = callback
         self.cache = cache
+        self.name = None
 
     def __call__(self, *args, **kwargs):
         return self.callback(*args, **kwargs)
 
+    def __set_name__(self, owner, name):
+        self.name = name[8:] if name.startswith("derived_") else name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        if self.name is None:
+            return self.callback(instance)
+        return instance.get_derived(self.name)
+
 
 def derived(cache=True):
     def real(func):
@@ -117,133 +194,470 @@ def derived(cache=True):
     return real
 
 
-class Experiment(object):
-    def __init__(self, group, storage=None, identifier=None):
-        # type: (str, Optional[Storage], Optional[int]) -> None
-
-        # TODO Store data separately from experiment?
-        self.derived_callbacks = dict()
-        self.storage = storage  # type: Storage
-        self.identifier = identifier
-
-        self.group = group
-
-        self.config = Group("config")
-        self.config.add_parameter(
+class Schema(object):
+    """
+    The parameters, results, configuration options and derived values declared by an
+    experiment class.
+    """
+
+    PREFIXES = {
+        "par": "parameters",
+        "parameter": "parameters",
+        "res": "result",
+        "result": "result",
+        "conf": "config",
+        "config": "config",
+        "derived": "derived",
+    }
+
+    def __init__(self, config, parameters, result, derived):
+        self.config = config  # type: Dict[str, Parameter]
+        self.parameters = parameters  # type: Dict[str, Parameter]
+        self.result = result  # type: Dict[str, Parameter]
+        self.derived = derived  # type: Dict[str, Derived]
+        self.lookup = self.build_lookup()
+
+    def build_lookup(self):
+        # type: () -> Dict[str, tuple]
+        """
+        Maps every name that Experiment.get accepts to the group and key it accesses.
+        """
+        lookup = dict()
+        # Unprefixed names are resolved in order of precedence (config, parameters,
+        # result, derived)
+        for section in ["derived", "result", "parameters", "config"]:
+            for key in getattr(self, section):
+                if key.split(".", 1)[0] not in self.PREFIXES:
+                    lookup[key] = (section, key)
+        for prefix, section in self.PREFIXES.items():
+            for key in getattr(self, section):
+                lookup["{}.{}".format(prefix, key)] = (section, key)
+        return lookup
+
+    @staticmethod
+    def base():
+        config = Group("config")
+        config.add_parameter(
             "@timeout", int, None, "The timeout value set for this experiment"
         )
-        self.config.add_parameter(
+        config.add_parameter(
             "@run.count", int, None, "The run count (for local storage)"
         )
-        self.config.add_parameter(
+        config.add_parameter(
             "@run.computer", str, None, "The computer name the run was performed on"
         )
-        self.config.add_parameter(
+        config.add_parameter(
             "@run.date", datetime, None, "The date when the run was instantiated"
         )
+        config.add_parameter(
+            "@profile",
+            str,
+            None,
+            "Profile the run: cpu (cProfile) or memory (tracemalloc)",
+        )
+        config.add_parameter(
+            "@log_size",
+            int,
+            None,
+            "Capture the output of runs via the CLI or workers in a log file next to "
+            "the storage, keeping this many bytes (the first and last half), not "
+            "captured if unset",
+        )
+        config.add_parameter(
+            "@cpus", int, None, "Cores the experiment needs (see resources)"
+        )
+        config.add_parameter(
+            "@memory", int, None, "Bytes of memory the experiment needs (see resources)"
+        )
+        config.add_parameter(
+            "@limit_memory",
+            bool,
+            None,
+            "Limit the virtual memory the run adds to the memory it needs (see "
+            "resources.memory_limit)",
+        )
 
-        self.parameters = Group("parameters")
-
-        self.result = Group("result")
-        self.result.add_parameter("@error", str, None, "Potential error messages")
-        self.result.add_parameter(
+        result = Group("result")
+        result.add_parameter("@error", str, None, "Potential error messages")
+        result.add_parameter("@log", str, None, "File containing the output of the run")
+        result.add_parameter(
+            "@out_of_memory",
+            bool,
+            None,
+            "Whether the run failed because it ran out of memory: it raised a "
+            "MemoryError or (a heuristic) its process "
+            "was killed by SIGKILL, e.g., by the OOM killer",
+        )
+        result.add_parameter(
             "@start_time", datetime, None, "When this experiment was started"
         )
-        self.result.add_parameter(
+        result.add_parameter(
             "@end_time", datetime, None, "When this experiment was started"
         )
-        self.result.add_parameter(
+        result.add_parameter(
             "@runtime",
             float,
             None,
             "How long the experiment took to execute (perf time)",
         )
-        self.result.add_parameter(
+        result.add_parameter(
             "@runtime_wall",
             float,
             None,
             "How long the experiment took to execute (wall clock time)",
         )
-        self.result.add_parameter(
+        result.add_parameter(
             "@runtime_process",
             float,
             None,
             "How long the experiment took to execute (process time)",
         )
+        result.add_parameter(
+            "@overhead.startup",
+            float,
+            None,
+            "Seconds from dispatching the experiment until its process was ready "
+            "to load it",
+        )
+        result.add_parameter(
+            "@overhead.load",
+            float,
+            None,
+            "Seconds spent loading the experiment from the storage",
+        )
+        result.add_parameter(
+            "@overhead.initial_save",
+            float,
+            None,
+            "Seconds spent saving the experiment before running it",
+        )
+        result.add_parameter(
+            "@max_rss",
+            int,
+            None,
+            "Peak resident set size in bytes during the run (of the process running "
+            "the experiment or its largest child), unknown if processes run several "
+            "experiments and the peak cannot be reset (only on Linux)",
+        )
+        result.add_parameter(
+            "@cpu_user",
+            float,
+            None,
+            "User CPU time (seconds) of the experiment and its children",
+        )
+        result.add_parameter(
+            "@cpu_sys",
+            float,
+            None,
+            "System CPU time (seconds) of the experiment and its children",
+        )
+        result.add_parameter(
+            "@io_read_bytes",
+            int,
+            None,
+            "Bytes read from storage devices by the experiment and its children",
+        )
+        result.add_parameter(
+            "@io_write_bytes",
+            int,
+            None,
+            "Bytes written to storage devices by the experiment and its children",
+        )
+        result.add_parameter(
+            "@context_switches_voluntary",
+            int,
+            None,
+            "Voluntary context switches (e.g., waiting for I/O)",
+        )
+        result.add_parameter(
+            "@context_switches_involuntary",
+            int,
+            None,
+            "Involuntary context switches (preemptions)",
+        )
+        result.add_parameter(
+            "@cached_from",
+            int,
+            None,
+            "The experiment whose cached results were copied (instead of running this "
+            "experiment)",
+        )
 
-        self.derived_callbacks["@completed"] = Derived(self.is_completed, False)
+        derived = {"@completed": Derived(lambda e: e.is_completed(), False)}
+        return Schema(config.parameters, dict(), result.parameters, derived)
 
-        self.derived = dict()
+    def extend(self, cls):
+        # type: (type) -> Schema
+        """Adds the declarations made in the body of the given class."""
+        config, parameters, result = (
+            dict(self.config),
+            dict(self.parameters),
+            dict(self.result),
+        )
+        derived = dict(self.derived)
 
-        annotations = self.__annotations__
-        for key, value in self.__class__.__dict__.items():
-            if key in annotations:
-                self.parameters.add(
-                    Parameter(annotations[key], default=value, name=key, key=key)
-                )
-            elif isinstance(value, Parameter):
+        for key, value in cls.__dict__.items():
+            if isinstance(value, Parameter):
                 value.key = key
                 if value.name is None:
                     value.name = key
                 if isinstance(value, Config):
-                    self.config.add(value)
+                    config[value.name] = value
                 elif isinstance(value, Result):
-                    self.result.add(value)
+                    result[value.name] = value
                 else:
-                    self.parameters.add(value)
-                setattr(self, key, None)
+                    parameters[value.name] = value
             elif isinstance(value, Derived):
                 if key.startswith("derived_"):
                     key = key[8:]
-                self.derived_callbacks[key] = value
+                derived[key] = value
+
+        return Schema(config, parameters, result, derived)
+
+
+# The number of experiments that started running in this process (e.g., a long-lived
+# worker)
+runs_in_process = 0
+
+
+def peak_memory():
+    # type: () -> Tuple[int, int]
+    """
+    The peak resident set size in bytes of this process and of its largest child (that
+    has terminated).
+    """
+    # Linux reports kilobytes, macOS bytes
+    rss_unit = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit
+    return own, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * rss_unit
+
+
+def reset_peak_memory():
+    # type: () -> Optional[Tuple[int, int]]
+    """
+    Resets the peak resident set size of this process (only supported on Linux), such
+    that it can be attributed to the experiment that runs next.  Returns the peak memory
+    after resetting, or None if the peak cannot be attributed because it was not reset
+    and other experiments ran in this process before.
+    """
+    global runs_in_process
+    runs_in_process += 1
+    if resource is None:
+        return None
+    try:
+        with open("/proc/self/clear_refs", "w") as ref:
+            ref.write("5")
+    except OSError:
+        if runs_in_process > 1:
+            return None
+    return peak_memory()
+
+
+def resource_usage():
+    # type: () -> Optional[Dict[str, Union[int, float]]]
+    """
+    Resources used so far by this process and its children (that have terminated), None
+    if not supported.
+    """
+    if resource is None:
+        return None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "@max_rss": max(peak_memory()),
+        "@cpu_user": own.ru_utime + children.ru_utime,
+        "@cpu_sys": own.ru_stime + children.ru_stime,
+        "@io_read_bytes": (own.ru_inblock + children.ru_inblock) * 512,
+        "@io_write_bytes": (own.ru_oublock + children.ru_oublock) * 512,
+        "@context_switches_voluntary": own.ru_nvcsw + children.ru_nvcsw,
+        "@context_switches_involuntary": own.ru_nivcsw + children.ru_nivcsw,
+    }
+
+
+def stable_repr(value):
+    # Default representations (e.g., <Solver object at 0x7f...>) differ between
+    # processes and runs
+    string = repr(value)
+    if re.search(r" at 0x[0-9a-fA-F]+", string):
+        raise ValueError(
+            "Value {} has no stable representation to fingerprint it, define "
+            "__repr__".format(string)
+        )
+    return string
 
-        for key in annotations:
-            if key not in self.__class__.__dict__:
-                self.parameters.add(
-                    Parameter(annotations[key], default=value, name=key, key=key)
-                )
-                setattr(self, key, None)
+
+def canonical_value(value):
+    # Values that compare equal (e.g., 1, 1.0 and True) are represented identically
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return sorted((repr(k), canonical_value(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [canonical_value(v) for v in value]
+    return value
+
+
+class Experiment(object):
+    _schema = Schema.base()
+    # Whether results are cached (across groups and runs) by fingerprint and code
+    # version
+    cache_results = False
+    # Cached results are only reused by experiments with the same code version, change
+    # it when run() changes
+    code_version = None  # type: Optional[str]
+    # Collects the values that are read, while a derived value is computed
+    _reads = None  # type: Optional[set]
+    # Config values that change the outcome of a run, e.g., a setting is run again with
+    # a larger timeout
+    outcome_config = ("@timeout", "@cpus", "@memory", "@limit_memory")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Annotated attributes (name: type = default) are replaced by parameters
+        for key, p_type in cls.__dict__.get("__annotations__", {}).items():
+            value = cls.__dict__.get(key)
+            if not isinstance(value, Parameter):
+                setattr(cls, key, Parameter(p_type, default=value, name=key, key=key))
+
+        schema = Schema.base()
+        for base in reversed(cls.__mro__):
+            if issubclass(base, Experiment) and base is not Experiment:
+                schema = schema.extend(base)
+        cls._schema = schema
+
+    def __init__(self, group, storage=None, identifier=None):
+        # type: (str, Optional[Storage], Optional[int]) -> None
+        schema = self._schema
+
+        # TODO Store data separately from experiment?
+        self.storage = storage  # type: Storage
+        self.identifier = identifier
+
+        self.group = group
+
+        # The parameter definitions are shared with the class schema, only the values
+        # are specific to the instance
+        self.config = Group("config", schema.config)
+        self.parameters = Group("parameters", schema.parameters)
+        self.result = Group("result", schema.result)
+        self.derived = dict()
+        # The values (section, key) that were read to compute each derived value
+        self.dependencies = dict()  # type: Dict[str, set]
+        for group in (self.config, self.parameters, self.result):
+            group.listener = weakref.WeakMethod(self.invalidate)
+
+    @property
+    def derived_callbacks(self):
+        # type: () -> Dict[str, Derived]
+        # Copied on first access, such that callbacks can be added to individual
+        # experiments
+        callbacks = self.__dict__.get("_derived_callbacks")
+        if callbacks is None:
+            callbacks = self.__dict__["_derived_callbacks"] = dict(self._schema.derived)
+        return callbacks
+
+    @derived_callbacks.setter
+    def derived_callbacks(self, callbacks):
+        self.__dict__["_derived_callbacks"] = callbacks
+
+    def get_derived_callbacks(self):
+        # type: () -> Dict[str, Derived]
+        return self.__dict__.get("_derived_callbacks", self._schema.derived)
 
     def is_completed(self):
         return self["@end_time"] is not None
 
     def get_derived(self, name):
+        if self._reads is not None:
+            self._reads.add(("derived", name))
         if name in self.derived:
             return self.derived[name]
 
-        if name in self.derived_callbacks:
+        callback = self.get_derived_callbacks().get(name)
+        if callback is not None:
+            reads = set()
+            previous = self.track(reads)
             try:
-                result = self.derived_callbacks[name](self)
-            except TypeError:
-                result = self.derived_callbacks[name]()
-
-            if self.derived_callbacks[name].cache:
+                try:
+                    result = callback(self)
+                except TypeError:
+                    result = callback()
+            finally:
+                self.track(previous)
+
+            self.dependencies[name] = reads
+            if callback.cache:
                 self.derived[name] = result
+            elif previous is not None:
+                # Uncached values are not invalidated, so values derived from them
+                # depend on what they read
+                previous.update(reads)
             return result
 
         raise ValueError(
             "There is no derived attribute with the name {name}".format(name=name)
         )
 
-    def __getattribute__(self, item):
-        r = object.__getattribute__(self, item)
-        if item in ["parameters", "derived"]:
-            return r
-
-        if isinstance(r, Derived):
-            derived = object.__getattribute__(self, "derived")
-            if item not in derived:
-                derived[item] = r.callback(self)
-            return derived[item]
-
-        try:
-            parameters = object.__getattribute__(self, "parameters")
-            if item in parameters.values:
-                return parameters.values[item]
-        except AttributeError:
-            pass
+    def track(self, reads):
+        # type: (Optional[set]) -> Optional[set]
+        """
+        Records the values read from now on in the given set (or stops recording),
+        returns the previous set.
+        """
+        previous = self._reads
+        self._reads = self.config.reads = self.parameters.reads = self.result.reads = (
+            reads
+        )
+        return previous
+
+    def invalidate(self, section, key):
+        """
+        Removes the cached derived values that (indirectly) depend on the given value.
+        """
+        if not self.derived:
+            return
+        changed = [(section, key)]
+        while changed:
+            entry = changed.pop()
+            for name in list(self.derived):
+                dependencies = self.dependencies.get(name)
+                # Derived values with unknown dependencies (e.g., stored by earlier
+                # versions) are always invalidated
+                if dependencies is None or entry in dependencies:
+                    del self.derived[name]
+                    changed.append(("derived", name))
+
+    def __getattr__(self, item):
+        # Only called for missing attributes, e.g., parameters that were added to this
+        # experiment only
+        if (
+            item not in ("config", "parameters", "result")
+            and "parameters" in self.__dict__
+        ):
+            values = self.parameters.values
+            if item in values:
+                return values[item]
+        raise AttributeError(
+            "{} object has no attribute {}".format(self.__class__.__name__, item)
+        )
 
-        return r
+    def lookup(self):
+        # type: () -> Optional[Dict[str, tuple]]
+        """
+        Returns the name lookup table of the class schema, unless this experiment has
+        its own declarations.
+        """
+        d = self.__dict__
+        if (
+            d["config"].shared
+            and d["parameters"].shared
+            and d["result"].shared
+            and "_derived_callbacks" not in d
+        ):
+            return self._schema.lookup
+        return None
 
     def __getitem__(self, item):
         return self.get(item)
@@ -251,9 +665,44 @@ class Experiment(object):
     def __setitem__(self, key, value):
         self.set(key, value)
 
+    def resolve(self, name: Union[str, Parameter]):
+        """
+        Returns the group ("config", "parameters", "result" or "derived") and key that
+        get(name) would access.
+        """
+        if isinstance(name, Parameter):
+            name = name.name
+        lookup = self.lookup()
+        if lookup is not None and name in lookup:
+            return lookup[name]
+        parts = name.split(".", 1)
+        if parts[0] == "par" or parts[0] == "parameter":
+            return "parameters", parts[1]
+        elif len(parts) > 1 and (parts[0] == "res" or parts[0] == "result"):
+            return "result", parts[1]
+        elif parts[0] == "conf" or parts[0] == "config":
+            return "config", parts[1]
+        elif parts[0] == "derived":
+            return "derived", parts[1]
+        elif name in self.config.parameters:
+            return "config", name
+        elif name in self.parameters.parameters:
+            return "parameters", name
+        elif name in self.result.parameters:
+            return "result", name
+        elif name in self.get_derived_callbacks():
+            return "derived", name
+        raise ValueError("No entry found for the name {name}".format(name=name))
+
     def get(self, name: Union[str, Parameter]):
         if isinstance(name, Parameter):
             name = name.name
+        lookup = self.lookup()
+        if lookup is not None and name in lookup:
+            section, key = lookup[name]
+            if section == "derived":
+                return self.get_derived(key)
+            return self.__dict__[section][key]
         parts = name.split(".", 1)
         if parts[0] == "par" or parts[0] == "parameter":
             return self.parameters[parts[1]]
@@ -272,22 +721,28 @@ class Experiment(object):
                 results.append(self.parameters[name])
             elif name in self.result.parameters:
                 results.append(self.result[name])
-            elif name in self.derived_callbacks:
+            elif name in self.get_derived_callbacks():
                 results.append(self.get_derived(name))
             if len(results) == 1:
                 return results[0]
             elif len(results) > 1:
                 raise ValueError(
-                    "Multiple entries found for the name {name}, please use parameter.{name}, "
-                    "result.{name}, config.{name} or derived.{name} to disambiguate".format(
-                        name=name
-                    )
+                    "Multiple entries found for the name {name}, please use "
+                    "parameter.{name}, result.{name}, config.{name} or derived.{name} "
+                    "to disambiguate".format(name=name)
                 )
         raise ValueError("No entry found for the name {name}".format(name=name))
 
     def set(self, name, value):
         if isinstance(name, Parameter):
             name = name.name
+        lookup = self.lookup()
+        if lookup is not None and name in lookup:
+            section, key = lookup[name]
+            if section != "derived":
+                self.__dict__[section].values[key] = value
+                self.invalidate(section, key)
+                return
 
         parts = name.split(".", 1)
         if parts[0] == "par" or parts[0] == "parameter":
@@ -313,14 +768,39 @@ class Experiment(object):
                 group[name] = value
             elif len(results) > 1:
                 raise ValueError(
-                    "Multiple entries found for the name {name}, please use parameter.{name}, "
-                    "result.{name}, config.{name} or derived.{name} to disambiguate".format(
-                        name=name
-                    )
+                    "Multiple entries found for the name {name}, please use "
+                    "parameter.{name}, result.{name}, config.{name} or derived.{name} "
+                    "to disambiguate".format(name=name)
                 )
             else:
                 raise ValueError("No entry found for the name {name}".format(name=name))
 
+    def fingerprint(self):
+        """
+        Experiments of the same class with equal parameter values (defaults included)
+        share their fingerprint.  Raises a ValueError for parameter values that have no
+        stable representation (see stable_repr).
+        """
+        parameters = [
+            (key, canonical_value(self.parameters[key]))
+            for key in sorted(self.parameters.parameters)
+        ]
+        string = json.dumps([self.__class__.__name__, parameters], default=stable_repr)
+        return hashlib.sha1(string.encode()).hexdigest()
+
+    def setting_fingerprint(self):
+        """
+        Identifies the setting of a run, experiments that share it are not run again
+        (unless repeated): the fingerprint and the config values that change the outcome
+        of a run (see outcome_config).
+        """
+        config = [
+            (key, canonical_value(self.config[key]))
+            for key in sorted(self.outcome_config)
+        ]
+        string = json.dumps([self.fingerprint(), config], default=stable_repr)
+        return hashlib.sha1(string.encode()).hexdigest()
+
     def candidate_result_keys(self):
         keys = [k for k in self.result.parameters if not k.startswith("@")]
         keys += [
@@ -329,26 +809,48 @@ class Experiment(object):
         return keys
 
     def run_wrapped(self, auto_save=True):
+        start_usage = start_peak = None
         try:
             self.result["@start_time"] = datetime.now()
+            # Running can assign parameters, so the fingerprints are fixed beforehand
+            # (and kept when the experiment is saved)
+            self._run_fingerprint = self._run_setting = None
+            try:
+                self._run_fingerprint = self.fingerprint()
+                self._run_setting = self.setting_fingerprint()
+            except ValueError:
+                # Caching and checkpoints report the error themselves
+                pass
             if auto_save:
+                start_save = time.perf_counter()
                 self.save()
+                self.result["@overhead.initial_save"] = time.perf_counter() - start_save
+            fingerprint, cached = self.get_cached_result()
+            unset = [
+                k for k in self.parameters.parameters if k not in self.parameters.values
+            ]
+            # The hooks are also called for cached results, e.g., to acquire and release
+            # resources
             self.before_run()
             start = time.perf_counter()
             start_process = time.process_time()
             start_wall = time.time()
-            computed_result = self.run()
-            if computed_result is not None:
-                try:
-                    for k, v in computed_result.items():
-                        self.set(k, v)
-                except AttributeError:
-                    keys = self.candidate_result_keys()
+            start_peak = reset_peak_memory()
+            start_usage = resource_usage()
+            self._report_start = start
+            if cached is None:
+                computed_result = self.run_profiled()
+                if computed_result is not None:
                     try:
-                        for k, v in zip(keys, computed_result):
+                        for k, v in computed_result.items():
                             self.set(k, v)
-                    except TypeError:
-                        self.set(keys[0], computed_result)
+                    except AttributeError:
+                        keys = self.candidate_result_keys()
+                        try:
+                            for k, v in zip(keys, computed_result):
+                                self.set(k, v)
+                        except TypeError:
+                            self.set(keys[0], computed_result)
 
             runtime = time.perf_counter() - start
             runtime_process = time.process_time() - start_process
@@ -357,15 +859,291 @@ class Experiment(object):
             self.result["@runtime"] = runtime
             self.result["@runtime_process"] = runtime_process
             self.result["@runtime_wall"] = runtime_wall
+            self.record_usage(start_usage, start_peak)
+            if cached is not None:
+                self.load_cached_result(*cached)
             self.after_run()
+            if cached is None and fingerprint is not None:
+                self.cache_result(fingerprint, unset)
+            if self.__dict__.get("_checkpointed"):
+                self.storage.remove_checkpoint(
+                    self.group, self._run_fingerprint, str(self.code_version)
+                )
             if auto_save and self.storage:
                 self.save()
             return self
-        except Exception:
+        except Exception as e:
             self.result["@error"] = "ERROR\n" + traceback.format_exc()
+            # Failed runs (e.g., out of memory) are often the ones whose resource usage
+            # is of interest
+            self.record_usage(start_usage, start_peak)
+            if isinstance(e, MemoryError):
+                self.result["@out_of_memory"] = True
             if auto_save and self.storage:
                 self.save()
             raise
+        finally:
+            self.end_reports()
+
+    def record_usage(self, start_usage, start_peak):
+        # type: (Optional[Dict[str, float]], Optional[Tuple[int, int]]) -> None
+        """
+        Records the resources used since start_usage was measured (nothing if resource
+        usage is not supported).
+        """
+        if start_usage is not None:
+            for key, value in resource_usage().items():
+                if key != "@max_rss":
+                    self.result[key] = value - start_usage[key]
+        if start_peak is not None:
+            own, children = peak_memory()
+            # The peak of children is never reset, it belongs to this run only if a
+            # child of this run exceeded it
+            self.result["@max_rss"] = (
+                max(own, children) if children > start_peak[1] else own
+            )
+
+    def run_profiled(self):
+        kind = self.config["@profile"]
+        if not kind:
+            return self.run()
+        from .profiling import Profiler
+
+        self._profiler = Profiler(kind)
+        # The profile of a run that is terminated (e.g., on timeout) is stored by the
+        # termination handler
+        self.flush_on_termination()
+        self._profiler.start()
+        try:
+            return self.run()
+        finally:
+            self.save_profile()
+
+    def save_profile(self):
+        profiler = self.__dict__.get("_profiler")
+        if profiler is None:
+            return
+        self._flushing = True
+        try:
+            data = profiler.stop()
+            if self.storage is not None and self.identifier is not None:
+                self.storage.save_profile(self.identifier, profiler.kind, data)
+        finally:
+            del self._profiler
+            self._flushing = False
+        self.deferred_termination()
+
+    def get_cached_result(self):
+        """
+        Returns the fingerprint (None if caching is disabled) and the cached results for
+        this experiment.
+        """
+        if not self.cache_results or self.storage is None:
+            return None, None
+        fingerprint = self.run_fingerprint()
+        return fingerprint, self.storage.get_cached_result(
+            fingerprint, str(self.code_version)
+        )
+
+    def report(self, name, value):
+        """
+        Records an intermediate value while running (e.g., the quality of the best
+        solution found so far).  Samples are stored with the time since the run started
+        and written to the storage periodically, when the run ends and when it is
+        terminated (e.g., on timeout), see get_trace.
+        """
+        now = time.perf_counter()
+        d = self.__dict__
+        traces = d.get("_traces")
+        if traces is None:
+            traces = d["_traces"] = dict()
+            d.setdefault("_report_start", now)
+            d["_last_flush"] = now
+            self.flush_on_termination()
+        if name not in traces:
+            traces[name] = (array("d"), array("d"))
+        times, values = traces[name]
+        times.append(now - d["_report_start"])
+        values.append(value)
+        if now - d["_last_flush"] > REPORT_FLUSH_INTERVAL or "_termination" in d:
+            self.flush_reports()
+
+    def flush_reports(self):
+        traces = self.__dict__.get("_traces")
+        if traces and self.storage is not None and self.identifier is not None:
+            self._traces = dict()
+            self._last_flush = time.perf_counter()
+            self._stored_traces = None
+            self._flushing = True
+            try:
+                self.storage.save_traces(self.identifier, traces)
+            finally:
+                self._flushing = False
+        self.deferred_termination()
+
+    def flush_on_termination(self):
+        # Timeouts terminate the process running the experiment (SIGTERM), only possible
+        # from the main thread (and without storage there is nothing to flush)
+        if (
+            threading.current_thread() is not threading.main_thread()
+            or "_previous_handler" in self.__dict__
+            or self.storage is None
+        ):
+            return
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def terminate(signum, frame):
+            self._termination = signum
+            # Writes to the storage cannot be interrupted safely, the process is
+            # terminated once they are done
+            if not self.__dict__.get("_flushing"):
+                self.deferred_termination()
+
+        signal.signal(signal.SIGTERM, terminate)
+        self._previous_handler = previous
+
+    def deferred_termination(self):
+        # Flushes the reported values (and the profile) and terminates the process, if
+        # it received SIGTERM (outside of transactions)
+        if "_termination" not in self.__dict__ or (
+            self.storage is not None and self.storage.in_transaction()
+        ):
+            return
+        signum = self.__dict__.pop("_termination")
+        try:
+            self.flush_reports()
+            self.save_profile()
+        finally:
+            signal.signal(
+                signal.SIGTERM,
+                self.__dict__.pop("_previous_handler", None) or signal.SIG_DFL,
+            )
+            os.kill(os.getpid(), signum)
+
+    def end_reports(self):
+        d = self.__dict__
+        self.flush_reports()
+        if "_previous_handler" in d:
+            signal.signal(signal.SIGTERM, d.pop("_previous_handler") or signal.SIG_DFL)
+        d.pop("_traces", None)
+        d.pop("_report_start", None)
+
+    def get_trace(self, name):
+        # type: (str) -> Tuple[array, array]
+        """
+        Returns the times (seconds since the start of the run) and values reported for
+        the given name.
+        """
+        times, values = array("d"), array("d")
+        if self.storage is not None and self.identifier is not None:
+            # Stored traces are loaded once (and again after reported values were
+            # flushed)
+            stored = self.__dict__.get("_stored_traces")
+            if stored is None:
+                stored = self._stored_traces = self.storage.get_traces(self.identifier)
+            if name in stored:
+                times, values = stored[name]
+        buffered = (self.__dict__.get("_traces") or {}).get(name)
+        if buffered is not None:
+            times, values = times + buffered[0], values + buffered[1]
+        return times, values
+
+    def get_trace_value(self, name, t):
+        """
+        Returns the last value reported for the given name at (or before) time t, or
+        None.
+        """
+        times, values = self.get_trace(name)
+        index = bisect.bisect_right(times, t)
+        return values[index - 1] if index > 0 else None
+
+    def run_fingerprint(self):
+        """
+        The fingerprint of this experiment before it ran (fixed by run_wrapped or as
+        stored), running can assign parameters.
+        """
+        return self.__dict__.get("_run_fingerprint") or self.fingerprint()
+
+    def run_setting(self):
+        """The setting fingerprint before the run, see run_fingerprint."""
+        return self.__dict__.get("_run_setting") or self.setting_fingerprint()
+
+    def checkpoint(self, state):
+        """
+        Stores the given state of this run (e.g., a partial result), the latest
+        checkpoint can be restored when the experiment is run again in the same group
+        (e.g., with a larger timeout after having timed out).  Only available with a
+        storage.
+        """
+        if self.storage is not None:
+            self._checkpointed = True
+            self.storage.save_checkpoint(
+                self.group,
+                self.run_fingerprint(),
+                str(self.code_version),
+                self.identifier,
+                state,
+            )
+            self.deferred_termination()
+
+    def restore(self):
+        """
+        Returns the state of the latest checkpoint of an earlier run of this experiment,
+        or None.
+        """
+        if self.storage is None:
+            return None
+        state = self.storage.load_checkpoint(
+            self.group, self.run_fingerprint(), str(self.code_version)
+        )
+        if state is not None:
+            self._checkpointed = True
+        return state
+
+    def cache_result(self, fingerprint, unset):
+        # Results and the parameters that were set by the run (fingerprint is computed
+        # before running)
+        values = {
+            "parameters": {
+                k: v for k, v in self.parameters.values.items() if k in unset
+            },
+            "result": {
+                k: v for k, v in self.result.values.items() if not k.startswith("@")
+            },
+            "runtimes": {
+                k: self.result[k]
+                for k in ("@runtime", "@runtime_process", "@runtime_wall")
+            },
+        }
+        self.storage.cache_result(
+            fingerprint, str(self.code_version), self.identifier, values
+        )
+
+    def load_cached_result(self, source, values):
+        for section in ("parameters", "result"):
+            group = getattr(self, section)
+            for key, value in values[section].items():
+                if key in group.parameters:
+                    group[key] = value
+        # Cache hits take the runtimes of their source (unknown for results cached by
+        # earlier versions), such that they do not distort runtime statistics and
+        # predictions
+        for key in ("@runtime", "@runtime_process", "@runtime_wall"):
+            self.result[key] = values.get("runtimes", {}).get(key)
+        self.result["@cached_from"] = source
+
+    def resources(self):
+        # type: () -> Optional[Resources]
+        """
+        The cores and bytes of memory this experiment needs, used by runners to pack
+        experiments onto the machine.  By default these are the @cpus and @memory
+        settings (None if neither is set), subclasses can compute them from their
+        parameters instead.
+        """
+        cpus, memory = self.config["@cpus"], self.config["@memory"]
+        if cpus is None and memory is None:
+            return None
+        return Resources(cpus or 1, memory or 0)
 
     def before_run(self):
         pass
@@ -432,6 +1210,12 @@ class Experiment(object):
         trajectory.explore(cls, settings)
         return trajectory
 
+    @classmethod
+    def explore_lazy(
+        cls, name: str, settings: Union[Settings, List[Dict[str, Any]], Dict[str, List]]
+    ):
+        return LazyTrajectory(name, cls, settings)
+
     @classmethod
     def enable_cli(cls, cmd=None):
         if cls.__module__ == "__main__":
@@ -457,15 +1241,28 @@ class Experiment(object):
             "group": self.group,
             "identifier": self.identifier,
             "storage": self.storage,
-            "config": self.config,
-            "parameters": self.parameters,
-            "result": self.result,
+            "config": self.config.values,
+            "parameters": self.parameters.values,
+            "result": self.result.values,
             "derived": self.derived,
+            "dependencies": self.dependencies,
+            "run_fingerprints": (
+                self.__dict__.get("_run_fingerprint"),
+                self.__dict__.get("_run_setting"),
+            ),
         }
 
     def __setstate__(self, state):
         self.__init__(state["group"], state["storage"], state["identifier"])
-        self.config = state["config"]
-        self.parameters = state["parameters"]
-        self.result = state["result"]
+        for name in ["config", "parameters", "result"]:
+            if isinstance(state[name], Group):
+                # Experiments pickled by earlier versions contain the complete groups
+                setattr(self, name, state[name])
+                state[name].listener = weakref.WeakMethod(self.invalidate)
+            else:
+                getattr(self, name).values = state[name]
         self.derived = state["derived"]
+        self.dependencies = state.get("dependencies", {})
+        fingerprint, setting = state.get("run_fingerprints", (None, None))
+        if fingerprint is not None:
+            self._run_fingerprint, self._run_setting = fingerprint, setting
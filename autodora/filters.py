@@ -0,0 +1,191 @@
+import collections.abc
+from typing import List, Optional, Union, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .experiment import Experiment
+
+
+OPERATORS = ["<=", ">=", "<", ">", "!=", "="]
+ORDER_OPERATORS = ["<=", ">=", "<", ">"]
+# Properties that are not looked up in the experiment (see get_property)
+SPECIAL_PROPERTIES = ["id", "*", "group", "completed"]
+
+
+class Filter(object):
+    def __init__(self, name, operator=None, value=None, negated=False):
+        # type: (str, Optional[str], Union[float, str, None], bool) -> None
+        self.name = name
+        self.operator = operator
+        self.value = value
+        self.negated = negated
+
+    def holds(self, experiment):
+        value = get_property(0, experiment, self.name)
+        if self.operator is None:
+            result = bool(value)
+        elif self.operator == "<=":
+            result = value <= self.value
+        elif self.operator == ">=":
+            result = value >= self.value
+        elif self.operator == "<":
+            result = value < self.value
+        elif self.operator == ">":
+            result = value > self.value
+        elif self.operator == "!=":
+            result = value != self.value
+        else:
+            result = value == self.value
+        return not result if self.negated else result
+
+    def __repr__(self):
+        return "{}{}{}{}".format(
+            "~" if self.negated else "",
+            self.name,
+            self.operator or "",
+            "" if self.operator is None else self.value,
+        )
+
+
+def parse_value(string, operator):
+    if operator in ORDER_OPERATORS:
+        return float(string)
+    if string == "None":
+        return None
+    try:
+        return float(string)
+    except ValueError:
+        return string
+
+
+def parse_filter(filter_string):
+    # type: (str) -> Filter
+    negated = False
+    while filter_string.startswith("~"):
+        negated = not negated
+        filter_string = filter_string[1:]
+
+    for operator in OPERATORS:
+        if operator in filter_string:
+            parts = filter_string.split(operator, 2)
+            return Filter(parts[0], operator, parse_value(parts[1], operator), negated)
+    return Filter(filter_string, negated=negated)
+
+
+def mean(iterable):
+    if any(e is None for e in iterable):
+        return None
+    return sum(iterable) / len(iterable)
+
+
+def trace_time(operator):
+    # type: (str) -> Optional[float]
+    # The operator at<t> (e.g., quality__at10) selects the value reported for a trace at
+    # time t
+    if operator.startswith("at"):
+        try:
+            return float(operator[2:])
+        except ValueError:
+            pass
+    return None
+
+
+def get_property(index: int, experiment: "Experiment", property_name: str):
+    parts = property_name.split("__")
+    if len(parts) > 1:
+        operator = parts[-1]
+        remaining = "__".join(parts[:-1])
+        if operator == "mean":
+            return mean(get_property(index, experiment, remaining))
+        if operator == "len":
+            return len(get_property(index, experiment, remaining))
+        if operator == "sum":
+            return sum(get_property(index, experiment, remaining))
+        if operator == "max":
+            return max(get_property(index, experiment, remaining))
+        if operator == "min":
+            return min(get_property(index, experiment, remaining))
+        if operator == "test":
+            return 1 if is_excluded_from_string(remaining, experiment) else 0
+        if trace_time(operator) is not None:
+            return experiment.get_trace_value(remaining, trace_time(operator))
+        if operator.startswith("batch"):
+            bin_size = float(operator[5:])
+            return (
+                int(get_property(index, experiment, remaining) / bin_size) * bin_size
+                - bin_size / 2
+            )
+        else:
+            try:
+                index = int(operator)
+                return get_property(index, experiment, remaining)[index]
+            except ValueError:
+                pass
+
+    if property_name == "id":
+        return index
+
+    if property_name == "*":
+        return "all"
+
+    if property_name == "group":
+        return experiment.group
+
+    if property_name == "completed":
+        return experiment.completed
+
+    try:
+        return experiment.get(property_name)
+    except ValueError:
+        pass
+
+    if "." in property_name:
+        parts = property_name.split(".")
+        return getattr(get_property(index, experiment, ".".join(parts[:-1])), parts[-1])
+
+    properties = (
+        ["id", "*"]
+        + sorted(
+            map(lambda s: "config.{s}".format(s=s), experiment.config.parameters.keys())
+        )
+        + sorted(
+            map(
+                lambda s: "parameter.{s}".format(s=s),
+                experiment.parameters.parameters.keys(),
+            )
+        )
+        + sorted(
+            map(lambda s: "result.{s}".format(s=s), experiment.result.parameters.keys())
+        )
+        + sorted(
+            map(
+                lambda s: "derived.{s}".format(s=s), experiment.derived_callbacks.keys()
+            )
+        )
+    )
+
+    raise ValueError(
+        "Could not find property: {}, choose a valid property ({}) or a filter".format(
+            property_name, properties
+        )
+    )
+
+
+def is_excluded_from_string(filter_string, experiment):
+    return parse_filter(filter_string).holds(experiment)
+
+
+def is_excluded(experiment: "Experiment", exclude: Optional[List]):
+    if exclude is None:
+        exclude = []
+
+    if isinstance(exclude, str) or not isinstance(exclude, collections.abc.Iterable):
+        exclude = [exclude]
+
+    for f in exclude:
+        if callable(f):
+            if f(experiment):
+                return True
+        else:
+            if is_excluded_from_string(str(f), experiment):
+                return True
+    return False
@@ -0,0 +1,117 @@
+import os
+import signal
+import sys
+import threading
+from contextlib import contextmanager
+
+
+class BoundedLog(object):
+    """
+    Writes output to a file as it arrives, keeping only its first and last max_bytes / 2
+    bytes.
+    """
+
+    def __init__(self, path, max_bytes):
+        # type: (str, int) -> None
+        self.file = open(path, "wb")
+        self.head_size = max_bytes // 2
+        self.tail_size = max_bytes - self.head_size
+        self.written = 0
+        self.tail = bytearray()
+        self.omitted = 0
+        self.lock = threading.Lock()
+
+    def write(self, data):
+        # type: (bytes) -> None
+        with self.lock:
+            if self.file.closed:
+                return
+            if self.written < self.head_size:
+                head = data[: self.head_size - self.written]
+                self.file.write(head)
+                self.file.flush()
+                self.written += len(head)
+                data = data[len(head) :]
+            if data:
+                self.tail += data
+                excess = len(self.tail) - self.tail_size
+                if excess > 0:
+                    del self.tail[:excess]
+                    self.omitted += excess
+
+    def consume(self, fd):
+        # type: (int) -> None
+        with os.fdopen(fd, "rb", buffering=0) as ref:
+            while True:
+                data = ref.read(65536)
+                if not data:
+                    return
+                self.write(data)
+
+    def close(self):
+        with self.lock:
+            if self.file.closed:
+                return
+            if self.omitted:
+                self.file.write(
+                    "\n[... {} bytes omitted ...]\n".format(self.omitted).encode()
+                )
+            self.file.write(self.tail)
+            self.file.close()
+
+
+@contextmanager
+def capture_output(path, max_bytes):
+    # type: (str, int) -> BoundedLog
+    """
+    Redirects the output (stdout and stderr, at file descriptor level, so including the
+    output of child processes) to a bounded log file.  The log is also completed if the
+    process is terminated (SIGTERM), e.g., because of a timeout.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    log = BoundedLog(path, max_bytes)
+    sys.stdout.flush()
+    sys.stderr.flush()
+    read_fd, write_fd = os.pipe()
+    saved = os.dup(1), os.dup(2)
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    os.close(write_fd)
+    reader = threading.Thread(target=log.consume, args=(read_fd,), daemon=True)
+    reader.start()
+
+    def restore():
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+        # Processes started in the background might keep the pipe open
+        reader.join(1)
+        log.close()
+
+    main_thread = threading.current_thread() is threading.main_thread()
+    if main_thread:
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def terminate(signum, frame):
+            restore()
+            signal.signal(signal.SIGTERM, previous or signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+        signal.signal(signal.SIGTERM, terminate)
+    try:
+        yield log
+    finally:
+        if main_thread:
+            signal.signal(signal.SIGTERM, previous or signal.SIG_DFL)
+        restore()
+        os.close(saved[0])
+        os.close(saved[1])
+
+
+def read_log(path):
+    # type: (str) -> str
+    with open(path, "rb") as ref:
+        return ref.read().decode(errors="replace")
@@ -1,5 +1,6 @@
 from datetime import datetime
 from typing import TYPE_CHECKING
+
 if TYPE_CHECKING:
     from .experiment import Experiment
 
@@ -19,6 +20,7 @@ def dispatch(func):
     def modified(self, *args, **kwargs):
         for observer in self.observers:
             getattr(observer, func.__name__)(*args, **kwargs)
+
     return modified
 
 
@@ -52,10 +54,13 @@ class ProgressObserver(Observer):
         # type: (int, Experiment) -> None
         raise NotImplementedError()
 
+    def experiment_out_of_memory(self, index, experiment):
+        # type: (int, Experiment) -> None
+        # Runs that exhausted their memory are failures, unless observers distinguish
+        # them
+        self.experiment_failed(index, experiment)
+
     @dispatch
     def run_finished(self, platform, name, run_count, run_date):
         # type: (str, str, int, datetime) -> None
         raise NotImplementedError()
-
-
-
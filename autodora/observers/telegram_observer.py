@@ -1,6 +1,5 @@
 import os
 
-
 try:
     from telegram.ext import Updater
     from telegram import ParseMode
@@ -15,13 +14,18 @@ class TelegramObserver(ProgressObserver):
     def __init__(self):
         super().__init__()
         if Updater is None:
-            raise RuntimeError("The TelegramObserver requires additional packages, please install them"
-                               "(e.g. pip install autodora[telegram]).")
+            raise RuntimeError(
+                "The TelegramObserver requires additional packages, please install them"
+                "(e.g. pip install autodora[telegram])."
+            )
         try:
             self.updater = Updater(os.environ["TELEGRAM_BOT_TOKEN"])
             self.chat_id = os.environ["TELEGRAM_CHAT_ID"]
         except KeyError:
-            raise RuntimeError("Please provide environment variables TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID")
+            raise RuntimeError(
+                "Please provide environment variables TELEGRAM_BOT_TOKEN and "
+                "TELEGRAM_CHAT_ID"
+            )
         self.message_id = None
         self.total = None
         self.timed_out = 0
@@ -32,11 +36,19 @@ class TelegramObserver(ProgressObserver):
         self.run_platform = None
 
     def send_message(self, done=False):
-        template = "*{run} ({start})*\n_{platform}_\n{done} succeeded," \
-                   " {timed_out} timed out, {failed} failed{messages}"
+        template = (
+            "*{run} ({start})*\n_{platform}_\n{done} succeeded,"
+            " {timed_out} timed out, {failed} failed{messages}"
+        )
         total_done = self.done + self.timed_out + self.errors
         message = template.format(
-            start="{total_done} of {total}".format(total_done=total_done, total=self.total) if not done else "done",
+            start=(
+                "{total_done} of {total}".format(
+                    total_done=total_done, total=self.total
+                )
+                if not done
+                else "done"
+            ),
             run=self.run_id,
             done=self.done,
             timed_out=self.timed_out,
@@ -46,12 +58,17 @@ class TelegramObserver(ProgressObserver):
             platform=self.run_platform,
         )
         if self.message_id is None:
-            self.message_id = self.updater.bot.send_message(chat_id=self.chat_id, text=message,
-                                                            parse_mode=ParseMode.MARKDOWN).message_id
+            self.message_id = self.updater.bot.send_message(
+                chat_id=self.chat_id, text=message, parse_mode=ParseMode.MARKDOWN
+            ).message_id
         else:
             print(message, type(message))
-            self.updater.bot.edit_message_text(chat_id=self.chat_id, text=message, message_id=self.message_id,
-                                               parse_mode=ParseMode.MARKDOWN)
+            self.updater.bot.edit_message_text(
+                chat_id=self.chat_id,
+                text=message,
+                message_id=self.message_id,
+                parse_mode=ParseMode.MARKDOWN,
+            )
 
     def run_started(self, platform, name, run_count, run_date, experiment_count):
         self.total = experiment_count
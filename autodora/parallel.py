@@ -1,19 +1,26 @@
+import asyncio
 import atexit
 import errno
+import itertools
 import multiprocessing
+import multiprocessing.connection
 import os
 import signal
 import subprocess
+import threading
+import time
 import traceback
 from multiprocessing import Queue, Manager, Process
 from multiprocessing.pool import Pool
 from subprocess import TimeoutExpired
 from traceback import print_exc
-from typing import Optional, Union, Any
+from typing import Optional, Union, Any, List, Dict
 
 from temporary import temp_file
 
 from .observe import Observer, dispatch
+from .resources import Resources, Scheduler, machine_resources
+from .settings import DISPATCH_TIME_VARIABLE
 
 
 class Update:
@@ -22,12 +29,17 @@ class Update:
     DONE = "done"
     TIMEOUT = "timeout"
     FAILED = "failed"
+    OUT_OF_MEMORY = "out_of_memory"
 
-    def __init__(self, status, index, command, meta):
+    def __init__(self, status, index, command, meta, exit_code=None):
         self.status = status
         self.index = index
         self.command = command
         self.meta = meta
+        self.time = time.time()
+        # Exit code of the process that failed running the task (if known, negative if
+        # it was killed by a signal)
+        self.exit_code = exit_code
 
 
 class ParallelObserver(Observer):
@@ -61,6 +73,7 @@ def observe(observer, queue, count=None):
                 update.status == Update.DONE
                 or update.status == Update.TIMEOUT
                 or update.status == Update.FAILED
+                or update.status == Update.OUT_OF_MEMORY
             ):
                 if to_see:
                     to_see.remove(update.index)
@@ -73,11 +86,11 @@ def observe(observer, queue, count=None):
 
 
 def run_command(command, timeout=None):
-    return worker((-1, None, command, timeout, None, None))
+    return worker((-1, None, command, timeout, None, None, True))
 
 
 def run_function(f, *args, timeout=None, **kwargs):
-    worker((-1, None, (f, args, kwargs), timeout, None, None))
+    worker((-1, None, (f, args, kwargs), timeout, None, None, False))
 
 
 def worker(args):
@@ -88,8 +101,12 @@ def worker(args):
         timeout,
         queue,
         m_queue,
-    ) = args  # type: (int, Any, Any, int, Queue, Queue)
-    # TODO Capture output?
+        capture,
+    ) = args  # type: (int, Any, Any, int, Queue, Queue, bool)
+    # Only output of commands run with run_command is captured (in memory), experiments
+    # log their own output
+    os.environ[DISPATCH_TIME_VARIABLE] = repr(time.time())
+    output = subprocess.PIPE if capture else subprocess.DEVNULL
 
     try:
         if isinstance(command, str):
@@ -106,8 +123,8 @@ def worker(args):
             with subprocess.Popen(
                 command,
                 shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stdout=output,
+                stderr=output,
                 start_new_session=True,
             ) as process:
                 try:
@@ -120,8 +137,14 @@ def worker(args):
                         if process.returncode == 0:
                             queue.put(Update(Update.DONE, i, command, meta))
                         else:
-                            queue.put(Update(Update.FAILED, i, command, meta))
-                    return out.decode(), err.decode()
+                            queue.put(
+                                Update(
+                                    Update.FAILED, i, command, meta, process.returncode
+                                )
+                            )
+                    if capture:
+                        return out.decode(), err.decode()
+                    return None
                 except TimeoutExpired:
                     try:
                         os.killpg(
@@ -164,9 +187,11 @@ def worker(args):
                 if queue:
                     queue.put(Update(Update.TIMEOUT, i, command, meta))
 
-            else:
-                if queue:
+            elif queue:
+                if p.exitcode == 0:
                     queue.put(Update(Update.DONE, i, command, meta))
+                else:
+                    queue.put(Update(Update.FAILED, i, command, meta, p.exitcode))
     except Exception:
         with open("log.txt", "w") as f:
             print(traceback.format_exc(), file=f)
@@ -177,7 +202,12 @@ def status(s):
     print("\033[1m{0}\033[0m".format(s))
 
 
-def run_commands(commands, processes=None, timeout=None, meta=None, observer=None):
+def run_commands(
+    commands, processes=None, timeout=None, meta=None, observer=None, timeouts=None
+):
+    # Commands (and meta) can be generated lazily, they are only consumed when a worker
+    # is (almost) available, timeouts optionally provides a timeout per command
+    # (replacing timeout)
     pool = Pool(processes=processes)
     manager, queue, m = None, None, None
     manager = Manager()
@@ -185,15 +215,16 @@ def run_commands(commands, processes=None, timeout=None, meta=None, observer=Non
     if observer:
         queue = manager.Queue()
 
-    if meta:
-        commands = [
-            (i, meta, command, timeout, queue, m)
-            for i, (command, meta) in enumerate(zip(commands, meta))
-        ]
-    else:
-        commands = [
-            (i, meta, command, timeout, queue, m) for i, command in enumerate(commands)
-        ]
+    if meta is None:
+        meta = itertools.repeat(None)
+    if timeouts is None:
+        timeouts = itertools.repeat(timeout)
+    commands = (
+        (i, command_meta, command, command_timeout, queue, m, False)
+        for i, (command, command_meta, command_timeout) in enumerate(
+            zip(commands, meta, timeouts)
+        )
+    )
 
     with temp_file() as f:
         filename = str(f)
@@ -246,13 +277,342 @@ def run_commands(commands, processes=None, timeout=None, meta=None, observer=Non
 
         status("Completely shut down")
 
-    r = pool.map_async(worker, commands)
+    capacity = 2 * (processes or os.cpu_count() or 1)
+    slots = threading.Semaphore(capacity)
+    errors = []
+
+    def release(_):
+        slots.release()
+
+    def submit():
+        try:
+            for command in commands:
+                slots.acquire()
+                pool.apply_async(
+                    worker, (command,), callback=release, error_callback=release
+                )
+            for _ in range(capacity):
+                slots.acquire()
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            if queue:
+                queue.put(Update.SENTINEL)
+
     atexit.register(clean_exit)
 
     if observer:
-        observe(observer, queue, len(commands))
-
-    r.wait()
+        feeder = threading.Thread(target=submit, daemon=True)
+        feeder.start()
+        observe(observer, queue)
+        feeder.join()
+    else:
+        submit()
     status("### DONE ##")
     m.put(Update.SENTINEL)
     m_process.join()
+    if errors:
+        raise errors[0]
+
+
+def warm_worker(connection):
+    # Runs tasks in-process until it receives None, in a process group of its own such
+    # that timeouts also kill the processes started by a task
+    os.setpgrp()
+    while True:
+        try:
+            task = connection.recv()
+        except EOFError:
+            # The process that dispatched the tasks has died
+            return
+        if task is None:
+            return
+        i, (f, args) = task
+        os.environ[DISPATCH_TIME_VARIABLE] = repr(time.time())
+        try:
+            f(*args)
+            result = Update.DONE
+        except Exception:
+            print_exc()
+            result = Update.FAILED
+        connection.send((i, result))
+
+
+class WarmWorker(object):
+    """
+    A long-lived worker process that runs tasks (function-args pairs) one after the
+    other.
+    """
+
+    def __init__(self):
+        self.connection, child = multiprocessing.Pipe()
+        # Not a daemon, such that tasks can start processes themselves (e.g., a
+        # multiprocessing pool), workers are stopped explicitly instead
+        self.process = Process(target=warm_worker, args=(child,))
+        self.process.start()
+        child.close()
+        self.tasks = 0
+        self.task = None  # type: Optional[tuple]
+        self.deadline = None  # type: Optional[float]
+
+    def submit(self, i, task, meta, timeout):
+        self.connection.send((i, task))
+        self.task = (i, task, meta)
+        self.deadline = None if timeout is None else time.time() + timeout
+
+    def finish(self):
+        task, self.task, self.deadline = self.task, None, None
+        self.tasks += 1
+        return task
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.kill()
+
+    def kill(self, grace=1):
+        for s in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(self.process.pid, s)
+            except OSError as e:
+                if e.errno != errno.ESRCH:
+                    raise
+                # The worker has not created its process group yet
+                if self.process.is_alive():
+                    os.kill(self.process.pid, s)
+            self.process.join(grace)
+            if not self.process.is_alive():
+                break
+        self.connection.close()
+
+
+def run_warm(
+    tasks,
+    processes=None,
+    timeout=None,
+    meta=None,
+    observer=None,
+    max_tasks=None,
+    requirements=None,
+    capacity=None,
+):
+    # type: (Any, Optional[int], Optional[float], Any, Optional[ParallelObserver], Optional[int], Any, Optional[Resources]) -> None
+    """
+    Runs tasks (function-args pairs) in a pool of long-lived worker processes, which
+    avoids starting processes per task. Workers that exceed the timeout are killed (with
+    all processes they started) and replaced, workers are also replaced after running
+    max_tasks tasks.  Tasks (and meta) can be generated lazily.  Tasks are packed
+    according to their requirements (see Scheduler) against the capacity (default: the
+    resources of this machine).
+    """
+    if meta is None:
+        meta = itertools.repeat(None)
+    if requirements is None:
+        requirements = itertools.repeat(None)
+    workers = [WarmWorker() for _ in range(processes or os.cpu_count() or 1)]
+    scheduler = Scheduler(
+        zip(enumerate(zip(tasks, meta)), requirements),
+        capacity or machine_resources(),
+        len(workers),
+    )
+    needs = dict()  # type: Dict[int, Resources]
+    idle, busy = (
+        list(workers),
+        dict(),
+    )  # type: (List[WarmWorker], Dict[Any, WarmWorker])
+
+    def notify(status, i, task, task_meta, exit_code=None):
+        if status != Update.STARTED:
+            scheduler.release(needs.pop(i))
+        if observer:
+            try:
+                observer.observe(Update(status, i, task, task_meta, exit_code))
+            except Exception:
+                print_exc()
+
+    def replace(worker):
+        workers.remove(worker)
+        workers.append(WarmWorker())
+        return workers[-1]
+
+    try:
+        while True:
+            for (i, (task, task_meta)), need in scheduler.ready():
+                worker = idle.pop()
+                worker.submit(i, task, task_meta, timeout)
+                busy[worker.connection] = worker
+                needs[i] = need
+                notify(Update.STARTED, i, task, task_meta)
+            if not busy:
+                return
+
+            deadlines = [w.deadline for w in busy.values() if w.deadline is not None]
+            wait = None if not deadlines else max(min(deadlines) - time.time(), 0)
+            for connection in multiprocessing.connection.wait(list(busy), wait):
+                worker = busy.pop(connection)
+                try:
+                    _, status = connection.recv()
+                except (EOFError, OSError):
+                    # The worker died, e.g., because the experiment exhausted the memory
+                    worker.kill()
+                    notify(
+                        Update.FAILED,
+                        *worker.finish(),
+                        exit_code=worker.process.exitcode
+                    )
+                    idle.append(replace(worker))
+                    continue
+                notify(status, *worker.finish())
+                if max_tasks is not None and worker.tasks >= max_tasks:
+                    worker.stop()
+                    worker = replace(worker)
+                idle.append(worker)
+
+            now = time.time()
+            for connection, worker in list(busy.items()):
+                if worker.deadline is not None and worker.deadline <= now:
+                    del busy[connection]
+                    worker.kill()
+                    notify(Update.TIMEOUT, *worker.finish())
+                    idle.append(replace(worker))
+    finally:
+        for worker in workers:
+            if worker.task is None:
+                worker.stop()
+            else:
+                worker.kill()
+
+
+def kill_group(pid, sig):
+    try:
+        os.killpg(pid, sig)
+    except OSError as e:
+        if e.errno != errno.ESRCH:
+            raise
+
+
+async def supervise(i, command, meta, timeout, observer, groups, grace):
+    # Runs a command (in a session of its own) and kills its process group once it
+    # exceeds the timeout
+    process = await asyncio.create_subprocess_shell(
+        command,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    groups.add(process.pid)
+    notify(observer, Update(Update.STARTED, i, command, meta))
+    try:
+        await asyncio.wait_for(process.wait(), timeout)
+    except asyncio.TimeoutError:
+        kill_group(process.pid, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), grace)
+        except asyncio.TimeoutError:
+            kill_group(process.pid, signal.SIGKILL)
+            await process.wait()
+        notify(observer, Update(Update.TIMEOUT, i, command, meta))
+    else:
+        status = Update.DONE if process.returncode == 0 else Update.FAILED
+        notify(observer, Update(status, i, command, meta, process.returncode))
+    finally:
+        # Also kills processes that were started by the command and are still running
+        kill_group(process.pid, signal.SIGKILL)
+        groups.discard(process.pid)
+
+
+def notify(observer, update):
+    if observer:
+        try:
+            observer.observe(update)
+        except Exception:
+            print_exc()
+
+
+def run_async(
+    commands,
+    processes=None,
+    timeout=None,
+    meta=None,
+    observer=None,
+    timeouts=None,
+    grace=5,
+    requirements=None,
+    capacity=None,
+):
+    # type: (Any, Optional[int], Optional[float], Any, Optional[ParallelObserver], Any, float, Any, Optional[Resources]) -> None
+    """
+    Runs shell commands as subprocesses supervised by a single event loop (at most
+    processes at once), without pool, manager or monitor processes.  Commands that
+    exceed their timeout are terminated (with all processes they started) and killed if
+    they do not stop within grace seconds.  Commands are packed according to their
+    requirements (see Scheduler) against the capacity (default: the resources of this
+    machine).  Commands (and meta) can be generated lazily, observers are notified in
+    this process.
+    """
+    if meta is None:
+        meta = itertools.repeat(None)
+    if timeouts is None:
+        timeouts = itertools.repeat(timeout)
+    if requirements is None:
+        requirements = itertools.repeat(None)
+    groups = set()
+
+    async def run_all():
+        scheduler = Scheduler(
+            zip(enumerate(zip(commands, meta, timeouts)), requirements),
+            capacity or machine_resources(),
+            processes or os.cpu_count() or 1,
+        )
+        running = dict()  # type: Dict[asyncio.Future, Resources]
+        try:
+            while True:
+                for (
+                    i,
+                    (command, command_meta, command_timeout),
+                ), need in scheduler.ready():
+                    if not isinstance(command, str):
+                        raise ValueError(
+                            "Only shell commands can be run asynchronously, "
+                            "not {}".format(command)
+                        )
+                    task = asyncio.ensure_future(
+                        supervise(
+                            i,
+                            command,
+                            command_meta,
+                            command_timeout,
+                            observer,
+                            groups,
+                            grace,
+                        )
+                    )
+                    running[task] = need
+                if not running:
+                    return
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    scheduler.release(running.pop(task))
+                    task.result()
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(running)
+
+    # Instead of asyncio.run, which requires Python 3.7
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(run_all())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        for pid in list(groups):
+            kill_group(pid, signal.SIGKILL)
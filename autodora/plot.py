@@ -163,9 +163,8 @@ class ScatterData:
 
         ax.grid(True)
         legend_names = list(t[0] for t in self.data)
-        # legend_names = ["No mixing - DT", "No mixing - RF", "Mixing - DT", "Mixing - RF"]
-        # legend_names = ["No formulas", "Formulas"]
-        # legend_names = []
+        # legend_names = ["No mixing - DT", "No mixing - RF", "Mixing - DT", "Mixing -
+        # RF"] legend_names = ["No formulas", "Formulas"] legend_names = []
         if 15 >= len(self.data) == len(legend_names) and legend_pos:
             ax.legend(plots, legend_names, loc=legend_pos)
 
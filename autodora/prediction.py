@@ -0,0 +1,246 @@
+import heapq
+import json
+import math
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Type
+
+from .experiment import canonical_value
+
+if TYPE_CHECKING:
+    from .experiment import Experiment
+    from .storage import Storage
+
+# Runtimes are fit on a log scale, shorter runtimes are rounded up to this many seconds
+MIN_RUNTIME = 1e-3
+
+
+def is_numeric(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def feature(value):
+    # Runtimes tend to grow polynomially in sizes (e.g., counts), so they are compared
+    # on a log scale
+    return math.log1p(abs(value))
+
+
+def runtime(experiment, now=None):
+    # type: (Experiment, Optional[datetime]) -> Optional[float]
+    """
+    The runtime of a stored experiment that finished (None otherwise), experiments that
+    timed out took at least their timeout.  An experiment that started without finishing
+    or failing timed out once its timeout has passed, before it might still be running.
+    Cache hits (see Experiment.cache_results) are skipped, they repeat their source.
+    """
+    if experiment["@cached_from"] is not None:
+        return None
+    if experiment["@end_time"] is not None:
+        return experiment["@runtime"]
+    start, timeout = experiment["@start_time"], experiment["@timeout"]
+    if start and timeout and not experiment["@error"]:
+        if start + timedelta(seconds=timeout) < (now or datetime.now()):
+            return float(timeout)
+    return None
+
+
+def setting(experiment):
+    # type: (Experiment) -> Tuple[str, Dict[str, Any]]
+    """
+    The key identifying the parameters of the experiment before it ran (see
+    Experiment.run_fingerprint), and its parameters.
+    """
+    parameters = {k: experiment.parameters[k] for k in experiment.parameters.parameters}
+    try:
+        return experiment.run_fingerprint(), parameters
+    except ValueError:
+        return RuntimeModel.key(parameters), parameters
+
+
+class RuntimeModel(object):
+    """
+    Predicts the runtime of experiments from the runtimes of earlier runs (of the same
+    class).  Experiments that ran before with the same parameters are predicted by their
+    average runtime.  Otherwise, the earlier runs that share the non-numeric parameter
+    values are used.  A power law (regression of the log runtime on the log of the
+    numeric parameters that vary) is fit if they cover enough distinct settings, else
+    the runtime of the nearest setting is used.
+    """
+
+    def __init__(self, history):
+        # type: (List[Tuple[str, Dict[str, Any], float]]) -> None
+        self.exact = dict()  # type: Dict[str, List[float]]
+        # The settings (by key) that share non-numeric values, with the features of
+        # their numeric values
+        self.groups = dict()  # type: Dict[str, Dict[str, List[float]]]
+        self.fits = dict()  # type: Dict[str, Optional[Tuple[List[int], List[float]]]]
+        for key, parameters, value in history:
+            self.exact.setdefault(key, []).append(value)
+            self.groups.setdefault(self.group_key(parameters), {})[key] = self.features(
+                parameters
+            )
+
+    @staticmethod
+    def from_storage(storage, cls):
+        # type: (Storage, Type[Experiment]) -> RuntimeModel
+        history = []
+        fields = [
+            "parameters",
+            "@runtime",
+            "@start_time",
+            "@end_time",
+            "@timeout",
+            "@error",
+            "@cached_from",
+        ]
+        now = datetime.now()
+        for experiment in storage.iter_experiments(
+            cls, fields=fields, where=["@start_time"]
+        ):
+            value = runtime(experiment, now)
+            if value is not None:
+                key, parameters = setting(experiment)
+                history.append((key, parameters, value))
+        return RuntimeModel(history)
+
+    @staticmethod
+    def key(parameters):
+        return json.dumps(
+            sorted((k, canonical_value(v)) for k, v in parameters.items()), default=repr
+        )
+
+    @staticmethod
+    def group_key(parameters):
+        return RuntimeModel.key(
+            {k: v for k, v in parameters.items() if not is_numeric(v)}
+        )
+
+    @staticmethod
+    def features(parameters):
+        return [
+            feature(parameters[k])
+            for k in sorted(parameters)
+            if is_numeric(parameters[k])
+        ]
+
+    def runtime(self, key):
+        # type: (str) -> float
+        return sum(self.exact[key]) / len(self.exact[key])
+
+    def fit(self, group):
+        # type: (str) -> Optional[Tuple[List[int], List[float]]]
+        """
+        Fits the log runtime on the numeric parameters that vary within the group (their
+        columns and coefficients), if every coefficient is determined by the settings
+        that were run.
+        """
+        if group not in self.fits:
+            import numpy as np
+
+            settings = self.groups[group]
+            features = np.array(list(settings.values()))
+            columns = [
+                i
+                for i in range(features.shape[1])
+                if features[:, i].min() < features[:, i].max()
+            ]
+            x = np.hstack([np.ones((len(settings), 1)), features[:, columns]])
+            y = np.log([max(self.runtime(key), MIN_RUNTIME) for key in settings])
+            self.fits[group] = None
+            if columns and np.linalg.matrix_rank(x) == x.shape[1]:
+                self.fits[group] = columns, list(np.linalg.lstsq(x, y, rcond=None)[0])
+        return self.fits[group]
+
+    def predict(self, key, parameters):
+        # type: (str, Dict[str, Any]) -> Optional[float]
+        if key in self.exact:
+            return self.runtime(key)
+        group = self.group_key(parameters)
+        if group not in self.groups:
+            return None
+        features = self.features(parameters)
+        fit = self.fit(group)
+        if fit is not None:
+            columns, coefficients = fit
+            return math.exp(
+                coefficients[0]
+                + sum(c * features[i] for i, c in zip(columns, coefficients[1:]))
+            )
+        settings = self.groups[group]
+        distances = {
+            k: sum(abs(a - b) for a, b in zip(features, other))
+            for k, other in settings.items()
+        }
+        nearest = min(distances.values())
+        values = [self.runtime(k) for k, d in distances.items() if d == nearest]
+        return sum(values) / len(values)
+
+
+def predict_runtimes(storage, experiments, models=None):
+    # type: (Storage, List[Experiment], Optional[Dict[Type[Experiment], RuntimeModel]]) -> List[Optional[float]]
+    """
+    Predicts the runtimes of the given experiments (None if no experiment of the same
+    class was run before), the models (per class) that are built from the storage are
+    kept in models.
+    """
+    models = dict() if models is None else models
+    predictions = []
+    for experiment in experiments:
+        cls = experiment.__class__
+        if cls not in models:
+            models[cls] = RuntimeModel.from_storage(storage, cls)
+        predictions.append(models[cls].predict(*setting(experiment)))
+    return predictions
+
+
+def fill_unknown(runtimes):
+    # type: (List[Optional[float]]) -> List[float]
+    # Experiments without prediction are assumed to take the average predicted time
+    known = [r for r in runtimes if r is not None]
+    default = sum(known) / len(known) if known else 0.0
+    return [default if r is None else r for r in runtimes]
+
+
+def longest_first(experiments, runtimes):
+    # type: (List[Experiment], List[Optional[float]]) -> List[Experiment]
+    """
+    Orders experiments by decreasing predicted runtime, experiments with equal
+    predictions keep their relative order.
+    """
+    runtimes = fill_unknown(runtimes)
+    order = sorted(range(len(experiments)), key=lambda i: -runtimes[i])
+    return [experiments[i] for i in order]
+
+
+def makespan(runtimes, processes):
+    # type: (List[float], int) -> float
+    """
+    The time until all tasks are finished if they are dispatched in the given order to
+    the first free process.
+    """
+    finish = [0.0] * max(processes, 1)
+    for value in runtimes:
+        heapq.heappush(finish, heapq.heappop(finish) + value)
+    return max(finish)
+
+
+def makespan_summary(runtimes, processes):
+    # type: (List[Optional[float]], int) -> str
+    """
+    Summarizes the predicted runtimes and the makespans of running the experiments in
+    the given and in longest first order, assuming that every experiment occupies one of
+    the processes (resources, e.g., @cpus, are not packed).
+    """
+    known = sum(r is not None for r in runtimes)
+    filled = fill_unknown(runtimes)
+    lines = [
+        "Predicted runtimes for {} of {} experiments (total {:.2f}s)".format(
+            known, len(runtimes), sum(filled)
+        ),
+        "Predicted makespan with {} processes (one experiment per process, "
+        "@cpus and @memory are ignored):".format(processes),
+        "  {:<14} {:.2f}s".format("given order", makespan(filled, processes)),
+        "  {:<14} {:.2f}s".format(
+            "longest first", makespan(sorted(filled, reverse=True), processes)
+        ),
+    ]
+    return "\n".join(lines)
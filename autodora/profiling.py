@@ -0,0 +1,112 @@
+import cProfile
+import io
+import marshal
+import pickle
+import pstats
+import tracemalloc
+import zlib
+from typing import List, Optional
+
+CPU = "cpu"
+MEMORY = "memory"
+KINDS = (CPU, MEMORY)
+
+
+class Profiler(object):
+    """
+    Profiles the CPU time (cProfile) or memory allocations (tracemalloc) of the code run
+    between start and stop.
+    """
+
+    def __init__(self, kind):
+        # type: (str) -> None
+        if kind not in KINDS:
+            raise ValueError(
+                "Unknown profile {}, choose one of {}".format(kind, ", ".join(KINDS))
+            )
+        self.kind = kind
+        self.profiler = None  # type: Optional[cProfile.Profile]
+        self.was_tracing = False
+
+    def start(self):
+        if self.kind == CPU:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            self.was_tracing = tracemalloc.is_tracing()
+            if not self.was_tracing:
+                tracemalloc.start()
+
+    def stop(self):
+        # type: () -> bytes
+        """Stops profiling and returns the compressed profile."""
+        if self.kind == CPU:
+            self.profiler.disable()
+            self.profiler.create_stats()
+            return zlib.compress(marshal.dumps(self.profiler.stats))
+
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if not self.was_tracing:
+            tracemalloc.stop()
+        lines = [
+            (s.traceback[0].filename, s.traceback[0].lineno, s.size, s.count)
+            for s in snapshot.statistics("lineno")
+        ]
+        return zlib.compress(pickle.dumps({"peak": peak, "lines": lines}))
+
+
+class StoredStats(object):
+    # Loads CPU profile statistics into pstats.Stats
+    def __init__(self, data):
+        self.stats = marshal.loads(zlib.decompress(data))
+
+    def create_stats(self):
+        pass
+
+
+def cpu_hotspots(profiles, top=20, sort="cumulative"):
+    # type: (List[bytes], int, str) -> str
+    """Returns the top functions of the aggregated CPU profiles."""
+    stream = io.StringIO()
+    stats = pstats.Stats(stream=stream)
+    for data in profiles:
+        stats.add(StoredStats(data))
+    stats.sort_stats(sort).print_stats(top)
+    return stream.getvalue()
+
+
+def memory_hotspots(profiles, top=20):
+    # type: (List[bytes], int) -> str
+    """
+    Returns the lines that allocated the most memory (still allocated at the end of the
+    run), summed over all profiles.
+    """
+    peak, lines = 0, dict()
+    for data in profiles:
+        profile = pickle.loads(zlib.decompress(data))
+        peak = max(peak, profile["peak"])
+        for filename, lineno, size, count in profile["lines"]:
+            total_size, total_count = lines.get((filename, lineno), (0, 0))
+            lines[(filename, lineno)] = (total_size + size, total_count + count)
+    rows = [
+        "Peak traced memory: {:.1f} KiB (maximum over {} profiles)".format(
+            peak / 1024, len(profiles)
+        )
+    ]
+    rows.append("{:>12}  {:>8}  location".format("size (KiB)", "blocks"))
+    hotspots = sorted(lines.items(), key=lambda t: t[1][0], reverse=True)[:top]
+    for (filename, lineno), (size, count) in hotspots:
+        rows.append(
+            "{:>12.1f}  {:>8}  {}:{}".format(size / 1024, count, filename, lineno)
+        )
+    return "\n".join(rows)
+
+
+def hotspots(kind, profiles, top=20, sort="cumulative"):
+    # type: (str, List[bytes], int, str) -> str
+    if len(profiles) == 0:
+        return "No {} profiles stored.".format(kind)
+    if kind == CPU:
+        return cpu_hotspots(profiles, top, sort)
+    return memory_hotspots(profiles, top)
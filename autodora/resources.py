@@ -0,0 +1,181 @@
+import os
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Optional, Iterable, Tuple, Any, List
+
+# Cores and bytes of memory (None if unknown or unbounded)
+Resources = namedtuple("Resources", ["cpus", "memory"])
+
+
+def machine_resources(meminfo="/proc/meminfo"):
+    # type: (str) -> Resources
+    """
+    The cores this process can use and the memory that is available (None if
+    /proc/meminfo cannot be read).
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    memory = dict()
+    try:
+        with open(meminfo) as ref:
+            for line in ref:
+                key, value = line.split(":", 1)
+                # Sizes are given in kB
+                memory[key] = int(value.split()[0]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return Resources(cpus, memory.get("MemAvailable", memory.get("MemTotal")))
+
+
+def parse_memory(string):
+    # type: (str) -> int
+    """Parses a number of bytes, optionally with a (binary) unit, e.g., 512M or 30G."""
+    units = {"K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+    string = string.strip().upper().rstrip("B")
+    if string and string[-1] in units:
+        return int(float(string[:-1]) * units[string[-1]])
+    return int(string)
+
+
+def combine(requirements):
+    # type: (Iterable[Optional[Resources]]) -> Optional[Resources]
+    """
+    The resources needed to run tasks one after the other (None if none of them declares
+    any requirements).
+    """
+    requirements = [r for r in requirements if r is not None]
+    if not requirements:
+        return None
+    return Resources(
+        max(r.cpus or 1 for r in requirements), max(r.memory or 0 for r in requirements)
+    )
+
+
+class Scheduler(object):
+    """
+    Packs tasks with resource requirements against a capacity (and a maximal number of
+    tasks running at once).  Tasks are started in order as long as they fit, later tasks
+    can pass tasks that do not fit (backfilling) but only lookahead times, after which a
+    task waits until enough resources are released.  Tasks without requirements use a
+    single core, tasks that need more than the capacity are run alone.
+    """
+
+    def __init__(self, tasks, capacity, slots, lookahead=None):
+        # type: (Iterable[Tuple[Any, Optional[Resources]]], Resources, int, Optional[int]) -> None
+        self.tasks = iter(tasks)
+        # Without declared requirements, the number of slots determines how many tasks
+        # run at once
+        self.capacity = Resources(max(capacity.cpus, slots), capacity.memory)
+        self.slots = slots
+        self.lookahead = slots if lookahead is None else lookahead
+        self.waiting = []  # type: List[list]
+        self.exhausted = False
+        self.running = 0
+        self.used = Resources(0, 0)
+
+    def need(self, requirement):
+        # type: (Optional[Resources]) -> Resources
+        if requirement is None:
+            return Resources(1, 0)
+        memory = requirement.memory or 0
+        if self.capacity.memory is not None:
+            memory = min(memory, self.capacity.memory)
+        return Resources(min(max(requirement.cpus or 1, 1), self.capacity.cpus), memory)
+
+    def fits(self, need):
+        # type: (Resources) -> bool
+        if self.used.cpus + need.cpus > self.capacity.cpus:
+            return False
+        return (
+            self.capacity.memory is None
+            or self.used.memory + need.memory <= self.capacity.memory
+        )
+
+    def ready(self):
+        # type: () -> List[Tuple[Any, Resources]]
+        """
+        Returns the tasks (and the resources reserved for them) that can be started now.
+        """
+        started = []
+        while self.running < self.slots:
+            while not self.exhausted and len(self.waiting) <= self.lookahead:
+                try:
+                    task, requirement = next(self.tasks)
+                except StopIteration:
+                    self.exhausted = True
+                    break
+                self.waiting.append([task, self.need(requirement), 0])
+
+            position = None
+            for i, (_, need, passed) in enumerate(self.waiting):
+                if self.fits(need):
+                    position = i
+                    break
+                if passed >= self.lookahead:
+                    break
+            if position is None:
+                break
+            for entry in self.waiting[:position]:
+                entry[2] += 1
+            task, need, _ = self.waiting.pop(position)
+            self.running += 1
+            self.used = Resources(
+                self.used.cpus + need.cpus, self.used.memory + need.memory
+            )
+            started.append((task, need))
+        return started
+
+    def release(self, need):
+        # type: (Resources) -> None
+        self.running -= 1
+        self.used = Resources(
+            self.used.cpus - need.cpus, self.used.memory - need.memory
+        )
+
+
+def virtual_memory(status="/proc/self/status"):
+    # type: (str) -> int
+    """
+    The size of the address space of this process in bytes (0 if /proc/self/status
+    cannot be read).
+    """
+    try:
+        with open(status) as ref:
+            return next(
+                (
+                    int(line.split()[1]) * 1024
+                    for line in ref
+                    if line.startswith("VmSize:")
+                ),
+                0,
+            )
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+@contextmanager
+def memory_limit(limit):
+    # type: (Optional[int]) -> None
+    """
+    Limits the memory this process can allocate from now on to limit bytes, allocations
+    beyond it raise MemoryError. The address space (RLIMIT_AS) is limited to its current
+    size (interpreter, libraries, heap) plus limit, so the limit is on the virtual
+    memory that is added: memory that is mapped but never used (e.g., thread stacks)
+    counts.
+    """
+    if not limit:
+        yield
+        return
+    import resource
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit += virtual_memory()
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
@@ -1,13 +1,39 @@
 import inspect
+import itertools
+import multiprocessing
+import os
 import platform as platform_library
+import queue
+import shlex
+import signal
 import sys
+import time
 from datetime import datetime
-from typing import TYPE_CHECKING, Optional, Dict
+from typing import (
+    TYPE_CHECKING,
+    Optional,
+    Dict,
+    List,
+    Type,
+    Iterable,
+    Iterator,
+    Tuple,
+    Any,
+)
+
+from peewee import chunked
 
 from .observe import ProgressObserver
 from .parallel import ParallelObserver, Update
 from . import parallel
-from .storage import export_storage
+from .resources import combine
+from .settings import (
+    DEFAULT_LEASE,
+    BATCH_TARGET_TIME,
+    BATCH_MAX_SIZE,
+    DISPATCH_TIME_VARIABLE,
+)
+from .storage import export_storage, load_experiment, run_experiment
 
 if TYPE_CHECKING:
     from .storage import Storage
@@ -21,23 +47,141 @@ class ParallelToProcess(ParallelObserver):
         super().__init__()
         self.observer = observer
         self.runner = runner
+        # Wall time from dispatching to finishing experiments and the duration of
+        # loading results
+        self.dispatched = dict()  # type: Dict[int, float]
+        self.duration = Average()
+        self.fresh_copy = Average()
 
     def observe(self, update):
-        if self.observer.auto_load:
-            meta = self.runner.trajectory.experiments[update.index]
-            if update.status == Update.DONE or update.status == Update.FAILED:
-                meta = meta.fresh_copy()
-        else:
-            meta = update.meta
-
+        # Every task runs a batch of experiments (see Batcher), they are reported one by
+        # one
+        first, batch = self.runner.running[update.index]
         if update.status == Update.STARTED:
-            self.observer.experiment_started(update.index, meta)
-        if update.status == Update.DONE:
-            self.observer.experiment_finished(update.index, meta)
-        if update.status == Update.TIMEOUT:
-            self.observer.experiment_interrupted(update.index, meta)
-        if update.status == Update.FAILED:
-            self.observer.experiment_failed(update.index, meta)
+            self.dispatched[update.index] = update.time
+            for offset, experiment in enumerate(batch):
+                meta = experiment if self.observer.auto_load else experiment.identifier
+                self.observer.experiment_started(first + offset, meta)
+            return
+
+        del self.runner.running[update.index]
+        dispatched = self.dispatched.pop(update.index, None)
+        if update.status == Update.DONE and dispatched is not None:
+            self.duration.add((update.time - dispatched) / len(batch))
+            if self.runner.batcher is not None:
+                self.runner.batcher.add(update.time - dispatched, len(batch))
+
+        for offset, experiment in enumerate(batch):
+            status = update.status
+            # Failed experiments are loaded to find out whether they ran out of memory
+            if (
+                self.observer.auto_load
+                or len(batch) > 1
+                or update.status == Update.FAILED
+            ):
+                if (
+                    update.status == Update.DONE
+                    or update.status == Update.FAILED
+                    or len(batch) > 1
+                ):
+                    start = time.perf_counter()
+                    experiment = experiment.fresh_copy()
+                    self.fresh_copy.add(time.perf_counter() - start)
+                if len(batch) == 1 and update.status == Update.FAILED:
+                    process_failed(experiment, update.exit_code)
+                if len(batch) > 1 or update.status == Update.FAILED:
+                    status = experiment_status(experiment)
+            notify(
+                self.observer,
+                status,
+                first + offset,
+                experiment if self.observer.auto_load else experiment.identifier,
+            )
+
+
+def experiment_status(experiment):
+    # type: (Experiment) -> str
+    """
+    Determines how a (stored) experiment ended: completed, out of memory, failed or
+    interrupted (timed out or never run).
+    """
+    if experiment["@completed"]:
+        return Update.DONE
+    elif experiment["@out_of_memory"]:
+        return Update.OUT_OF_MEMORY
+    elif experiment["@error"]:
+        return Update.FAILED
+    return Update.TIMEOUT
+
+
+def process_failed(experiment, exit_code):
+    # type: (Experiment, Optional[int]) -> None
+    """
+    Records that the process running the (stored) experiment failed with the given exit
+    code (if known), unless the experiment recorded an error itself.
+    """
+    if experiment["@error"] or exit_code is None:
+        return
+    experiment.result["@error"] = "Process exited with code {}".format(exit_code)
+    # Heuristic: processes that are killed (directly or, as reported by a shell, 128 +
+    # signal) without being asked to are usually stopped by the OOM killer
+    if exit_code in (-signal.SIGKILL, 128 + signal.SIGKILL):
+        experiment.result["@out_of_memory"] = True
+    experiment.save()
+
+
+def notify(observer, status, index, experiment):
+    # type: (ProgressObserver, str, int, Any) -> None
+    if status == Update.DONE:
+        observer.experiment_finished(index, experiment)
+    if status == Update.TIMEOUT:
+        observer.experiment_interrupted(index, experiment)
+    if status == Update.FAILED:
+        observer.experiment_failed(index, experiment)
+    if status == Update.OUT_OF_MEMORY:
+        observer.experiment_out_of_memory(index, experiment)
+
+
+class Batcher(object):
+    """
+    Groups experiments (of the same class and with the same resources) into batches that
+    are run by a single task. Batches are sized such that they are expected to take
+    about target seconds, based on the time per experiment observed so far, so short
+    experiments do not spend most of their time being dispatched and starting processes.
+    """
+
+    def __init__(self, target=BATCH_TARGET_TIME, max_size=BATCH_MAX_SIZE):
+        self.target = target
+        self.max_size = max_size
+        self.per_experiment = Average()
+
+    def add(self, duration, count):
+        self.per_experiment.add(duration / count)
+
+    def size(self):
+        mean = self.per_experiment.mean
+        if not mean:
+            return 1
+        return max(1, min(self.max_size, int(self.target / mean)))
+
+    def batches(self, experiments):
+        # type: (Iterable[Experiment]) -> Iterator[List[Experiment]]
+        batch, resources = [], None
+        for experiment in experiments:
+            if batch and (
+                experiment.__class__ != batch[0].__class__
+                or experiment.resources() != resources
+            ):
+                yield batch
+                batch = []
+            if not batch:
+                resources = experiment.resources()
+            batch.append(experiment)
+            if len(batch) >= self.size():
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
 
 class PrintObserver(ProgressObserver):
@@ -61,6 +205,9 @@ class PrintObserver(ProgressObserver):
     def experiment_failed(self, index, experiment):
         print("[{}] failed: {}".format(index, experiment))
 
+    def experiment_out_of_memory(self, index, experiment):
+        print("[{}] out of memory: {}".format(index, experiment))
+
     def run_finished(self, platform, name, run_count, run_date):
         print("[{}] done: {} - {}".format(platform, name, run_count))
 
@@ -68,7 +215,7 @@ class PrintObserver(ProgressObserver):
 class PrintCountObserver(ProgressObserver):
     def __init__(self):
         super().__init__(auto_load=False)
-        self.completed = self.failed = self.timed_out = 0
+        self.completed = self.failed = self.timed_out = self.out_of_memory = 0
         self.name = None
         self.experiment_count = None
 
@@ -92,15 +239,87 @@ class PrintCountObserver(ProgressObserver):
         self.failed += 1
         self.print_message()
 
+    def experiment_out_of_memory(self, index, experiment):
+        self.out_of_memory += 1
+        self.print_message()
+
     def run_finished(self, platform, name, run_count, run_date):
         pass
 
     def print_message(self):
         print(
             f"[{self.name}] "
-            f"{self.completed + self.failed + self.timed_out} / {self.experiment_count} "
-            f"(C {self.completed} | E {self.failed} | T {self.timed_out})"
+            f"{self.completed + self.failed + self.timed_out + self.out_of_memory} / "
+            f"{'?' if self.experiment_count is None else self.experiment_count} "
+            f"(C {self.completed} | E {self.failed} | T {self.timed_out} | "
+            f"M {self.out_of_memory})"
+        )
+
+
+class Average(object):
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value):
+        if value is not None:
+            self.total += value
+            self.count += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count > 0 else None
+
+
+def overhead_summary(experiments, total=None, fresh_copy=None):
+    # type: (Iterable[Experiment], Optional[float], Optional[float]) -> str
+    """
+    Summarizes where the time per experiment was spent: mean seconds per phase over the
+    given experiments, the mean total time from dispatching to finishing experiments and
+    the mean time spent loading results for observers.
+    """
+    phases = [
+        ("startup", "@overhead.startup"),
+        ("load", "@overhead.load"),
+        ("initial save", "@overhead.initial_save"),
+        ("run", "@runtime_wall"),
+    ]
+    averages = [Average() for _ in phases]
+    count = 0
+    for experiment in experiments:
+        count += 1
+        for average, (_, key) in zip(averages, phases):
+            average.add(experiment[key])
+    means = [(name, average.mean) for (name, _), average in zip(phases, averages)]
+    if total is not None:
+        # The remainder is spent on the final save, shutting down the process and
+        # reporting back
+        measured = sum(value for _, value in means if value is not None)
+        means.append(("finish", max(total - measured, 0)))
+    means.append(("fresh copy", fresh_copy))
+    lines = ["Time per experiment ({} experiments):".format(count)]
+    for name, value in means:
+        if value is not None:
+            share = " ({:.0%})".format(value / total) if total else ""
+            lines.append("  {:<12} {:.4f}s{}".format(name, value, share))
+    if total is not None:
+        lines.append("  {:<12} {:.4f}s".format("total", total))
+    return "\n".join(lines)
+
+
+def existing_identifiers(storage, group, experiments):
+    # type: (Storage, str, List[Experiment]) -> List[Optional[int]]
+    """
+    The identifiers of stored experiments of the group that ran the same settings (None
+    for new settings).
+    """
+    settings = [e.setting_fingerprint() for e in experiments]
+    identifiers = dict()
+    for cls in set(e.__class__ for e in experiments):
+        identifiers[cls] = storage.get_identifiers(
+            cls, group, [f for e, f in zip(experiments, settings) if e.__class__ == cls]
         )
+    return [identifiers[e.__class__].get(f) for e, f in zip(experiments, settings)]
 
 
 class Runner:
@@ -121,21 +340,59 @@ class Runner:
 
 
 class StoredRunner(Runner):
+    # Number of experiments that are checked (for existing results) and saved at once
+    chunk_size = 1000
+
     def __init__(self, trajectory, storage, observer, repeat):
         super().__init__(trajectory, observer)
         self.storage = storage  # type: Storage
         self.repeat = repeat
-        self._previous_experiments = None
         self.run_count = None if storage is None else self.storage.get_new_run()
 
+    def configure(self, experiment, run_date, platform):
+        # type: (Experiment, datetime, str) -> None
+        experiment.config["@run.count"] = -1 if self.storage is None else self.run_count
+        experiment.config["@run.date"] = run_date
+        experiment.config["@run.computer"] = platform
+
+    def iter_pending(self, run_date, platform):
+        # type: (datetime, str) -> Iterator[Experiment]
+        """
+        Yields the experiments of the trajectory that have not been run yet, they are
+        configured and saved in chunks, such that (lazy) trajectories are consumed as a
+        stream.
+        """
+        for chunk in chunked(self.trajectory.iter_experiments(), self.chunk_size):
+            pending = []
+            # Configured first, settings that were run with a different (e.g., larger)
+            # timeout are run again
+            for e in chunk:
+                self.configure(e, run_date, platform)
+            for e, identifier in zip(chunk, self.get_existing_identifiers(chunk)):
+                if identifier is None:
+                    pending.append(e)
+                else:
+                    e.identifier = identifier
+            if self.storage:
+                self.storage.save_many(pending)
+            yield from pending
+
+    def experiment_count(self, pending):
+        # type: (Iterable[Experiment]) -> (Iterable[Experiment], Optional[int])
+        # Experiments of regular trajectories are counted, lazy trajectories are not
+        # enumerated upfront
+        if self.trajectory.lazy:
+            return pending, None
+        pending = list(pending)
+        return pending, len(pending)
+
     def setting_exists(self, setting, experiment):
         if self.storage is None:
-            return False
-        if self._previous_experiments is None:
-            self._previous_experiments = self.storage.get_experiments(
-                experiment.__class__, self.trajectory.name
-            )
-        return Runner.setting_exists(setting, self._previous_experiments)
+            return None
+        identifier = self.get_existing_identifiers([experiment])[0]
+        if identifier is None:
+            return None
+        return self.storage.get_experiment(experiment.__class__, identifier)
 
     def get_existing(self, setting, experiment):
         # type: (Dict, Experiment) -> Optional[Experiment]
@@ -143,6 +400,12 @@ class StoredRunner(Runner):
             return self.setting_exists(setting, experiment)
         return None
 
+    def get_existing_identifiers(self, experiments):
+        # type: (List[Experiment]) -> List[Optional[int]]
+        if self.repeat or self.storage is None:
+            return [None] * len(experiments)
+        return existing_identifiers(self.storage, self.trajectory.name, experiments)
+
 
 class CommandLineRunner(StoredRunner):
     def __init__(
@@ -155,6 +418,13 @@ class CommandLineRunner(StoredRunner):
         via_cli=True,
         repeat=False,
         cmd=None,
+        warm=True,
+        max_tasks=None,
+        batch_time=None,
+        asynchronous=True,
+        capacity=None,
+        limit_memory=False,
+        longest_first=False,
     ):
         super().__init__(
             trajectory,
@@ -166,87 +436,351 @@ class CommandLineRunner(StoredRunner):
         self.processes = processes
         self.via_cli = via_cli
         self.cmd = cmd
+        # Without the CLI, experiments are run in long-lived workers that are replaced
+        # after max_tasks experiments
+        self.warm = warm
+        self.max_tasks = max_tasks
+        # Experiments run via the CLI can be batched to take about batch_time seconds
+        # per process (e.g., BATCH_TARGET_TIME), experiments of a batch share the
+        # process that is started (None disables batches)
+        self.batcher = (
+            None if batch_time is None or not via_cli else Batcher(batch_time)
+        )
+        # CLI processes are supervised by an event loop (instead of a pool of processes
+        # waiting for them)
+        self.asynchronous = asynchronous
+        # Asynchronous and warm workers pack experiments according to their resources
+        # (see Experiment.resources) against the capacity (default: the cores and memory
+        # of this machine), limit_memory limits every run to the memory it declares
+        self.capacity = capacity
+        self.limit_memory = limit_memory
+        # Experiments are dispatched in order of decreasing predicted runtime (see
+        # prediction.RuntimeModel), such that long experiments do not run on their own
+        # at the end
+        self.longest_first = longest_first
 
     def set_observer(self, observer):
         self.observer = ParallelToProcess(observer, self)
 
+    def configure(self, experiment, run_date, platform):
+        super().configure(experiment, run_date, platform)
+        if self.timeout:
+            experiment.config["@timeout"] = self.timeout
+        if self.limit_memory:
+            experiment.config["@limit_memory"] = True
+
+    def command(self, batch):
+        # type: (List[Experiment]) -> Any
+        cls = batch[0].__class__
+        identifiers = [e.identifier for e in batch]
+        if not self.via_cli:
+            if len(batch) == 1:
+                return CommandLineRunner.run_single, (self.storage, cls, identifiers[0])
+            return CommandLineRunner.run_batch, (self.storage, cls, identifiers)
+        storage_name = shlex.quote(export_storage(self.storage))
+        identifiers = " ".join(str(i) for i in identifiers)
+        if self.cmd is None:
+            return "python {} -s {} run {}".format(
+                inspect.getfile(cls), storage_name, identifiers
+            )
+        return f"{self.cmd} -s {storage_name} run {identifiers}"
+
+    def task_timeout(self, size):
+        # type: (int) -> Optional[float]
+        # Batches enforce the timeout of every experiment themselves, the timeout of the
+        # task is a safety net
+        if self.timeout is None or size == 1:
+            return self.timeout
+        return size * (self.timeout + 1)
+
     def run(self):
-        commands = []
         run_date = datetime.now()
         platform = platform_library.node()
         name = self.trajectory.name
 
-        experiments = []
-        for s, e in zip(self.trajectory.settings, self.trajectory.experiments):
-            existing = self.get_existing(s, e)
-            if existing is None:
-                experiments.append(e)
-            else:
-                e.identifier = existing.identifier
-
+        pending, experiment_count = self.experiment_count(
+            self.iter_pending(run_date, platform)
+        )
+        if self.longest_first:
+            pending = self.order(pending)
         if self.observer:
-            experiment_count = len(experiments)
             self.observer.observer.run_started(
                 platform, name, self.run_count, run_date, experiment_count
             )
 
-        for experiment in experiments:
-            if self.timeout:
-                experiment.config["@timeout"] = self.timeout
-            experiment.config["@run.count"] = self.run_count
-            experiment.config["@run.date"] = run_date
-            experiment.config["@run.computer"] = platform
-            experiment.save(self.storage)
-            storage_name = export_storage(experiment.storage)
-            cls = experiment.__class__
-            filename = inspect.getfile(cls)
-            if self.via_cli:
-                if self.cmd is None:
-                    commands.append(
-                        "python {} -s {} run {}".format(
-                            filename, storage_name, experiment.identifier
-                        )
-                    )
-                else:
-                    commands.append(
-                        f"{self.cmd} -s {storage_name} run {experiment.identifier}"
-                    )
-            else:
-                commands.append(
-                    (
-                        CommandLineRunner.run_single,
-                        (self.storage, cls, experiment.identifier),
-                    )
-                )
-
-        meta = [e.identifier for e in experiments] if self.observer else None
-        parallel.run_commands(
-            commands,
-            timeout=self.timeout,
-            observer=self.observer,
-            meta=meta,
-            processes=self.processes,
-        )
+        # Batches that are being run (by task index) with the index of their first
+        # experiment
+        self.running = dict()  # type: Dict[int, Tuple[int, List[Experiment]]]
+        observer = self.observer
+        if observer is None and self.batcher is not None:
+            # Batch sizes are adapted to the durations of finished tasks
+            observer = ParallelToProcess(ProgressObserver(auto_load=False), self)
+        classes = set()
+
+        def stream():
+            first = 0
+            batches = (
+                ([e] for e in pending)
+                if self.batcher is None
+                else self.batcher.batches(pending)
+            )
+            for index, batch in enumerate(batches):
+                classes.add(batch[0].__class__)
+                if observer is not None:
+                    self.running[index] = (first, batch)
+                first += len(batch)
+                yield batch
+
+        batches, sizes, requirements = itertools.tee(stream(), 3)
+        requirements = (combine(e.resources() for e in batch) for batch in requirements)
+        if self.via_cli and self.asynchronous:
+            parallel.run_async(
+                map(self.command, batches),
+                observer=observer,
+                processes=self.processes,
+                timeouts=(self.task_timeout(len(batch)) for batch in sizes),
+                requirements=requirements,
+                capacity=self.capacity,
+            )
+        elif self.via_cli or not self.warm:
+            parallel.run_commands(
+                map(self.command, batches),
+                observer=observer,
+                processes=self.processes,
+                timeouts=(self.task_timeout(len(batch)) for batch in sizes),
+            )
+        else:
+            parallel.run_warm(
+                map(self.command, batches),
+                timeout=self.timeout,
+                observer=observer,
+                processes=self.processes,
+                max_tasks=self.max_tasks,
+                requirements=requirements,
+                capacity=self.capacity,
+            )
         if self.observer:
+            executed = (
+                e
+                for cls in classes
+                for e in self.storage.iter_experiments(
+                    cls,
+                    name,
+                    fields=[
+                        "@overhead.startup",
+                        "@overhead.load",
+                        "@overhead.initial_save",
+                        "@runtime_wall",
+                    ],
+                    where=["@run.count={}".format(self.run_count), "@end_time"],
+                )
+            )
+            print(
+                overhead_summary(
+                    executed, self.observer.duration.mean, self.observer.fresh_copy.mean
+                )
+            )
             self.observer.observer.run_finished(
                 platform, name, self.run_count, run_date
             )
+        if self.trajectory.lazy:
+            return None
         return [
             self.storage.get_experiment(e.__class__, e.identifier)
             for e in self.trajectory.experiments
         ]
 
+    def order(self, pending):
+        # type: (Iterable[Experiment]) -> Iterable[Experiment]
+        # Lazy trajectories are ordered per chunk
+        from .prediction import predict_runtimes, longest_first
+
+        models = dict()
+        if not self.trajectory.lazy:
+            return longest_first(
+                pending, predict_runtimes(self.storage, pending, models)
+            )
+        return (
+            e
+            for chunk in chunked(pending, self.chunk_size)
+            for e in longest_first(chunk, predict_runtimes(self.storage, chunk, models))
+        )
+
     @staticmethod
     def run_single(storage, cls, identifier):
-        experiment = storage.get_experiment(cls, identifier)
-        experiment.run_wrapped(True)
-        return experiment.identifier
+        return run_experiment(storage, cls, identifier).identifier
 
+    @staticmethod
+    def run_isolated(storage, cls, identifier):
+        # In a process group of its own, such that the processes started by the
+        # experiment are stopped along with it
+        os.setpgrp()
+        CommandLineRunner.run_single(storage, cls, identifier)
+
+    @staticmethod
+    def run_batch(storage, cls, identifiers):
+        """
+        Runs experiments one after the other, each in a forked process (isolating
+        failures) that is terminated once the experiment exceeds its @timeout.
+        """
+        for identifier in identifiers:
+            timeout = storage.get_experiment(cls, identifier)["@timeout"]
+            os.environ[DISPATCH_TIME_VARIABLE] = repr(time.time())
+            process = multiprocessing.Process(
+                target=CommandLineRunner.run_isolated, args=(storage, cls, identifier)
+            )
+            process.start()
+            process.join(timeout)
+            timed_out = process.is_alive()
+            if timed_out:
+                try:
+                    os.killpg(process.pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    # The process has not created its process group yet
+                    process.terminate()
+                process.join()
+            parallel.kill_group(process.pid, signal.SIGKILL)
+            if not timed_out and process.exitcode != 0:
+                process_failed(
+                    storage.get_experiment(cls, identifier), process.exitcode
+                )
+        os.environ.pop(DISPATCH_TIME_VARIABLE, None)
 
-def import_runner(runner_string, trajectory, storage, timeout=None, cmd=None):
+
+class QueueObserver(object):
+    # Passes the experiments that workers ran to the runner, a class such that it can be
+    # pickled (unlike a lambda)
+    def __init__(self, finished):
+        # type: (multiprocessing.Queue) -> None
+        self.finished = finished
+
+    def __call__(self, cls, identifier):
+        self.finished.put((cls, identifier))
+
+
+class QueueRunner(StoredRunner):
+    """
+    Queues the experiments in the storage, from where workers claim and run them (see
+    work_queue.work), e.g., workers started on other machines with the worker command of
+    the experiment CLI.  The runner itself starts the given number of local workers and
+    waits until they have emptied the queue (without local workers it returns
+    immediately).
+    """
+
+    def __init__(
+        self,
+        trajectory,
+        storage,
+        processes=None,
+        timeout=None,
+        observer=None,
+        repeat=False,
+        lease=DEFAULT_LEASE,
+    ):
+        super().__init__(trajectory, storage, observer, repeat)
+        self.processes = os.cpu_count() if processes is None else processes
+        self.timeout = timeout
+        self.lease = lease
+
+    def set_observer(self, observer):
+        self.observer = observer
+
+    def configure(self, experiment, run_date, platform):
+        super().configure(experiment, run_date, platform)
+        if self.timeout:
+            experiment.config["@timeout"] = self.timeout
+
+    def run(self):
+        from .work_queue import work
+
+        run_date = datetime.now()
+        platform = platform_library.node()
+        name = self.trajectory.name
+
+        pending, experiment_count = self.experiment_count(
+            self.iter_pending(run_date, platform)
+        )
+        if self.observer:
+            self.observer.run_started(
+                platform, name, self.run_count, run_date, experiment_count
+            )
+        classes = set()
+        for chunk in chunked(pending, self.chunk_size):
+            classes.update(e.__class__ for e in chunk)
+            self.storage.enqueue([e.identifier for e in chunk])
+
+        finished = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(
+                target=work,
+                args=(self.storage, list(classes), name),
+                kwargs=dict(
+                    lease=self.lease,
+                    poll_interval=0.1,
+                    observer=QueueObserver(finished),
+                ),
+            )
+            for _ in range(self.processes if classes else 0)
+        ]
+        for w in workers:
+            w.start()
+        index = 0
+        while True:
+            alive = any(w.is_alive() for w in workers)
+            try:
+                cls, identifier = finished.get(timeout=0.1)
+            except queue.Empty:
+                if alive:
+                    continue
+                break
+            if self.observer:
+                experiment = self.storage.get_experiment(cls, identifier)
+                self.observer.experiment_started(index, experiment)
+                notify(self.observer, experiment_status(experiment), index, experiment)
+            index += 1
+        for w in workers:
+            w.join()
+
+        if self.observer:
+            self.observer.run_finished(platform, name, self.run_count, run_date)
+        if self.trajectory.lazy:
+            return None
+        return [
+            self.storage.get_experiment(e.__class__, e.identifier)
+            for e in self.trajectory.experiments
+        ]
+
+
+def import_runner(
+    runner_string,
+    trajectory,
+    storage,
+    timeout=None,
+    cmd=None,
+    processes=None,
+    longest_first=False,
+    batch_time=None,
+):
     if runner_string == "cli":
-        return CommandLineRunner(trajectory, storage, timeout=timeout, cmd=cmd)
+        return CommandLineRunner(
+            trajectory,
+            storage,
+            processes,
+            timeout=timeout,
+            cmd=cmd,
+            longest_first=longest_first,
+            batch_time=batch_time,
+        )
     elif runner_string == "multi":
-        return CommandLineRunner(trajectory, storage, timeout=timeout, via_cli=False)
+        return CommandLineRunner(
+            trajectory,
+            storage,
+            processes,
+            timeout=timeout,
+            via_cli=False,
+            longest_first=longest_first,
+        )
+    elif runner_string == "queue":
+        return QueueRunner(trajectory, storage, processes, timeout=timeout)
     else:
         raise ValueError("Could not parse runner from {}".format(runner_string))
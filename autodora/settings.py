@@ -1,2 +1,20 @@
 DEFAULT_GROUP_NAME = "default"
 DEFAULT_STORAGE = "sqlite"
+DEFAULT_BUSY_TIMEOUT = 60
+# Seconds between writing values reported by running experiments to the storage
+REPORT_FLUSH_INTERVAL = 10
+# Environment variable that passes the time a task was dequeued by a worker to the
+# process running it
+DISPATCH_TIME_VARIABLE = "AUTODORA_DISPATCH_TIME"
+# Batches of short experiments are sized to take about this many seconds (and contain at
+# most BATCH_MAX_SIZE experiments)
+BATCH_TARGET_TIME = 1.0
+BATCH_MAX_SIZE = 100
+# Bytes of output kept per experiment if logging is enabled without a size (the first
+# and last half, see @log_size)
+LOG_MAX_BYTES = 1024 * 1024
+# Seconds that a worker holds a claimed experiment without renewing its lease
+DEFAULT_LEASE = 60
+# Number of times an experiment is claimed before it is given up (e.g., because it keeps
+# crashing workers)
+MAX_ATTEMPTS = 3
@@ -1,17 +1,17 @@
 from datetime import datetime
 import platform as platform_library
-from typing import Optional
+from typing import Optional, Union
 
 from .observe import ProgressObserver
 from .storage import Storage
-from .trajectory import Trajectory
+from .trajectory import Trajectory, LazyTrajectory
 from .runner import StoredRunner
 
 
 class SimpleRunner(StoredRunner):
     def __init__(
         self,
-        trajectory: Trajectory,
+        trajectory: Union[Trajectory, LazyTrajectory],
         storage: Storage,
         observer: Optional[ProgressObserver] = None,
         repeat=False,
@@ -22,23 +22,16 @@ class SimpleRunner(StoredRunner):
         run_date = datetime.now()
         platform = platform_library.node()
         name = self.trajectory.name
-        experiments = [
-            e
-            for s, e in zip(self.trajectory.settings, self.trajectory.experiments)
-            if self.get_existing(s, e) is None
-        ]
         if self.observer:
-            experiment_count = len(self.trajectory.experiments)
+            try:
+                experiment_count = len(self.trajectory)
+            except TypeError:
+                experiment_count = None
             self.observer.run_started(
                 platform, name, self.run_count, run_date, experiment_count
             )
-        for i, experiment in enumerate(experiments):
-            experiment.config["@run.count"] = self.run_count if self.storage else -1
-            experiment.config["@run.date"] = run_date
-            experiment.config["@run.computer"] = platform
-            if self.storage:
-                experiment.save(self.storage)
 
+        for i, experiment in enumerate(self.iter_pending(run_date, platform)):
             if self.observer:
                 self.observer.experiment_started(i, experiment)
 
@@ -53,4 +46,4 @@ class SimpleRunner(StoredRunner):
 
         if self.observer:
             self.observer.run_finished(platform, name, self.run_count, run_date)
-        return self.trajectory.experiments
+        return None if self.trajectory.lazy else self.trajectory.experiments
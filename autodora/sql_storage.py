@@ -1,17 +1,117 @@
 import os
-from functools import partial
+import threading
+import time
+import weakref
+from array import array
+from contextlib import contextmanager
+from functools import wraps
 
-from peewee import Model, SqliteDatabase, CharField, BooleanField, IntegerField
+from peewee import (
+    Model,
+    SqliteDatabase,
+    DatabaseProxy,
+    CharField,
+    BooleanField,
+    BlobField,
+    IntegerField,
+    FloatField,
+    TextField,
+    OperationalError,
+    chunked,
+    fn,
+)
 from playhouse.fields import PickleField
+from playhouse.migrate import SqliteMigrator, migrate
 
+from .filters import parse_filter, is_excluded, trace_time, SPECIAL_PROPERTIES
+from .settings import DEFAULT_BUSY_TIMEOUT, MAX_ATTEMPTS
 from .storage import Storage
 
-database = SqliteDatabase(
-    os.environ.get(
+
+def default_filename():
+    return os.environ.get(
         "DB",
         os.path.join(os.path.dirname(os.path.dirname(__file__)), "experiments.sqlite"),
     )
-)
+
+
+class BoundDatabase(DatabaseProxy):
+    """
+    The database of the storage that the current thread uses (see SqliteStorage.bound),
+    the models are bound to it, such that storages of different files can be used side
+    by side.
+    """
+
+    __slots__ = ("_local",)
+
+    def __init__(self):
+        object.__setattr__(self, "_local", threading.local())
+        object.__setattr__(self, "_callbacks", [])
+
+    @property
+    def obj(self):
+        return getattr(self._local, "database", None)
+
+    def initialize(self, obj):
+        self._local.database = obj
+
+
+database = BoundDatabase()
+
+# The databases of all storages, connections inherited from a parent process are kept
+# alive (but never used) in the child, closing them could release locks that are still
+# held by the parent
+_databases = weakref.WeakSet()
+_inherited_connections = []
+
+
+def _forget_inherited_connection():
+    for db in _databases:
+        if not db.is_closed():
+            _inherited_connections.append(db.connection())
+            db._state.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_connection)
+
+
+def is_locked_error(error):
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def uses_database(func):
+    """Binds the models to the database of the storage while the method runs."""
+
+    @wraps(func)
+    def modified(self, *args, **kwargs):
+        with self.bound():
+            return func(self, *args, **kwargs)
+
+    return modified
+
+
+def retry_locked(func):
+    """
+    Retries a write operation (with exponential backoff) while the database is locked by
+    other writers.
+    """
+
+    @wraps(func)
+    def modified(self, *args, **kwargs):
+        deadline = time.time() + self.busy_timeout
+        delay = 0.01
+        while True:
+            try:
+                return func(self, *args, **kwargs)
+            except OperationalError as e:
+                if not is_locked_error(e) or time.time() + delay > deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 1.0)
+
+    return modified
 
 
 class BaseModel(Model):
@@ -26,64 +126,478 @@ class ExperimentModel(BaseModel):
     parameters = PickleField()
     result = PickleField()
     derived = PickleField()
+    # The values that each derived value was computed from
+    dependencies = PickleField(null=True)
+    fingerprint = CharField(null=True, index=True)
+    # Identifies the setting of the run (see Experiment.setting_fingerprint)
+    setting = CharField(null=True, index=True)
+    # Queued experiments are claimed by workers, who hold a lease until the given
+    # (epoch) time
+    queued = BooleanField(null=True, index=True)
+    lease_owner = CharField(null=True)
+    lease_expires = FloatField(null=True)
+    attempts = IntegerField(null=True)
+    # Whether all values that are not None are indexed (see ExperimentValue), not the
+    # case for experiments stored by earlier versions
+    indexed = BooleanField(null=True)
+
+
+class ExperimentValue(BaseModel):
+    """
+    Scalar config, parameter and result values of experiments, indexed to evaluate
+    filters in SQL.  Only the values of keys that the experiment class declares (except
+    @-options, see Schema.base) are indexed, values that are None are not stored.
+    """
+
+    # Values stored by earlier versions can be NULL, other values (e.g., lists) are
+    # stored without value to distinguish them from None
+    NULL, NUMBER, TEXT, OTHER = 0, 1, 2, 3
+
+    experiment_id = IntegerField(index=True)
+    section = CharField()
+    key = CharField()
+    kind = IntegerField()
+    number = FloatField(null=True)
+    text = TextField(null=True)
+
+    class Meta:
+        indexes = (
+            (("key", "section", "number"), False),
+            (("key", "section", "text"), False),
+        )
+
+    @staticmethod
+    def rows(experiment, identifier):
+        # Rows (experiment_id, section, key, kind, number, text)
+        schema = experiment._schema
+        for section in ("config", "parameters", "result"):
+            values = getattr(experiment, section).values
+            for key, parameter in getattr(schema, section).items():
+                if key.startswith("@"):
+                    continue
+                value = values[key] if key in values else parameter.default
+                if value is None:
+                    continue
+                kind, number, text = ExperimentValue.OTHER, None, None
+                if isinstance(value, (bool, int, float)):
+                    try:
+                        kind, number = ExperimentValue.NUMBER, float(value)
+                    except OverflowError:
+                        pass
+                elif isinstance(value, str):
+                    kind, text = ExperimentValue.TEXT, value
+                yield identifier, section, key, kind, number, text
+
+    @staticmethod
+    def holds_for_none(f):
+        if f.operator is None:
+            result = False
+        elif f.operator == "=":
+            result = f.value is None
+        elif f.operator == "!=":
+            result = f.value is not None
+        else:
+            # Comparing None raises an error, which is left to the check in Python
+            return False
+        return result != f.negated
+
+    @staticmethod
+    def holds(f):
+        # Selects values for which the filter certainly holds, values that are not
+        # indexed (e.g., lists) or cannot be compared are never selected and have to be
+        # checked in Python (values that are None are not stored, see holds_for_none)
+        kind, number, text = (
+            ExperimentValue.kind,
+            ExperimentValue.number,
+            ExperimentValue.text,
+        )
+        operator, value = f.operator, f.value
+        if operator is None:
+            truthy = ((kind == ExperimentValue.NUMBER) & (number != 0)) | (
+                (kind == ExperimentValue.TEXT) & (text != "")
+            )
+            falsy = (
+                (kind == ExperimentValue.NULL)
+                | ((kind == ExperimentValue.NUMBER) & (number == 0))
+                | ((kind == ExperimentValue.TEXT) & (text == ""))
+            )
+            return falsy if f.negated else truthy
+
+        if operator in ("=", "!="):
+            # Python considers values of different kinds unequal, NaN is stored as NULL
+            # and never selected
+            known = kind != ExperimentValue.OTHER
+            if value is None:
+                equal = kind == ExperimentValue.NULL
+                different = known & (kind != ExperimentValue.NULL)
+            elif isinstance(value, str):
+                equal = (kind == ExperimentValue.TEXT) & (text == value)
+                different = known & ((kind != ExperimentValue.TEXT) | (text != value))
+            else:
+                equal = (kind == ExperimentValue.NUMBER) & (number == value)
+                different = known & (
+                    (kind != ExperimentValue.NUMBER) | (number != value)
+                )
+            return equal if (operator == "=") != f.negated else different
+
+        negated_operators = {"<": ">=", ">": "<=", "<=": ">", ">=": "<"}
+        if f.negated:
+            operator = negated_operators[operator]
+        if operator == "<":
+            comparison = number < value
+        elif operator == ">":
+            comparison = number > value
+        elif operator == "<=":
+            comparison = number <= value
+        else:
+            comparison = number >= value
+        return (kind == ExperimentValue.NUMBER) & comparison
 
 
 class Run(BaseModel):
     number = IntegerField()
 
 
+class CachedResult(BaseModel):
+    """
+    Results of experiments with caching enabled, by fingerprint and code version (see
+    Experiment.code_version).
+    """
+
+    fingerprint = CharField()
+    version = CharField()
+    experiment_id = IntegerField(null=True)
+    values = PickleField()
+
+    class Meta:
+        indexes = ((("fingerprint", "version"), True),)
+
+
+class Trace(BaseModel):
+    """
+    Values reported while running an experiment (see Experiment.report), stored in
+    chunks of float arrays.
+    """
+
+    experiment_id = IntegerField(index=True)
+    name = CharField()
+    times = BlobField()
+    values = BlobField()
+
+
+class Profile(BaseModel):
+    """
+    Compressed CPU or memory profiles of experiment runs (see the config option
+    @profile).
+    """
+
+    experiment_id = IntegerField(index=True)
+    kind = CharField()
+    data = BlobField()
+
+
+class Checkpoint(BaseModel):
+    """
+    The last state checkpointed by a running experiment, by group, fingerprint and code
+    version.
+    """
+
+    group = CharField()
+    fingerprint = CharField()
+    version = CharField()
+    experiment_id = IntegerField(null=True)
+    state = PickleField()
+
+    class Meta:
+        indexes = ((("group", "fingerprint", "version"), True),)
+
+
 def class_name(cls):
     return cls.__name__
 
 
+def fingerprint_or_none(fingerprint):
+    # Experiments with values that cannot be fingerprinted are stored, but never matched
+    try:
+        return fingerprint()
+    except ValueError:
+        return None
+
+
 class SqliteStorage(Storage):
-    def __init__(self):
-        database.connect(reuse_if_open=True)
-        database.create_tables([ExperimentModel, Run], safe=True)
-        database.close()
+    # SQLite allows at most 999 bound variables per statement (in older versions)
+    MAX_VARIABLES = 999
 
-    def save(self, experiment):
-        if experiment.storage == self and experiment.identifier:
-            model = ExperimentModel.get_by_id(experiment.identifier)
-            model.group = experiment.group
-            model.config = experiment.config.values
-            model.parameters = experiment.parameters.values
-            model.result = experiment.result.values
-            model.derived = experiment.derived
-            model.save()
+    def __init__(self, filename=None, concurrent=False, busy_timeout=None):
+        # Concurrent mode uses write-ahead logging so readers (e.g. analysis) do not
+        # block running experiments, writes wait up to busy_timeout seconds for the lock
+        # (and are then retried with a backoff)
+        self.filename = filename
+        self.concurrent = concurrent
+        # Experiments of which only some sections were loaded, they cannot be saved
+        self.partial = weakref.WeakSet()
+        self.busy_timeout = (
+            DEFAULT_BUSY_TIMEOUT if busy_timeout is None else float(busy_timeout)
+        )
+        self.database = SqliteDatabase(None)
+        self.configure()
+        with self.bound():
+            self.migrate([ExperimentModel])
+            if self.database.table_exists(Checkpoint._meta.table_name):
+                # Checkpoints stored before they were kept per group cannot be
+                # attributed to a group
+                columns = self.database.get_columns(Checkpoint._meta.table_name)
+                if "group" not in {c.name for c in columns}:
+                    self.database.drop_tables([Checkpoint])
+            self.database.create_tables(
+                [
+                    ExperimentModel,
+                    ExperimentValue,
+                    Run,
+                    CachedResult,
+                    Checkpoint,
+                    Trace,
+                    Profile,
+                ],
+                safe=True,
+            )
+        self.database.close()
+
+    def migrate(self, models):
+        # Adds columns that were introduced after the tables had been created
+        migrator = SqliteMigrator(self.database)
+        for model in models:
+            table = model._meta.table_name
+            if not self.database.table_exists(table):
+                continue
+            columns = {c.name for c in self.database.get_columns(table)}
+            for field in model._meta.sorted_fields:
+                if field.column_name not in columns:
+                    try:
+                        migrate(migrator.add_column(table, field.column_name, field))
+                    except OperationalError as e:
+                        # Another process might have added the column concurrently
+                        if "duplicate column" not in str(e):
+                            raise
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["partial"]
+        del state["database"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.partial = weakref.WeakSet()
+        self.database = SqliteDatabase(None)
+        self.configure()
+
+    def configure(self):
+        filename = self.filename or default_filename()
+        if self.concurrent:
+            pragmas = [
+                ("journal_mode", "wal"),
+                ("synchronous", "normal"),
+                ("busy_timeout", int(self.busy_timeout * 1000)),
+            ]
+            timeout = self.busy_timeout
+        else:
+            pragmas, timeout = [], 5
+        self.database.init(filename, pragmas=pragmas, timeout=timeout)
+        _databases.add(self.database)
+
+    @contextmanager
+    def bound(self):
+        """
+        Binds the models to the database of this storage in the current thread, e.g., to
+        query them directly.
+        """
+        previous = database.obj
+        database.initialize(self.database)
+        try:
+            yield self
+        finally:
+            database.initialize(previous)
 
+    def get_options(self):
+        options = dict()
+        if self.filename:
+            options["filename"] = self.filename
+        if self.concurrent:
+            options["concurrent"] = 1
+            if self.busy_timeout != DEFAULT_BUSY_TIMEOUT:
+                options["busy_timeout"] = self.busy_timeout
+        return options
+
+    @staticmethod
+    def from_options(options):
+        return SqliteStorage(
+            filename=options.get("filename"),
+            concurrent=bool(int(options.get("concurrent", 0))),
+            busy_timeout=options.get("busy_timeout"),
+        )
+
+    def write_transaction(self):
+        # Deferred transactions that start reading and then upgrade to writing fail
+        # immediately (without waiting for the busy timeout) when another connection is
+        # writing in WAL mode
+        return self.database.atomic("IMMEDIATE")
+
+    def in_transaction(self):
+        return self.database.in_transaction()
+
+    @contextmanager
+    def snapshot(self):
+        """
+        Provides a consistent view of the database: all reads within the context observe
+        the same database state. Only available in concurrent mode, otherwise the
+        snapshot would block experiments from writing results.
+        """
+        if not self.concurrent:
+            yield self
+            return
+        with self.database.atomic("DEFERRED"):
+            # The snapshot is only established by the first read
+            self.database.execute_sql("SELECT COUNT(*) FROM run")
+            yield self
+
+    @staticmethod
+    def to_row(experiment):
+        return {
+            "cls_name": class_name(experiment.__class__),
+            "group": experiment.group,
+            "config": experiment.config.values,
+            "parameters": experiment.parameters.values,
+            "result": experiment.result.values,
+            "derived": experiment.derived,
+            "dependencies": experiment.dependencies,
+            "fingerprint": fingerprint_or_none(experiment.run_fingerprint),
+            "setting": fingerprint_or_none(experiment.run_setting),
+            "indexed": True,
+        }
+
+    def check_saveable(self, experiment):
+        if experiment in self.partial:
+            raise ValueError("Experiment was only partially loaded")
+        elif experiment.storage == self and experiment.identifier:
+            return True
         elif (
-            not experiment.storage or experiment == self
+            not experiment.storage or experiment.storage == self
         ) and not experiment.identifier:
-            cls = class_name(experiment.__class__)
-            model = ExperimentModel.create(
-                cls_name=cls,
-                group=experiment.group,
-                config=experiment.config.values,
-                parameters=experiment.parameters.values,
-                result=experiment.result.values,
-                derived=experiment.derived,
-            )
+            return False
+        elif experiment.storage != self:
+            raise ValueError("Experiment comes from a different storage")
+        else:
+            raise ValueError("Experiment is partially instantiated")
+
+    @retry_locked
+    @uses_database
+    def save(self, experiment):
+        with self.write_transaction():
+            self.save_single(experiment)
+
+    @uses_database
+    def save_single(self, experiment):
+        if self.check_saveable(experiment):
+            model = ExperimentModel.get_by_id(experiment.identifier)
+            for key, value in self.to_row(experiment).items():
+                setattr(model, key, value)
+            model.save()
+            self.save_values([(experiment, model.id)], replace=True)
+        else:
+            model = ExperimentModel.create(**self.to_row(experiment))
+            self.save_values([(experiment, model.id)])
             experiment.storage = self
             experiment.identifier = model.id
-        else:
-            if experiment != self:
-                raise ValueError("Experiment comes from a different storage")
-            else:
-                raise ValueError("Experiment is partially instantiated")
+
+    @uses_database
+    def save_values(self, experiments, replace=False):
+        if replace:
+            ExperimentValue.delete().where(
+                ExperimentValue.experiment_id.in_([i for _, i in experiments])
+            ).execute()
+        rows = (
+            row
+            for experiment, identifier in experiments
+            for row in ExperimentValue.rows(experiment, identifier)
+        )
+        # Building queries is the bottleneck of saving many experiments, the rows are
+        # inserted by a single prepared statement instead
+        self.database.cursor().executemany(
+            'INSERT INTO {} ("experiment_id", "section", "key", "kind", "number", '
+            '"text") VALUES (?, ?, ?, ?, ?, ?)'.format(
+                ExperimentValue._meta.table_name
+            ),
+            rows,
+        )
+
+    @retry_locked
+    @uses_database
+    def save_many(self, experiments):
+        existing, new = [], []
+        for experiment in experiments:
+            (existing if self.check_saveable(experiment) else new).append(experiment)
+
+        with self.write_transaction():
+            for experiment in existing:
+                self.save_single(experiment)
+
+            batch_size = self.MAX_VARIABLES // len(ExperimentModel._meta.fields)
+            identifiers = []
+            for batch in chunked(new, batch_size):
+                rows = [self.to_row(experiment) for experiment in batch]
+                # While holding the write lock, SQLite assigns consecutive ids to the
+                # rows of a single insert (it only falls back to random ids once the
+                # largest possible id is in use)
+                last_id = ExperimentModel.insert_many(rows).execute()
+                identifiers += range(last_id - len(rows) + 1, last_id + 1)
+            self.save_values(zip(new, identifiers))
+
+        for experiment, identifier in zip(new, identifiers):
+            experiment.storage = self
+            experiment.identifier = identifier
+
+    @retry_locked
+    @uses_database
+    def save_derived(self, experiments):
+        # Only the derived values are written, such that results that are stored
+        # concurrently are not overwritten
+        for experiment in experiments:
+            if experiment.storage != self or not experiment.identifier:
+                raise ValueError("Experiment is not stored in this storage")
+        with self.write_transaction():
+            for experiment in experiments:
+                ExperimentModel.update(
+                    derived=experiment.derived, dependencies=experiment.dependencies
+                ).where(ExperimentModel.id == experiment.identifier).execute()
+
+    SECTIONS = ("config", "parameters", "result", "derived")
 
     def transform(self, cls, model):
-        experiment = cls(model.group, self, identifier=model.id)
-        for key, value in model.config.items():
-            experiment.config[key] = value
-        for key, value in model.parameters.items():
-            experiment.parameters[key] = value
-        for key, value in model.result.items():
-            experiment.result[key] = value
-        for key, value in model.derived.items():
-            experiment.derived[key] = value
+        sections = {s: getattr(model, s) for s in self.SECTIONS}
+        sections["dependencies"] = model.dependencies
+        sections["fingerprint"], sections["setting"] = model.fingerprint, model.setting
+        return self.build(cls, model.id, model.group, sections)
+
+    def build(self, cls, identifier, group, sections):
+        experiment = cls(group, self, identifier=identifier)
+        # Unpickled sections are not shared with anything else, so they can be used
+        # directly
+        experiment.config.load_values(sections.get("config", {}))
+        experiment.parameters.load_values(sections.get("parameters", {}))
+        experiment.result.load_values(sections.get("result", {}))
+        experiment.derived = sections.get("derived", {})
+        experiment.dependencies = sections.get("dependencies") or {}
+        # The stored fingerprints were fixed before the experiment ran (see
+        # Experiment.run_fingerprint), they are kept when it is saved again
+        if sections.get("fingerprint") is not None:
+            experiment._run_fingerprint = sections["fingerprint"]
+            experiment._run_setting = sections.get("setting")
+        if any(s not in sections for s in self.SECTIONS):
+            self.partial.add(experiment)
         return experiment
 
+    @uses_database
     def get_experiment(self, cls, identifier):
         model = ExperimentModel.get_by_id(identifier)
         if class_name(cls) == model.cls_name:
@@ -95,46 +609,489 @@ class SqliteStorage(Storage):
                 )
             )
 
-    def get_experiments(self, cls, group=None):
+    def get_experiments(self, cls, group=None, exclude=None, where=None):
+        return list(self.iter_experiments(cls, group, exclude=exclude, where=where))
+
+    def iter_experiments(
+        self, cls, group=None, fields=None, batch_size=1000, exclude=None, where=None
+    ):
         cls_name = class_name(cls)
+        query = ExperimentModel.select().where(ExperimentModel.cls_name == cls_name)
         if group:
-            return list(
-                map(
-                    partial(self.transform, cls),
-                    ExperimentModel.select().where(
-                        ExperimentModel.cls_name == cls_name,
-                        ExperimentModel.group == group,
-                    ),
+            query = query.where(ExperimentModel.group == group)
+
+        exclude = list(exclude or []) + ["~{}".format(w) for w in where or []]
+        prototype = cls("")
+        for filter_string in exclude:
+            if callable(filter_string):
+                fields = None
+                continue
+            f = parse_filter(str(filter_string))
+            if fields is not None:
+                fields = list(fields) + [f.name]
+            try:
+                section, key = prototype.resolve(f.name)
+            except (ValueError, IndexError):
+                continue
+            if (
+                f.name in SPECIAL_PROPERTIES
+                or "__" in f.name
+                or section == "derived"
+                or key.startswith("@")
+            ):
+                continue
+            stored = ExperimentValue.select(ExperimentValue.experiment_id).where(
+                ExperimentValue.key == key, ExperimentValue.section == section
+            )
+            excluded = stored.where(ExperimentValue.holds(f))
+            query = query.where(ExperimentModel.id.not_in(excluded))
+            default = getattr(prototype, section).parameters[key].default
+            if ExperimentValue.holds_for_none(f) and default is None:
+                # Values that are None are not stored, so experiments without a stored
+                # value are excluded (if all their values were indexed)
+                query = query.where(
+                    ExperimentModel.indexed.is_null() | ExperimentModel.id.in_(stored)
+                )
+
+        sections = self.get_sections(prototype, fields)
+        if "derived" in sections:
+            sections += ("dependencies",)
+        sections += ("fingerprint", "setting")
+        columns = [getattr(ExperimentModel, section) for section in sections]
+        query = query.select(ExperimentModel.id, ExperimentModel.group, *columns)
+
+        # Keyset pagination keeps memory flat and does not hold a read cursor open while
+        # experiments are processed
+        last_id = 0
+        while True:
+            # The experiments are yielded outside of the binding, the caller might
+            # use another storage meanwhile
+            with self.bound():
+                rows = list(
+                    query.where(ExperimentModel.id > last_id)
+                    .order_by(ExperimentModel.id)
+                    .limit(batch_size)
+                    .tuples()
+                )
+            for row in rows:
+                experiment = self.build(
+                    cls, row[0], row[1], dict(zip(sections, row[2:]))
                 )
+                # Filters are checked again on the remaining experiments, e.g., for
+                # values that are not indexed
+                if not is_excluded(experiment, exclude):
+                    yield experiment
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def get_sections(self, prototype, fields):
+        # Determines which serialized sections have to be loaded to compute the given
+        # properties
+        if fields is None:
+            return self.SECTIONS
+        sections = set()
+        for name in fields:
+            parts = name.split("__")
+            name = parts[0]
+            if name in SPECIAL_PROPERTIES or trace_time(parts[-1]) is not None:
+                # Traces are stored separately
+                continue
+            if name in self.SECTIONS:
+                sections.add(name)
+                continue
+            try:
+                section, key = prototype.resolve(name)
+            except (ValueError, IndexError):
+                return self.SECTIONS
+            if section == "derived":
+                # Derived values can depend on anything
+                return self.SECTIONS
+            sections.add(section)
+        return tuple(s for s in self.SECTIONS if s in sections)
+
+    @uses_database
+    def get_identifiers(self, cls, group, settings):
+        self.add_fingerprints(cls, group)
+        identifiers = dict()
+        for batch in chunked(set(settings), self.MAX_VARIABLES - 2):
+            query = (
+                ExperimentModel.select(ExperimentModel.id, ExperimentModel.setting)
+                .where(
+                    ExperimentModel.cls_name == class_name(cls),
+                    ExperimentModel.group == group,
+                    ExperimentModel.setting.in_(batch),
+                )
+                .order_by(ExperimentModel.id.desc())
+                .tuples()
             )
-        else:
-            return list(
-                map(
-                    partial(self.transform, cls),
-                    ExperimentModel.select().where(
-                        ExperimentModel.cls_name == cls_name
-                    ),
+            # Ordered descending, so the first experiment with a given setting is kept
+            identifiers.update((setting, i) for i, setting in query)
+        return identifiers
+
+    @retry_locked
+    @uses_database
+    def add_fingerprints(self, cls, group):
+        # Computes fingerprints for experiments stored before fingerprints (of settings)
+        # were introduced
+        query = ExperimentModel.select(
+            ExperimentModel.id,
+            ExperimentModel.group,
+            ExperimentModel.config,
+            ExperimentModel.parameters,
+        ).where(
+            ExperimentModel.cls_name == class_name(cls),
+            ExperimentModel.group == group,
+            ExperimentModel.setting.is_null(),
+        )
+        if not query.exists():
+            return
+        rows = list(query.tuples())
+        with self.write_transaction():
+            for identifier, group, config, parameters in rows:
+                experiment = self.build(
+                    cls, identifier, group, {"config": config, "parameters": parameters}
                 )
+                ExperimentModel.update(
+                    fingerprint=fingerprint_or_none(experiment.fingerprint),
+                    setting=fingerprint_or_none(experiment.setting_fingerprint),
+                ).where(ExperimentModel.id == identifier).execute()
+
+    @uses_database
+    def get_runtimes(self, cls, fingerprints, group=None):
+        # @-options are not indexed (see ExperimentValue), so the results of the
+        # experiments with the given fingerprints are loaded
+        values = dict()
+        for batch in chunked(set(fingerprints), self.MAX_VARIABLES - 2):
+            query = ExperimentModel.select(
+                ExperimentModel.fingerprint, ExperimentModel.result
+            ).where(
+                ExperimentModel.cls_name == class_name(cls),
+                ExperimentModel.fingerprint.in_(batch),
+            )
+            if group is not None:
+                query = query.where(ExperimentModel.group == group)
+            for fingerprint, result in query.tuples():
+                runtime = result.get("@runtime_wall")
+                if runtime is not None:
+                    values.setdefault(fingerprint, []).append(runtime)
+        return {f: sum(v) / len(v) for f, v in values.items()}
+
+    @retry_locked
+    @uses_database
+    def get_cached_result(self, fingerprint, version):
+        cached = CachedResult.get_or_none(
+            (CachedResult.fingerprint == fingerprint)
+            & (CachedResult.version == version)
+        )
+        return None if cached is None else (cached.experiment_id, cached.values)
+
+    @retry_locked
+    @uses_database
+    def cache_result(self, fingerprint, version, experiment_id, values):
+        CachedResult.insert(
+            fingerprint=fingerprint,
+            version=version,
+            experiment_id=experiment_id,
+            values=values,
+        ).on_conflict_replace().execute()
+
+    @retry_locked
+    @uses_database
+    def save_profile(self, experiment_id, kind, data):
+        with self.write_transaction():
+            Profile.delete().where(
+                (Profile.experiment_id == experiment_id) & (Profile.kind == kind)
+            ).execute()
+            Profile.create(experiment_id=experiment_id, kind=kind, data=data)
+
+    @uses_database
+    def get_profiles(self, experiment_ids, kind):
+        profiles = []
+        for batch in chunked(experiment_ids, self.MAX_VARIABLES - 1):
+            query = Profile.select(Profile.data).where(
+                Profile.experiment_id.in_(batch), Profile.kind == kind
             )
+            profiles += [bytes(data) for data, in query.tuples()]
+        return profiles
+
+    @retry_locked
+    @uses_database
+    def save_checkpoint(self, group, fingerprint, version, experiment_id, state):
+        Checkpoint.insert(
+            group=group,
+            fingerprint=fingerprint,
+            version=version,
+            experiment_id=experiment_id,
+            state=state,
+        ).on_conflict_replace().execute()
+
+    @retry_locked
+    @uses_database
+    def load_checkpoint(self, group, fingerprint, version):
+        checkpoint = Checkpoint.get_or_none(
+            (Checkpoint.group == group)
+            & (Checkpoint.fingerprint == fingerprint)
+            & (Checkpoint.version == version)
+        )
+        return None if checkpoint is None else checkpoint.state
 
+    @retry_locked
+    @uses_database
+    def remove_checkpoint(self, group, fingerprint, version):
+        Checkpoint.delete().where(
+            (Checkpoint.group == group)
+            & (Checkpoint.fingerprint == fingerprint)
+            & (Checkpoint.version == version)
+        ).execute()
+
+    @retry_locked
+    @uses_database
+    def save_traces(self, experiment_id, traces):
+        with self.write_transaction():
+            for name, (times, values) in traces.items():
+                Trace.create(
+                    experiment_id=experiment_id,
+                    name=name,
+                    times=times.tobytes(),
+                    values=values.tobytes(),
+                )
+
+    @uses_database
+    def get_traces(self, experiment_id):
+        traces = dict()
+        for trace in (
+            Trace.select()
+            .where(Trace.experiment_id == experiment_id)
+            .order_by(Trace.id)
+        ):
+            times, values = traces.setdefault(trace.name, (array("d"), array("d")))
+            times.frombytes(trace.times)
+            values.frombytes(trace.values)
+        return traces
+
+    @retry_locked
+    @uses_database
+    def enqueue(self, experiment_ids):
+        with self.write_transaction():
+            for batch in chunked(experiment_ids, self.MAX_VARIABLES - 4):
+                ExperimentModel.update(
+                    queued=True, lease_owner=None, lease_expires=None, attempts=0
+                ).where(ExperimentModel.id.in_(batch)).execute()
+
+    def queue_condition(self, classes, group=None):
+        query = ExperimentModel.queued & ExperimentModel.cls_name.in_(
+            [class_name(cls) for cls in classes]
+        )
+        if group:
+            query &= ExperimentModel.group == group
+        return query
+
+    @retry_locked
+    @uses_database
+    def claim(self, classes, owner, lease, group=None):
+        # Leases expire at epoch times, so clocks of machines that share the storage
+        # have to be synchronized
+        now = time.time()
+        with self.write_transaction():
+            available = (
+                self.queue_condition(classes, group)
+                & (
+                    ExperimentModel.lease_expires.is_null()
+                    | (ExperimentModel.lease_expires < now)
+                )
+                & (fn.COALESCE(ExperimentModel.attempts, 0) < MAX_ATTEMPTS)
+            )
+            row = (
+                ExperimentModel.select(ExperimentModel.id, ExperimentModel.cls_name)
+                .where(available)
+                .order_by(ExperimentModel.id)
+                .limit(1)
+                .tuples()
+                .first()
+            )
+            if row is None:
+                return None
+            ExperimentModel.update(
+                lease_owner=owner,
+                lease_expires=now + lease,
+                attempts=fn.COALESCE(ExperimentModel.attempts, 0) + 1,
+            ).where(ExperimentModel.id == row[0]).execute()
+        return next(cls for cls in classes if class_name(cls) == row[1]), row[0]
+
+    @retry_locked
+    @uses_database
+    def abandon(self, classes, group=None):
+        now = time.time()
+        with self.write_transaction():
+            query = ExperimentModel.select(
+                ExperimentModel.id, ExperimentModel.cls_name
+            ).where(
+                self.queue_condition(classes, group)
+                & (
+                    ExperimentModel.lease_expires.is_null()
+                    | (ExperimentModel.lease_expires < now)
+                )
+                & (ExperimentModel.attempts >= MAX_ATTEMPTS)
+            )
+            rows = list(query.tuples())
+            for batch in chunked([i for i, _ in rows], self.MAX_VARIABLES - 3):
+                ExperimentModel.update(
+                    queued=None, lease_owner=None, lease_expires=None
+                ).where(ExperimentModel.id.in_(batch)).execute()
+        classes = {class_name(cls): cls for cls in classes}
+        return [(classes[name], identifier) for identifier, name in rows]
+
+    @retry_locked
+    @uses_database
+    def renew_lease(self, experiment_id, owner, lease):
+        query = ExperimentModel.update(lease_expires=time.time() + lease).where(
+            ExperimentModel.id == experiment_id,
+            ExperimentModel.lease_owner == owner,
+            ExperimentModel.queued,
+        )
+        return query.execute() > 0
+
+    @retry_locked
+    @uses_database
+    def release(self, experiment_id, owner):
+        query = ExperimentModel.update(
+            queued=None, lease_owner=None, lease_expires=None
+        ).where(
+            ExperimentModel.id == experiment_id,
+            ExperimentModel.lease_owner == owner,
+            ExperimentModel.queued,
+        )
+        return query.execute() > 0
+
+    @uses_database
+    def count_queued(self, classes, group=None):
+        return (
+            ExperimentModel.select().where(self.queue_condition(classes, group)).count()
+        )
+
+    @retry_locked
+    @uses_database
     def remove(self, group, experiment_id=None, dry_run=False):
         if experiment_id:
             query = ExperimentModel.delete().where(
                 ExperimentModel.group == group, ExperimentModel.id == experiment_id
             )
+            removed = [experiment_id]
         else:
             query = ExperimentModel.delete().where(ExperimentModel.group == group)
+            removed = ExperimentModel.select(ExperimentModel.id).where(
+                ExperimentModel.group == group
+            )
+        values = ExperimentValue.delete().where(
+            ExperimentValue.experiment_id.in_(removed)
+        )
+        traces = Trace.delete().where(Trace.experiment_id.in_(removed))
+        profiles = Profile.delete().where(Profile.experiment_id.in_(removed))
         if dry_run:
             print(query)
         else:
-            query.execute()
+            with self.write_transaction():
+                if not isinstance(removed, list):
+                    removed = [i for i, in removed.tuples()]
+                values.execute()
+                traces.execute()
+                profiles.execute()
+                query.execute()
+            for identifier in removed:
+                path = self.log_path(identifier)
+                if os.path.exists(path):
+                    os.remove(path)
 
-    @database.atomic("EXCLUSIVE")
+    def merge(self, filename):
+        """
+        Copies the experiments (with their values, traces and profiles), runs, cached
+        results and checkpoints of another SQLite file, e.g., of a machine that ran one
+        shard of a trajectory.  Copied experiments get new identifiers and their runs
+        new numbers, cached results and checkpoints that exist already are kept.
+        """
+        # Creates or migrates the tables of the other file
+        SqliteStorage(filename)
+        self.database.connect(reuse_if_open=True)
+        self.database.execute_sql(
+            "ATTACH DATABASE ? AS source", (os.path.abspath(filename),)
+        )
+        try:
+            return self.merge_attached()
+        finally:
+            self.database.execute_sql("DETACH DATABASE source")
+
+    @retry_locked
+    @uses_database
+    def merge_attached(self, batch_size=1000):
+        with self.write_transaction():
+            id_offset = ExperimentModel.select(fn.MAX(ExperimentModel.id)).scalar() or 0
+            run_offset = Run.select(fn.MAX(Run.number)).scalar() or 0
+            self.database.execute_sql(
+                "INSERT INTO run (number) SELECT number + ? FROM source.run",
+                (run_offset,),
+            )
+
+            fields = ExperimentModel._meta.sorted_fields
+            columns = ", ".join('"{}"'.format(f.column_name) for f in fields)
+            count, last_id = 0, 0
+            while True:
+                rows = self.database.execute_sql(
+                    "SELECT {} FROM source.{} WHERE id > ? ORDER BY id LIMIT ?".format(
+                        columns, ExperimentModel._meta.table_name
+                    ),
+                    (last_id, batch_size),
+                ).fetchall()
+                if len(rows) == 0:
+                    break
+                last_id = rows[-1][0]
+                models = []
+                for row in rows:
+                    model = {
+                        f.name: f.python_value(value) for f, value in zip(fields, row)
+                    }
+                    model["id"] += id_offset
+                    if (model["config"].get("@run.count") or 0) > 0:
+                        model["config"]["@run.count"] += run_offset
+                    models.append(model)
+                for batch in chunked(models, self.MAX_VARIABLES // len(fields)):
+                    ExperimentModel.insert_many(batch).execute()
+                count += len(rows)
+
+            for model in (ExperimentValue, Trace, Profile, CachedResult, Checkpoint):
+                columns = [
+                    f.column_name for f in model._meta.sorted_fields if f.name != "id"
+                ]
+                values = ['"{}"'.format(c) for c in columns]
+                values[columns.index("experiment_id")] = "experiment_id + {}".format(
+                    id_offset
+                )
+                self.database.execute_sql(
+                    "INSERT OR IGNORE INTO {table} ({columns}) SELECT {values} "
+                    "FROM source.{table}".format(
+                        table=model._meta.table_name,
+                        columns=", ".join('"{}"'.format(c) for c in columns),
+                        values=", ".join(values),
+                    )
+                )
+        return count
+
+    @retry_locked
+    @uses_database
     def get_new_run(self):
-        counts = [m.number for m in Run.select()]
-        max_run = max(counts) + 1 if len(counts) > 0 else 1
-        Run.create(number=max_run)
+        with self.database.atomic("EXCLUSIVE"):
+            counts = [m.number for m in Run.select()]
+            max_run = max(counts) + 1 if len(counts) > 0 else 1
+            Run.create(number=max_run)
         return max_run
 
+    @uses_database
     def get_groups(self):
         return sorted(set(m.group for m in ExperimentModel.select()))
+
+    def log_path(self, experiment_id):
+        # Logs are stored next to the database file
+        filename = os.path.abspath(self.filename or default_filename())
+        return os.path.join(
+            os.path.splitext(filename)[0] + "_logs", "{}.log".format(experiment_id)
+        )
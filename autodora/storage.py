@@ -1,7 +1,14 @@
 import importlib
-from typing import List, TYPE_CHECKING, Optional, Type
+import os
+import time
+from array import array
+from contextlib import contextmanager
+from urllib.parse import urlencode, parse_qsl
+from typing import List, TYPE_CHECKING, Optional, Type, Iterator, Dict, Tuple, Any
 
-from .settings import DEFAULT_STORAGE
+from .logs import capture_output
+from .resources import memory_limit
+from .settings import DEFAULT_STORAGE, DISPATCH_TIME_VARIABLE
 
 if TYPE_CHECKING:
     from .experiment import Experiment
@@ -11,31 +18,180 @@ class Storage(object):
     def save(self, experiment):
         raise NotImplementedError()
 
+    def save_many(self, experiments):
+        # type: (List[Experiment]) -> None
+        for experiment in experiments:
+            self.save(experiment)
+
+    def save_derived(self, experiments):
+        # type: (List[Experiment]) -> None
+        self.save_many(experiments)
+
+    def in_transaction(self):
+        # type: () -> bool
+        """
+        Whether this process is currently writing to the storage (within a transaction).
+        """
+        return False
+
     def get_experiment(self, cls, identifier):
         # type: (Type, int) -> Experiment
         raise NotImplementedError()
 
-    def get_experiments(self, cls, group=None):
-        # type: (Type, Optional[str]) -> List[Experiment]
+    def get_experiments(self, cls, group=None, exclude=None, where=None):
+        # type: (Type, Optional[str], Optional[List], Optional[List[str]]) -> List[Experiment]
+        raise NotImplementedError()
+
+    def iter_experiments(
+        self, cls, group=None, fields=None, batch_size=1000, exclude=None, where=None
+    ):
+        # type: (Type, Optional[str], Optional[List[str]], int, Optional[List], Optional[List[str]]) -> Iterator[Experiment]
+        return iter(self.get_experiments(cls, group, exclude=exclude, where=where))
+
+    def get_identifiers(self, cls, group, settings):
+        # type: (Type, str, List[str]) -> Dict[str, int]
+        settings = set(settings)
+        identifiers = dict()
+        for experiment in reversed(self.get_experiments(cls, group)):
+            setting = experiment.run_setting()
+            if setting in settings:
+                identifiers[setting] = experiment.identifier
+        return identifiers
+
+    def get_runtimes(self, cls, fingerprints, group=None):
+        # type: (Type, List[str], Optional[str]) -> Dict[str, float]
+        """
+        Returns the average (wall clock) runtime of the completed experiments with the
+        given fingerprints, in the given group (or in any group), if known.
+        """
+        return dict()
+
+    def get_cached_result(self, fingerprint, version):
+        # type: (str, str) -> Optional[Tuple[Optional[int], Dict[str, Dict[str, Any]]]]
+        """
+        Returns the identifier of the experiment that produced the cached values and the
+        values, if available.
+        """
+        return None
+
+    def cache_result(self, fingerprint, version, experiment_id, values):
+        # type: (str, str, Optional[int], Dict[str, Dict[str, Any]]) -> None
+        pass
+
+    def save_traces(self, experiment_id, traces):
+        # type: (int, Dict[str, Tuple[array, array]]) -> None
+        """
+        Appends the given samples (times and values) to the stored traces of the
+        experiment.
+        """
+        raise NotImplementedError()
+
+    def get_traces(self, experiment_id):
+        # type: (int) -> Dict[str, Tuple[array, array]]
+        raise NotImplementedError()
+
+    def save_profile(self, experiment_id, kind, data):
+        # type: (int, str, bytes) -> None
+        """
+        Stores the compressed profile of the experiment (replacing an earlier profile of
+        the same kind).
+        """
+        raise NotImplementedError()
+
+    def get_profiles(self, experiment_ids, kind):
+        # type: (List[int], str) -> List[bytes]
+        raise NotImplementedError()
+
+    def save_checkpoint(self, group, fingerprint, version, experiment_id, state):
+        # type: (str, str, str, Optional[int], Any) -> None
+        pass
+
+    def load_checkpoint(self, group, fingerprint, version):
+        # type: (str, str, str) -> Any
+        return None
+
+    def remove_checkpoint(self, group, fingerprint, version):
+        # type: (str, str, str) -> None
+        pass
+
+    def enqueue(self, experiment_ids):
+        # type: (List[int]) -> None
+        """
+        Queues the experiments, such that workers can claim them (see work_queue.work).
+        """
+        raise NotImplementedError()
+
+    def claim(self, classes, owner, lease, group=None):
+        # type: (List[Type], str, float, Optional[str]) -> Optional[Tuple[Type, int]]
+        """
+        Atomically claims a queued experiment that is not leased (or whose lease has
+        expired) for lease seconds, returns its class and identifier or None if no
+        experiment is available.
+        """
+        raise NotImplementedError()
+
+    def abandon(self, classes, group=None):
+        # type: (List[Type], Optional[str]) -> List[Tuple[Type, int]]
+        """
+        Removes the experiments from the queue that were claimed too often (see
+        settings.MAX_ATTEMPTS) without being run, e.g., because they crash their
+        workers, returns their classes and identifiers.
+        """
+        raise NotImplementedError()
+
+    def renew_lease(self, experiment_id, owner, lease):
+        # type: (int, str, float) -> bool
+        """Extends the lease of the owner, returns False if the owner lost the lease."""
+        raise NotImplementedError()
+
+    def release(self, experiment_id, owner):
+        # type: (int, str) -> bool
+        """Removes a claimed experiment from the queue after it was run."""
+        raise NotImplementedError()
+
+    def count_queued(self, classes, group=None):
+        # type: (List[Type], Optional[str]) -> int
+        """Returns the number of queued experiments, including claimed experiments."""
         raise NotImplementedError()
 
     def remove(self, group, experiment_id=None, dry_run=False):
         raise NotImplementedError()
 
+    def merge(self, filename):
+        # type: (str) -> int
+        """
+        Copies all experiments of another storage (file) into this storage, returns the
+        number of experiments.
+        """
+        raise NotImplementedError()
+
     def get_groups(self):
         # type: () -> List[str]
         raise NotImplementedError()
 
+    def log_path(self, experiment_id):
+        # type: (int) -> Optional[str]
+        """
+        Returns the file to which the output of the experiment is written (None if
+        output is not logged).
+        """
+        return None
+
     def get_new_run(self):
         # type: () -> int
         raise NotImplementedError()
 
+    @contextmanager
+    def snapshot(self):
+        yield self
+
 
 def export_storage(storage):
     from .sql_storage import SqliteStorage
 
     if isinstance(storage, SqliteStorage):
-        return "sqlite"
+        options = storage.get_options()
+        return "sqlite?{}".format(urlencode(options)) if options else "sqlite"
     else:
         raise ValueError("Could not export storage {storage}".format(storage=storage))
 
@@ -43,10 +199,11 @@ def export_storage(storage):
 def import_storage(storage_string=None):
     if storage_string is None:
         storage_string = DEFAULT_STORAGE
-    if storage_string == "sqlite":
+    name, _, options = storage_string.partition("?")
+    if name == "sqlite":
         from .sql_storage import SqliteStorage
 
-        return SqliteStorage()
+        return SqliteStorage.from_options(dict(parse_qsl(options)))
     else:
         raise ValueError(
             "Could not import storage {storage_string}".format(
@@ -55,6 +212,45 @@ def import_storage(storage_string=None):
         )
 
 
+def load_experiment(storage, cls, identifier):
+    # type: (Storage, Type[Experiment], int) -> Experiment
+    """
+    Loads an experiment to run it, recording the time spent starting the process (since
+    dispatch) and loading.
+    """
+    start = time.perf_counter()
+    dispatched = os.environ.pop(DISPATCH_TIME_VARIABLE, None)
+    experiment = storage.get_experiment(cls, identifier)
+    if dispatched is not None:
+        experiment.result["@overhead.startup"] = time.time() - float(dispatched)
+    experiment.result["@overhead.load"] = time.perf_counter() - start
+    return experiment
+
+
+def run_experiment(storage, cls, identifier):
+    # type: (Storage, Type[Experiment], int) -> Experiment
+    """
+    Loads and runs an experiment, if @log_size is set its output is captured in a
+    bounded log file (if the storage provides one, see Storage.log_path).  If
+    @limit_memory is set, the run is limited to the memory the experiment needs (see
+    Experiment.resources).
+    """
+    experiment = load_experiment(storage, cls, identifier)
+    requirements = experiment.resources() if experiment["@limit_memory"] else None
+    limit = memory_limit(None if requirements is None else requirements.memory)
+    path = storage.log_path(identifier) if experiment["@log_size"] else None
+    if path is None:
+        with limit:
+            experiment.run_wrapped(True)
+    else:
+        experiment.result["@log"] = path
+        # The memory is limited once the output is being captured (which starts a
+        # thread)
+        with capture_output(path, experiment["@log_size"]), limit:
+            experiment.run_wrapped(True)
+    return experiment
+
+
 def full_class_name(cls):
     # Inspired by https://stackoverflow.com/a/2020083
     module = cls.__module__
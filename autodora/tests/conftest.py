@@ -0,0 +1,19 @@
+import pytest
+
+
+@pytest.fixture
+def storage(tmp_path):
+    from autodora.sql_storage import SqliteStorage
+
+    storage = SqliteStorage(str(tmp_path / "storage.sqlite"))
+    yield storage
+    storage.database.close()
+
+
+@pytest.fixture
+def concurrent_storage(tmp_path):
+    from autodora.sql_storage import SqliteStorage
+
+    storage = SqliteStorage(str(tmp_path / "storage.sqlite"), concurrent=True)
+    yield storage
+    storage.database.close()
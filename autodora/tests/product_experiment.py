@@ -21,11 +21,11 @@ class ProductExperiment(Experiment):
 
     @derived(cache=True)
     def derived_x(self):
-        return int(self.get(self.input).split("x")[0])
+        return int(self.get("input").split("x")[0])
 
     @derived(cache=True)
     def derived_y(self):
-        return int(self.get(self.input).split("x")[1])
+        return int(self.get("input").split("x")[1])
 
     @derived(cache=False)
     def derived_x_square(self):
@@ -0,0 +1,204 @@
+import os
+import pickle
+import signal
+import time
+import weakref
+from multiprocessing import Manager
+
+import pytest
+
+from autodora.experiment import Experiment, Parameter, Result, Config, Derived, derived
+from autodora.parallel import Update, worker
+from product_experiment import ProductExperiment
+from product_experiment_2 import InventoryExperiment
+
+
+class ExtendedExperiment(ProductExperiment):
+    offset = Parameter(int, 1, "Added to the product")
+    threads = Config(int, 4, "Number of threads")
+    total = Result(int, None, "Product plus offset")
+
+    def __init__(self, group, storage=None, identifier=None):
+        super().__init__(group, storage, identifier)
+        self.parameters.add_parameter(
+            "extra.name", str, "value", "Added in the constructor"
+        )
+
+    @derived(cache=True)
+    def derived_shifted(self):
+        return self.get("x") + self.offset
+
+    @derived(cache=False)
+    def derived_offset_square(self):
+        return self.offset**2
+
+    @derived(cache=True)
+    def derived_offset_plus(self):
+        return self.get("offset_square") + 1
+
+
+def test_schema():
+    e = ExtendedExperiment("schema")
+    assert set(e.parameters.parameters) == {
+        "input",
+        "count",
+        "power",
+        "offset",
+        "extra.name",
+    }
+    assert "threads" in e.config.parameters and "@timeout" in e.config.parameters
+    assert "total" in e.result.parameters and "product" in e.result.parameters
+    assert e["offset"] == 1 and e["threads"] == 4 and e["extra.name"] == "value"
+
+    # Parameters added to an instance do not leak into the class schema
+    assert "extra.name" not in ProductExperiment("schema").parameters.parameters
+    assert "extra.name" not in ExtendedExperiment._schema.parameters
+
+    i = InventoryExperiment("schema")
+    assert i["input"] == "0x0" and i["power"] == 2 and i["exp"] is None
+
+
+def test_derived_callbacks_per_instance():
+    e1, e2 = ProductExperiment("callbacks"), ProductExperiment("callbacks")
+    e1.derived_callbacks["double_count"] = Derived(lambda e: e["count"] * 2, False)
+    assert e1["double_count"] == 20
+    assert "double_count" not in e2.derived_callbacks
+
+
+def test_pickle():
+    e = ExtendedExperiment("pickle", identifier=3)
+    e["input"] = "2x3"
+    e["product"] = 36
+    e.get("x")
+    copy = pickle.loads(pickle.dumps(e))
+    assert copy.identifier == 3 and copy.group == "pickle"
+    assert copy["input"] == "2x3" and copy["product"] == 36 and copy.derived == {"x": 2}
+    assert copy["extra.name"] == "value"
+
+
+def test_attribute_access():
+    e = ExtendedExperiment("attributes")
+    assert e.input == "0x0" and e.offset == 1 and e.threads == 4 and e.total is None
+    e.input = "2x3"
+    e.total = 37
+    assert e["input"] == "2x3" and e["result.total"] == 37 and e.derived_x == 2
+    assert ExtendedExperiment.offset is ExtendedExperiment._schema.parameters["offset"]
+
+    i = InventoryExperiment("attributes")
+    i.input = "3x4"
+    assert i.exp is None and i.x * i.y == 12
+
+    e.parameters["extra.name"] = "changed"
+    assert getattr(e, "extra.name") == "changed"
+
+
+def test_get_lookup():
+    e, plain = ExtendedExperiment("lookup"), ProductExperiment("lookup")
+    assert e.lookup() is None and plain.lookup() is not None
+    for name in [
+        "input",
+        "par.count",
+        "parameter.power",
+        "product",
+        "res.product",
+        "conf.@timeout",
+        "config.@run.count",
+        "derived.x",
+        "x_square",
+        "@completed",
+    ]:
+        assert plain.resolve(name) == e.resolve(name)
+        assert plain.get(name) == e.get(name)
+
+    plain["count"] = 3
+    plain["result.product"] = 4
+    assert plain.parameters.values == {"count": 3} and plain.result.values == {
+        "product": 4
+    }
+    for name in ["unknown", "@unknown"]:
+        with pytest.raises(ValueError):
+            plain.get(name)
+        with pytest.raises(ValueError):
+            plain.set(name, 1)
+
+
+def test_derived_invalidation():
+    e = ExtendedExperiment("invalidation")
+    e.input = "2x3"
+    assert (
+        e["shifted"] == 3 and e["x_square"] == 4 and set(e.derived) == {"x", "shifted"}
+    )
+    assert e.dependencies["shifted"] == {("derived", "x"), ("parameters", "offset")}
+
+    e["offset"] = 5
+    assert set(e.derived) == {"x"} and e["shifted"] == 7
+    e["count"] = 1
+    e["threads"] = 2
+    assert set(e.derived) == {"x", "shifted"}
+    e.parameters["input"] = "4x1"
+    assert e.derived == {} and e["x_square"] == 16 and e["shifted"] == 9
+
+    # Changes made while loading values do not invalidate anything
+    copy = pickle.loads(pickle.dumps(e))
+    assert (
+        copy.derived == {"x": 4, "shifted": 9} and copy.dependencies == e.dependencies
+    )
+    copy.input = "1x1"
+    assert copy["shifted"] == 6
+
+    # Cached values derived from uncached values depend on what the uncached values read
+    e = ExtendedExperiment("invalidation")
+    assert e["offset_plus"] == 2 and "offset_square" not in e.derived
+    e["offset"] = 3
+    assert e["offset_plus"] == 10
+
+
+def test_no_reference_cycles():
+    # Experiments are released as soon as they are no longer referenced (without
+    # waiting for the garbage collector)
+    e = ExtendedExperiment("cycles")
+    e["offset"] = 2
+    assert e["shifted"] == 2
+    reference = weakref.ref(e)
+    del e
+    assert reference() is None
+
+
+def test_resource_usage():
+    e = ProductExperiment("resources")
+    e["count"] = 20000
+    e.run_wrapped(auto_save=False)
+    assert e["@max_rss"] > 1024 * 1024 and e["@cpu_user"] + e["@cpu_sys"] > 0
+    # The CPU time of the bash child process is included, unlike in the process time
+    assert e["@cpu_user"] + e["@cpu_sys"] > e["@runtime_process"]
+    assert e["@io_read_bytes"] >= 0 and e["@context_switches_voluntary"] >= 1
+
+    # Resource usage is also recorded for failed runs
+    e = ProductExperiment("resources")
+    e["input"] = "invalid"
+    with pytest.raises(ValueError):
+        e.run_wrapped(auto_save=False)
+    assert (
+        e["@error"] is not None
+        and e["@max_rss"] > 1024 * 1024
+        and e["@cpu_user"] is not None
+    )
+
+
+class TerminatedExperiment(Experiment):
+    def run(self):
+        self.report("quality", 1)
+        os.kill(os.getpid(), signal.SIGTERM)
+        time.sleep(10)
+
+
+def test_report_without_storage():
+    # Experiments without storage have nothing to flush, they are terminated right away
+    queue = Manager().Queue()
+    run = TerminatedExperiment("report").run_wrapped
+    worker((0, None, (run, (), dict(auto_save=False)), 5, queue, None, False))
+    updates = [queue.get() for _ in range(2)]
+    assert [(u.status, u.exit_code) for u in updates] == [
+        (Update.STARTED, None),
+        (Update.FAILED, -signal.SIGTERM),
+    ]
@@ -0,0 +1,101 @@
+import os
+import subprocess
+import sys
+import time
+
+from autodora.logs import BoundedLog, read_log
+from autodora.storage import export_storage
+from product_experiment import ProductExperiment
+
+# Python replaces sys.stdout while testing, so output is captured in a separate process
+SCRIPT = """
+import subprocess
+import sys
+import time
+
+from autodora.logs import capture_output
+
+with capture_output(sys.argv[1], 100):
+    print("from python")
+    subprocess.check_call("echo from child; echo error from child >&2", shell=True)
+    if len(sys.argv) > 2:
+        for i in range(1000):
+            print("line", i, flush=True)
+        time.sleep(60)
+"""
+
+
+def environment():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([os.path.dirname(__file__)] + sys.path)
+    return env
+
+
+def test_bounded_log(tmp_path):
+    path = str(tmp_path / "bounded.log")
+    log = BoundedLog(path, 10)
+    for data in [b"0123", b"456789", b"abcdefghij"]:
+        log.write(data)
+    # The head is written as it arrives, the tail once the log is closed
+    assert read_log(path) == "01234"
+    log.close()
+    assert read_log(path) == "01234\n[... 10 bytes omitted ...]\nfghij"
+
+
+def test_capture_output(tmp_path):
+    path = str(tmp_path / "logs" / "output.log")
+    subprocess.check_call([sys.executable, "-c", SCRIPT, path], env=environment())
+    assert read_log(path) == "from python\nfrom child\nerror from child\n"
+
+    # The log is completed if the process is terminated, e.g., because of a timeout
+    process = subprocess.Popen(
+        [sys.executable, "-c", SCRIPT, path, "forever"], env=environment()
+    )
+    time.sleep(1)
+    process.terminate()
+    process.wait()
+    log = read_log(path)
+    assert (
+        log.startswith("from python\nfrom child\n")
+        and log.endswith("\nline 999\n")
+        and "bytes omitted" in log
+    )
+
+
+def test_experiment_log(storage):
+    experiment = ProductExperiment("logs")
+    experiment["@log_size"] = 1000
+    storage.save(experiment)
+    filename = os.path.join(os.path.dirname(__file__), "product_experiment.py")
+    command = [
+        sys.executable,
+        filename,
+        "-s",
+        export_storage(storage),
+        "run",
+        str(experiment.identifier),
+    ]
+    subprocess.check_call(command, env=environment())
+
+    path = experiment.fresh_copy()["@log"]
+    assert path == storage.log_path(experiment.identifier)
+    assert read_log(path) == "Done computing with BASH\nNo errors occurred\n"
+
+    storage.remove("logs")
+    assert not os.path.exists(path)
+
+    # Output is only captured if requested
+    experiment = ProductExperiment("logs")
+    storage.save(experiment)
+    command = [
+        sys.executable,
+        filename,
+        "-s",
+        export_storage(storage),
+        "run",
+        str(experiment.identifier),
+    ]
+    subprocess.check_call(command, env=environment(), stdout=subprocess.DEVNULL)
+    assert experiment.fresh_copy()["@log"] is None and not os.path.exists(
+        storage.log_path(experiment.identifier)
+    )
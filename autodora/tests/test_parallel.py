@@ -1,15 +1,27 @@
 import os
+import signal
+import subprocess
 import time
 from multiprocessing import Process, Queue, Manager
 from subprocess import check_output
 
 import pytest
 
-from autodora.parallel import run_function, run_command
+from autodora import parallel
+from autodora.parallel import (
+    run_function,
+    run_command,
+    run_warm,
+    run_async,
+    ParallelObserver,
+    Update,
+)
 
 
 def worker2(count):
-    check_output("for i in `seq 1 {count}`; do echo $i; done".format(count=count), shell=True)
+    check_output(
+        "for i in `seq 1 {count}`; do echo $i; done".format(count=count), shell=True
+    )
 
 
 def worker(n1, n2, queue):
@@ -78,3 +90,130 @@ def test_parallel_output():
     command = "python {} {}".format(worker_file, test_string)
     out, err = run_command(command)
     assert test_string == out
+
+
+def record_pid(queue):
+    queue.put(os.getpid())
+
+
+def sleeper(queue, duration):
+    process = subprocess.Popen(["sleep", str(duration)])
+    queue.put((os.getpid(), process.pid))
+    process.wait()
+
+
+def failing():
+    raise ValueError("Task failed")
+
+
+class UpdateObserver(ParallelObserver):
+    def __init__(self):
+        super().__init__()
+        self.updates = []
+
+    def observe(self, update):
+        self.updates.append((update.index, update.status, update.meta))
+
+
+def is_running(pid):
+    try:
+        with open("/proc/{}/stat".format(pid)) as ref:
+            return ref.read().split(")")[-1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+def test_warm_workers():
+    queue = Manager().Queue()
+    run_warm([(record_pid, (queue,))] * 6, processes=2)
+    pids = [queue.get() for _ in range(6)]
+    assert len(set(pids)) <= 2 and os.getpid() not in pids
+
+    # Workers are replaced after every task
+    run_warm([(record_pid, (queue,))] * 6, processes=2, max_tasks=1)
+    assert len(set(queue.get() for _ in range(6))) == 6
+
+    # Tasks can start processes themselves
+    observer = UpdateObserver()
+    run_warm([(worker, (1, 3, queue))], processes=1, observer=observer)
+    assert observer.updates[-1][1] == Update.DONE
+
+
+def test_warm_workers_timeout():
+    queue = Manager().Queue()
+    observer = UpdateObserver()
+    tasks = [
+        (sleeper, (queue, 20)),
+        (failing, ()),
+        (sleeper, (queue, 0)),
+        (record_pid, (queue,)),
+    ]
+    start_time = time.time()
+    run_warm(tasks, processes=2, timeout=1, meta="abcd", observer=observer)
+    assert time.time() - start_time < 5
+
+    finished = {
+        i: (status, meta)
+        for i, status, meta in observer.updates
+        if status != Update.STARTED
+    }
+    assert finished == {
+        0: (Update.TIMEOUT, "a"),
+        1: (Update.FAILED, "b"),
+        2: (Update.DONE, "c"),
+        3: (Update.DONE, "d"),
+    }
+    assert len([u for u in observer.updates if u[1] == Update.STARTED]) == 4
+    # The process started by the killed worker is killed as well
+    worker_pid, child_pid = queue.get()
+    assert not is_running(worker_pid) and not is_running(child_pid)
+
+
+def killed():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def test_killed_function():
+    queue = Manager().Queue()
+    # Function commands fail if their process exits with an error or is killed
+    commands = [(killed,), (failing,), (simple_worker, (1, 10))]
+    for i, command in enumerate(commands):
+        parallel.worker((i, None, command, None, queue, None, False))
+    updates = [queue.get() for _ in range(6)]
+    assert [(u.index, u.status, u.exit_code) for u in updates] == [
+        (0, Update.STARTED, None),
+        (0, Update.FAILED, -signal.SIGKILL),
+        (1, Update.STARTED, None),
+        (1, Update.FAILED, 1),
+        (2, Update.STARTED, None),
+        (2, Update.DONE, None),
+    ]
+
+
+def test_async_commands(tmp_path):
+    observer = UpdateObserver()
+    pid_file = tmp_path / "pid"
+    commands = ["sleep 20 & echo $! > {}; wait".format(pid_file), "exit 3", "true"]
+    start_time = time.time()
+    run_async(commands, processes=2, timeout=1, meta="abc", observer=observer, grace=1)
+    assert time.time() - start_time < 5
+
+    finished = {
+        i: (status, meta)
+        for i, status, meta in observer.updates
+        if status != Update.STARTED
+    }
+    assert finished == {
+        0: (Update.TIMEOUT, "a"),
+        1: (Update.FAILED, "b"),
+        2: (Update.DONE, "c"),
+    }
+    assert not is_running(int(pid_file.read_text()))
+
+    # At most two commands run at once
+    start_time = time.time()
+    run_async(["sleep 0.5"] * 4, processes=2)
+    assert time.time() - start_time >= 1
+
+    with pytest.raises(ValueError):
+        run_async([(simple_worker, (1, 10))])
@@ -0,0 +1,133 @@
+import os
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+from autodora.observe import ProgressObserver
+from autodora.prediction import (
+    RuntimeModel,
+    longest_first,
+    makespan,
+    makespan_summary,
+    predict_runtimes,
+    runtime,
+)
+from autodora.storage import export_storage
+from autodora.runner import CommandLineRunner
+from product_experiment import ProductExperiment
+
+
+class OrderObserver(ProgressObserver):
+    def __init__(self):
+        super().__init__(auto_load=False)
+        self.started = []
+
+    def run_started(self, platform, name, run_count, run_date, experiment_count):
+        pass
+
+    def experiment_started(self, index, experiment):
+        self.started.append(experiment)
+
+    def experiment_finished(self, index, experiment):
+        pass
+
+    def run_finished(self, platform, name, run_count, run_date):
+        pass
+
+
+def predict(model, parameters):
+    return model.predict(RuntimeModel.key(parameters), parameters)
+
+
+def test_runtime_model():
+    settings = [({"input": "a", "count": c}, 0.01 * (c + 1) ** 2) for c in [9, 19, 39]]
+    settings += [({"input": "a", "count": 9}, 0.5), ({"input": "a", "count": 9}, 1.5)]
+    model = RuntimeModel([(RuntimeModel.key(p), p, v) for p, v in settings])
+    # Settings that were run before are predicted by their average runtime
+    assert predict(model, {"input": "a", "count": 9}) == pytest.approx(1.0)
+    # Others by a power law in the numeric parameters
+    assert predict(model, {"input": "a", "count": 79}) == pytest.approx(64, rel=0.1)
+    assert predict(model, {"input": "b", "count": 9}) is None
+
+    # Without enough distinct settings, the nearest setting is used
+    parameters = {"input": "a", "count": 10, "power": 2}
+    model = RuntimeModel([(RuntimeModel.key(parameters), parameters, 2.0)])
+    assert predict(model, {"input": "a", "count": 12, "power": 3}) == 2.0
+
+
+def test_runtime():
+    now = datetime.now()
+    experiment = ProductExperiment("runtime")
+    experiment["@start_time"], experiment["@timeout"] = now - timedelta(seconds=30), 60
+    # Started without finishing, but still within its timeout (e.g., running)
+    assert runtime(experiment, now) is None
+    assert runtime(experiment, now + timedelta(seconds=31)) == 60.0
+    experiment["@end_time"], experiment["@runtime"] = now, 5.0
+    assert runtime(experiment, now) == 5.0
+    experiment["@cached_from"] = 1
+    assert runtime(experiment, now) is None
+
+
+def test_makespan():
+    runtimes = [1.0] * 6 + [6.0]
+    assert makespan(runtimes, 2) == 9.0
+    assert makespan(sorted(runtimes, reverse=True), 2) == 6.0
+    assert longest_first(list("abcd"), [1.0, None, 3.0, 2.0]) == list("cbda")
+    summary = makespan_summary(runtimes + [None], 2).splitlines()
+    assert summary[0].startswith("Predicted runtimes for 7 of 8 experiments")
+    assert summary[-1].split() == ["longest", "first", "7.00s"]
+
+
+def test_longest_first(storage):
+    history = ProductExperiment.explore("history", {"count": [1, 10, 100]})
+    for e in history.experiments:
+        e["@start_time"] = e["@end_time"] = datetime.now()
+        e["@runtime"] = (e["count"] + 1) / 100
+    storage.save_many(history.experiments)
+
+    t = ProductExperiment.explore("sweep", {"count": [1, 2, 50, 10, 100, 1000]})
+    predictions = predict_runtimes(storage, t.experiments)
+    assert predictions[0] == 0.02 and predictions[-1] == pytest.approx(10.01)
+
+    observer = OrderObserver()
+    CommandLineRunner(
+        t, storage, processes=1, observer=observer, via_cli=False, longest_first=True
+    ).run()
+    counts = {
+        e.identifier: e["count"]
+        for e in storage.get_experiments(ProductExperiment, "sweep")
+    }
+    assert [counts[i] for i in observer.started] == [1000, 100, 50, 10, 2, 1]
+
+
+def test_dry_run(storage):
+    CommandLineRunner(
+        ProductExperiment.explore("dry", {"count": [1, 2]}), storage, via_cli=False
+    ).run()
+    filename = os.path.join(os.path.dirname(__file__), "product_experiment.py")
+    command = [
+        sys.executable,
+        filename,
+        "-s",
+        export_storage(storage),
+        "explore",
+        "-n",
+        "dry",
+        "--count",
+        "1",
+        "2",
+    ]
+    env = dict(
+        os.environ, PYTHONPATH=os.pathsep.join([os.path.dirname(__file__)] + sys.path)
+    )
+    output = subprocess.check_output(
+        command + ["3", "--dry_run"], env=env, universal_newlines=True
+    )
+    # Only the new setting is predicted (from the runtimes of the others)
+    assert (
+        "1 of 3 experiments are pending" in output
+        and "Predicted runtimes for 1 of 1 experiments" in output
+    )
+    assert len(storage.get_experiments(ProductExperiment, "dry")) == 2
@@ -0,0 +1,136 @@
+import multiprocessing
+import time
+from multiprocessing import Process
+
+from autodora.observe import ProgressObserver
+from autodora.runner import QueueRunner
+from autodora.settings import MAX_ATTEMPTS
+from autodora.work_queue import work
+from product_experiment import ProductExperiment
+
+
+def queue_experiments(storage, count):
+    t = ProductExperiment.explore("queue", {"count": list(range(1, count + 1))})
+    storage.save_many(t.experiments)
+    storage.enqueue([e.identifier for e in t.experiments])
+    return [e.identifier for e in t.experiments]
+
+
+def test_claim(concurrent_storage):
+    first, second = queue_experiments(concurrent_storage, 2)
+    assert concurrent_storage.claim([ProductExperiment], "a", 0.2) == (
+        ProductExperiment,
+        first,
+    )
+    assert concurrent_storage.claim([ProductExperiment], "b", 10) == (
+        ProductExperiment,
+        second,
+    )
+    assert concurrent_storage.claim([ProductExperiment], "c", 10) is None
+    assert concurrent_storage.claim([ProductExperiment], "c", 10, group="other") is None
+
+    # The lease of a crashed owner expires, after which the experiment is claimed again
+    time.sleep(0.3)
+    assert concurrent_storage.claim([ProductExperiment], "c", 10) == (
+        ProductExperiment,
+        first,
+    )
+    assert not concurrent_storage.renew_lease(
+        first, "a", 10
+    ) and concurrent_storage.renew_lease(first, "c", 10)
+    assert not concurrent_storage.release(first, "a") and concurrent_storage.release(
+        first, "c"
+    )
+    assert concurrent_storage.count_queued([ProductExperiment]) == 1
+
+
+def test_abandon(concurrent_storage):
+    identifier = queue_experiments(concurrent_storage, 1)[0]
+    # Claimed by workers that crashed every time
+    for attempt in range(MAX_ATTEMPTS):
+        assert (
+            concurrent_storage.claim([ProductExperiment], "crashed", 0)[1] == identifier
+        )
+        time.sleep(0.01)
+    assert concurrent_storage.claim([ProductExperiment], "a", 10) is None
+
+    abandoned = []
+    assert (
+        work(
+            concurrent_storage,
+            [ProductExperiment],
+            observer=lambda *args: abandoned.append(args),
+        )
+        == 0
+    )
+    assert (
+        abandoned == [(ProductExperiment, identifier)]
+        and concurrent_storage.count_queued([ProductExperiment]) == 0
+    )
+    experiment = concurrent_storage.get_experiment(ProductExperiment, identifier)
+    assert experiment["@error"].startswith("ABANDONED") and not experiment["@completed"]
+
+
+def test_workers(concurrent_storage):
+    from autodora.sql_storage import ExperimentModel
+
+    identifiers = queue_experiments(concurrent_storage, 12)
+    # Claimed by a worker that crashed right away
+    crashed = concurrent_storage.claim([ProductExperiment], "crashed", 0.5)[1]
+
+    workers = [
+        Process(
+            target=work,
+            args=(concurrent_storage, [ProductExperiment]),
+            kwargs=dict(lease=2, poll_interval=0.05),
+        )
+        for _ in range(4)
+    ]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+    assert concurrent_storage.count_queued([ProductExperiment]) == 0
+    experiments = concurrent_storage.get_experiments(ProductExperiment, "queue")
+    assert len(experiments) == 12 and all(e["@completed"] for e in experiments)
+    with concurrent_storage.bound():
+        attempts = dict(
+            ExperimentModel.select(
+                ExperimentModel.id, ExperimentModel.attempts
+            ).tuples()
+        )
+    assert all(attempts[i] == (2 if i == crashed else 1) for i in identifiers)
+
+
+def test_queue_runner(concurrent_storage):
+    class Counter(ProgressObserver):
+        def __init__(self):
+            super().__init__()
+            self.finished = []
+
+        def experiment_finished(self, index, experiment):
+            self.finished.append(experiment.identifier)
+
+    counter = Counter()
+    t = ProductExperiment.explore("runner", {"count": list(range(1, 7))})
+    experiments = QueueRunner(
+        t, concurrent_storage, processes=3, observer=counter
+    ).run()
+    assert len(experiments) == 6 and all(e["@completed"] for e in experiments)
+    assert sorted(counter.finished) == sorted(e.identifier for e in experiments)
+    assert concurrent_storage.count_queued([ProductExperiment], "runner") == 0
+
+
+def test_queue_runner_spawn(concurrent_storage, monkeypatch):
+    # Workers receive their arguments by pickling if processes are spawned (e.g., on
+    # macOS and Windows)
+    monkeypatch.setattr(
+        multiprocessing, "Process", multiprocessing.get_context("spawn").Process
+    )
+    monkeypatch.setattr(
+        multiprocessing, "Queue", multiprocessing.get_context("spawn").Queue
+    )
+    t = ProductExperiment.explore("spawn", {"count": [1, 2]})
+    experiments = QueueRunner(t, concurrent_storage, processes=2).run()
+    assert all(e["@completed"] for e in experiments)
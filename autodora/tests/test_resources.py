@@ -0,0 +1,157 @@
+import os
+import signal
+
+import pytest
+
+from autodora.experiment import Experiment, Parameter, Result
+from autodora.observe import ProgressObserver
+from autodora.resources import (
+    Resources,
+    Scheduler,
+    machine_resources,
+    memory_limit,
+    parse_memory,
+)
+
+GB = 2**30
+
+
+class AllocatingExperiment(Experiment):
+    size = Parameter(int, 0, "Bytes to allocate")
+    done = Result(bool, False, "Allocated the memory")
+
+    def run(self):
+        data = bytearray(self["size"])
+        return {"done": len(data) == self["size"]}
+
+
+class KilledExperiment(Experiment):
+    def run(self):
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+class StatusObserver(ProgressObserver):
+    def __init__(self):
+        super().__init__(auto_load=False)
+        self.statuses = dict()
+
+    def run_started(self, platform, name, run_count, run_date, experiment_count):
+        pass
+
+    def experiment_started(self, index, experiment):
+        pass
+
+    def experiment_finished(self, index, experiment):
+        self.statuses[experiment] = "done"
+
+    def experiment_interrupted(self, index, experiment):
+        self.statuses[experiment] = "timeout"
+
+    def experiment_failed(self, index, experiment):
+        self.statuses[experiment] = "failed"
+
+    def experiment_out_of_memory(self, index, experiment):
+        self.statuses[experiment] = "out of memory"
+
+    def run_finished(self, platform, name, run_count, run_date):
+        pass
+
+
+def test_machine_resources(tmp_path):
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text(
+        "MemTotal:       16318412 kB\nMemFree:         1214060 kB\nMemAvailable:    "
+        "8137632 kB\n"
+    )
+    resources = machine_resources(str(meminfo))
+    assert resources.cpus >= 1 and resources.memory == 8137632 * 1024
+    assert machine_resources(str(tmp_path / "missing")).memory is None
+    assert (
+        parse_memory("512M") == 512 * 2**20
+        and parse_memory("1.5GB") == 3 * GB // 2
+        and parse_memory("10") == 10
+    )
+
+
+def test_scheduler():
+    tasks = [
+        ("a", Resources(1, 1 * GB)),
+        ("b", Resources(8, 30 * GB)),
+        ("c", Resources(2, 4 * GB)),
+        ("d", None),
+    ]
+    scheduler = Scheduler(iter(tasks), Resources(4, 32 * GB), slots=4, lookahead=1)
+    # b needs more cores than available and runs alone, c and d pass it once
+    assert scheduler.ready() == [("a", Resources(1, GB)), ("c", Resources(2, 4 * GB))]
+    scheduler.release(Resources(1, GB))
+    # b was passed once already, so d waits for b
+    assert scheduler.ready() == []
+    scheduler.release(Resources(2, 4 * GB))
+    assert scheduler.ready() == [("b", Resources(4, 30 * GB))]
+    scheduler.release(Resources(4, 30 * GB))
+    assert scheduler.ready() == [("d", Resources(1, 0))]
+
+    # Without requirements, the slots limit the number of tasks
+    scheduler = Scheduler(((i, None) for i in range(10)), Resources(2, None), slots=3)
+    assert len(scheduler.ready()) == 3 and scheduler.ready() == []
+
+
+def test_out_of_memory(storage):
+    from autodora.runner import CommandLineRunner
+
+    t = AllocatingExperiment.explore("memory", {"size": [GB // 4, 4 * GB]})
+    for e in t.experiments:
+        e.config["@memory"] = GB
+    observer = StatusObserver()
+    experiments = CommandLineRunner(
+        t, storage, processes=1, observer=observer, limit_memory=True, via_cli=False
+    ).run()
+    assert experiments[0]["done"] and not experiments[0]["@out_of_memory"]
+    assert (
+        experiments[1]["@out_of_memory"] and "MemoryError" in experiments[1]["@error"]
+    )
+    assert observer.statuses == {
+        experiments[0].identifier: "done",
+        experiments[1].identifier: "out of memory",
+    }
+
+    # The limit applies to the memory allocated from now on, not to what the process has
+    # mapped already
+    with memory_limit(GB // 4):
+        data = bytearray(GB // 8)
+        with pytest.raises(MemoryError):
+            bytearray(GB // 4)
+    del data
+
+
+def test_killed(storage):
+    from autodora.runner import CommandLineRunner, process_failed
+
+    t = KilledExperiment.explore("killed", {})
+    observer = StatusObserver()
+    experiment = CommandLineRunner(
+        t, storage, processes=1, observer=observer, via_cli=False
+    ).run()[0]
+    # Processes that are killed are assumed to have run out of memory
+    assert (
+        experiment["@error"] == "Process exited with code -9"
+        and experiment["@out_of_memory"]
+    )
+    assert observer.statuses == {experiment.identifier: "out of memory"}
+
+    # Also if a shell reports that the process it ran was killed
+    experiment = KilledExperiment("killed", storage)
+    storage.save(experiment)
+    process_failed(experiment, 128 + signal.SIGKILL)
+    assert experiment.fresh_copy()["@out_of_memory"]
+
+
+def test_peak_memory(storage):
+    from autodora.runner import CommandLineRunner
+
+    # The same worker runs both experiments, the peak memory of the first is not
+    # attributed to the second
+    t = AllocatingExperiment.explore("peak", {"size": [GB // 4, 0]})
+    runner = CommandLineRunner(t, storage, processes=1, via_cli=False)
+    large, small = runner.run()
+    assert large["@max_rss"] > GB // 4 > small["@max_rss"]
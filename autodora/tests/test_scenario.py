@@ -9,7 +9,7 @@ from autodora.trajectory import product
 from autodora.runner import CommandLineRunner
 
 
-@pytest.fixture(scope='session', autouse=True)
+@pytest.fixture(scope="session", autouse=True)
 def db_conn():
     os.environ["DB"] = os.path.join(os.path.dirname(__file__), "tests.sqlite")
 
@@ -19,9 +19,13 @@ def db_conn():
 
 
 class CountObserver(ProgressObserver):
-    def __init__(self, experiment_normal_count, experiment_timeout_count, experiment_error_count):
+    def __init__(
+        self, experiment_normal_count, experiment_timeout_count, experiment_error_count
+    ):
         super().__init__()
-        self.experiment_started_count = experiment_normal_count + experiment_timeout_count + experiment_error_count
+        self.experiment_started_count = (
+            experiment_normal_count + experiment_timeout_count + experiment_error_count
+        )
         self.experiment_normal_count = experiment_normal_count
         self.experiment_timeout_count = experiment_timeout_count
         self.experiment_error_count = experiment_error_count
@@ -96,32 +100,44 @@ def test_product_scenario():
         assert e["@run.computer"] is None
         assert e["@run.date"] is None
 
-    assert len(t.experiments) == len(input_options["input"]) * len(count_options["count"])
+    assert len(t.experiments) == len(input_options["input"]) * len(
+        count_options["count"]
+    )
 
-    observer = CountObserver(len(t.experiments) - len(count_options["count"]), len(count_options["count"]), 0)
+    observer = CountObserver(
+        len(t.experiments) - len(count_options["count"]), len(count_options["count"]), 0
+    )
     dispatcher = ProgressObserver()
     dispatcher.add_observer(observer)
     try:
         dispatcher.add_observer(TelegramObserver())
     except RuntimeError:
         pass
-    finished_experiments = CommandLineRunner(t, storage, timeout=timeout, observer=dispatcher).run()
+    finished_experiments = CommandLineRunner(
+        t, storage, timeout=timeout, observer=dispatcher
+    ).run()
     assert len(finished_experiments) == len(t.experiments)
     observer.done()
     assert len(storage.get_groups()) == 1
 
     name2 = "name2"
     CommandLineRunner(ProductExperiment.explore(name2, {}), storage).run()
-    last_id = CommandLineRunner(ProductExperiment.explore(name, {}), storage, repeat=True).run()[0].identifier
+    last_id = (
+        CommandLineRunner(ProductExperiment.explore(name, {}), storage, repeat=True)
+        .run()[0]
+        .identifier
+    )
 
     assert len(storage.get_groups()) == 2
-    assert len(storage.get_experiments(ProductExperiment, name)) == len(t.experiments) + 1
+    assert (
+        len(storage.get_experiments(ProductExperiment, name)) == len(t.experiments) + 1
+    )
     assert len(storage.get_experiments(ProductExperiment, name2)) == 1
 
     run_date = None
     for e in storage.get_experiments(ProductExperiment, name):
         print(e)
-        should_be_run = (e["count"] < 1000)
+        should_be_run = e["count"] < 1000
         assert e["count"]
         assert e["input"]
         assert e["x"] == int(e["input"].split("x")[0])
@@ -0,0 +1,88 @@
+import os
+import subprocess
+import sys
+import time
+
+from autodora.settings import DISPATCH_TIME_VARIABLE
+from autodora.storage import export_storage
+from product_experiment import ProductExperiment
+
+# Seconds that starting the process running an experiment may take in addition to
+# starting the interpreter
+IMPORT_BUDGET = 0.75
+# Modules that are only needed for analyzing or dispatching experiments
+EXCLUDED_MODULES = [
+    "numpy",
+    "matplotlib",
+    "autodora.analyze",
+    "autodora.plot",
+    "autodora.runner",
+    "autodora.parallel",
+]
+
+SCRIPT = """
+import runpy
+import sys
+
+filename, storage, identifier = sys.argv[1:]
+sys.argv = [filename, "-s", storage, "run", identifier]
+runpy.run_path(filename, run_name="__main__")
+print("MODULES", *sorted(sys.modules))
+"""
+
+
+def environment():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([os.path.dirname(__file__)] + sys.path)
+    return env
+
+
+def test_run_imports(storage):
+    experiment = ProductExperiment("startup")
+    storage.save(experiment)
+    filename = os.path.join(os.path.dirname(__file__), "product_experiment.py")
+    out = subprocess.check_output(
+        [
+            sys.executable,
+            "-c",
+            SCRIPT,
+            filename,
+            export_storage(storage),
+            str(experiment.identifier),
+        ],
+        env=environment(),
+    ).decode()
+    modules = next(
+        line for line in out.splitlines() if line.startswith("MODULES")
+    ).split()[1:]
+    assert "autodora.sql_storage" in modules
+    assert [m for m in EXCLUDED_MODULES if m in modules] == []
+    assert experiment.fresh_copy()["@completed"]
+
+
+def test_startup_time(storage):
+    experiment = ProductExperiment("startup")
+    storage.save(experiment)
+    filename = os.path.join(os.path.dirname(__file__), "product_experiment.py")
+
+    start = time.time()
+    subprocess.check_call([sys.executable, "-c", "pass"], env=environment())
+    interpreter = time.time() - start
+
+    env = environment()
+    env[DISPATCH_TIME_VARIABLE] = repr(time.time())
+    subprocess.check_call(
+        [
+            sys.executable,
+            filename,
+            "-s",
+            export_storage(storage),
+            "run",
+            str(experiment.identifier),
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    startup = experiment.fresh_copy()["@overhead.startup"]
+    assert startup < interpreter + IMPORT_BUDGET
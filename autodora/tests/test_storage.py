@@ -0,0 +1,762 @@
+import os
+import signal
+import subprocess
+import time
+from array import array
+from multiprocessing import Pool, Process
+
+import pytest
+
+from autodora.experiment import Experiment, Parameter, Result
+from product_experiment import ProductExperiment
+
+
+def save_experiments(args):
+    storage, group, count = args
+    for i in range(count):
+        experiment = ProductExperiment(group)
+        experiment["count"] = i
+        experiment.save(storage)
+        experiment["product"] = i
+        experiment.save(storage)
+    return count
+
+
+def test_save_many(storage):
+    t = ProductExperiment.explore("name", {"count": list(range(1, 501))})
+    storage.save_many(t.experiments)
+
+    identifiers = [e.identifier for e in t.experiments]
+    assert len(set(identifiers)) == len(identifiers)
+    for e in t.experiments:
+        assert e.storage == storage
+        assert (
+            storage.get_experiment(ProductExperiment, e.identifier)["count"]
+            == e["count"]
+        )
+
+    t.experiments[0]["product"] = 7
+    new = ProductExperiment("name")
+    storage.save_many([t.experiments[0], new])
+    assert storage.get_experiment(ProductExperiment, identifiers[0])["product"] == 7
+    assert new.identifier is not None and new.identifier not in identifiers
+    assert len(storage.get_experiments(ProductExperiment, "name")) == 501
+
+
+def test_concurrent_writers(concurrent_storage):
+    # The storage (and its open connection) is inherited by the forked workers
+    assert len(concurrent_storage.get_groups()) == 0
+    with Pool(8) as pool:
+        counts = pool.map(
+            save_experiments, [(concurrent_storage, "concurrent", 20)] * 16
+        )
+    experiments = concurrent_storage.get_experiments(ProductExperiment, "concurrent")
+    assert len(experiments) == sum(counts)
+    assert all(e["product"] == e["count"] for e in experiments)
+
+
+def test_snapshot(concurrent_storage):
+    ProductExperiment("snapshot").save(concurrent_storage)
+    with concurrent_storage.snapshot():
+        before = len(concurrent_storage.get_experiments(ProductExperiment, "snapshot"))
+        writer = Process(
+            target=save_experiments, args=((concurrent_storage, "snapshot", 5),)
+        )
+        writer.start()
+        writer.join()
+        assert writer.exitcode == 0
+        assert (
+            len(concurrent_storage.get_experiments(ProductExperiment, "snapshot"))
+            == before
+        )
+    assert (
+        len(concurrent_storage.get_experiments(ProductExperiment, "snapshot"))
+        == before + 5
+    )
+
+
+def test_export_storage(tmp_path):
+    from autodora.storage import export_storage, import_storage
+
+    storage = import_storage(
+        "sqlite?concurrent=1&busy_timeout=5&filename={}".format(tmp_path / "a.sqlite")
+    )
+    assert storage.concurrent and storage.busy_timeout == 5
+    assert (
+        import_storage(export_storage(storage)).get_options() == storage.get_options()
+    )
+
+
+@pytest.mark.parametrize(
+    "filter_string",
+    [
+        "count>5",
+        "~count>5",
+        "count<=5",
+        "count=5",
+        "count!=5",
+        "~count=5",
+        "input=10x20",
+        "input!=10x20",
+        "product=None",
+        "~product=None",
+        "product",
+        "~product",
+        "@error=None",
+        "parameter.power>=3",
+        "x=10",
+        "derived.y>15",
+    ],
+)
+def test_sql_filters(storage, filter_string):
+    from autodora.filters import is_excluded_from_string
+
+    settings = {
+        "input": ["10x20", "10x30", "5x5", "10x20"],
+        "count": [1, 5, 10, 20],
+        "power": [1, 2, 3, 4],
+    }
+    experiments = ProductExperiment.explore("filters", settings).experiments
+    experiments[0]["product"] = 200
+    experiments[1]["product"] = 0
+    experiments[3]["product"] = [1, 2]
+    storage.save_many(experiments)
+
+    expected = [
+        e.identifier
+        for e in experiments
+        if not is_excluded_from_string(filter_string, e)
+    ]
+    actual = [
+        e.identifier
+        for e in storage.get_experiments(
+            ProductExperiment, "filters", exclude=[filter_string]
+        )
+    ]
+    assert sorted(actual) == sorted(expected)
+
+
+def test_sql_values(storage):
+    from autodora.sql_storage import ExperimentModel, ExperimentValue
+
+    experiments = ProductExperiment.explore("values", {"count": [1, 2]}).experiments
+    experiments[0]["product"] = 2
+    storage.save_many(experiments)
+    # Values that are None and @-options are not indexed
+    with storage.bound():
+        rows = ExperimentValue.select(ExperimentValue.key).where(
+            ExperimentValue.experiment_id == experiments[1].identifier
+        )
+        assert sorted(key for key, in rows.tuples()) == ["count", "input", "power"]
+    assert [
+        e["count"]
+        for e in storage.get_experiments(
+            ProductExperiment, "values", where=["product=None"]
+        )
+    ] == [2]
+
+    # Experiments stored before values were indexed are checked in Python
+    with storage.bound():
+        ExperimentValue.delete().execute()
+        ExperimentModel.update(indexed=None).execute()
+    assert [
+        e["count"]
+        for e in storage.get_experiments(
+            ProductExperiment, "values", exclude=["product=None"]
+        )
+    ] == [1]
+
+
+def test_sql_where(storage):
+    experiments = ProductExperiment.explore(
+        "where", {"count": [10, 1000, 2000, 3000]}
+    ).experiments
+    experiments[2]["@error"] = "ERROR"
+    storage.save_many(experiments)
+    found = storage.get_experiments(
+        ProductExperiment, "where", where=["count>1000", "@error=None"]
+    )
+    assert [e["count"] for e in found] == [3000]
+
+
+def test_iter_experiments(storage):
+    experiments = ProductExperiment.explore(
+        "iter", {"count": list(range(10))}
+    ).experiments
+    for e in experiments:
+        e["product"] = e["count"] * 2
+    storage.save_many(experiments)
+
+    loaded = list(
+        storage.iter_experiments(
+            ProductExperiment, "iter", fields=["count"], batch_size=3
+        )
+    )
+    assert [e["count"] for e in loaded] == list(range(10))
+    assert all(e["product"] is None for e in loaded)
+    with pytest.raises(ValueError):
+        loaded[0].save()
+
+    loaded = storage.iter_experiments(
+        ProductExperiment, "iter", fields=["product"], exclude=["count<5"]
+    )
+    assert [e["product"] for e in loaded] == [10, 12, 14, 16, 18]
+    assert (
+        len(list(storage.iter_experiments(ProductExperiment, "iter", fields=["x"])))
+        == 10
+    )
+
+
+def test_fingerprints(storage):
+    from autodora.sql_storage import ExperimentModel
+
+    experiments = ProductExperiment.explore(
+        "fingerprints", {"count": [1, 2, 3]}
+    ).experiments
+    storage.save_many(experiments)
+    # Experiments stored before fingerprints were introduced receive them on demand
+    with storage.bound():
+        ExperimentModel.update(fingerprint=None, setting=None).where(
+            ExperimentModel.id == experiments[0].identifier
+        ).execute()
+
+    queued = ProductExperiment.explore(
+        "fingerprints", {"count": [1.0, 3, 4]}
+    ).experiments
+    assert queued[0].fingerprint() == experiments[0].fingerprint()
+    settings = [e.setting_fingerprint() for e in queued]
+    identifiers = storage.get_identifiers(ProductExperiment, "fingerprints", settings)
+    assert identifiers == {
+        experiments[0].setting_fingerprint(): experiments[0].identifier,
+        experiments[2].setting_fingerprint(): experiments[2].identifier,
+    }
+    assert (
+        storage.get_identifiers(
+            ProductExperiment, "other", [queued[0].setting_fingerprint()]
+        )
+        == {}
+    )
+
+    # The setting includes the config values that change the outcome of a run
+    queued[1]["@timeout"] = 10
+    assert queued[1].fingerprint() == experiments[2].fingerprint()
+    assert (
+        storage.get_identifiers(
+            ProductExperiment, "fingerprints", [queued[1].setting_fingerprint()]
+        )
+        == {}
+    )
+
+    # Values without stable representation cannot be fingerprinted
+    experiment = ProductExperiment("fingerprints")
+    experiment["input"] = object()
+    with pytest.raises(ValueError):
+        experiment.fingerprint()
+    storage.save(experiment)
+    with storage.bound():
+        assert ExperimentModel.get_by_id(experiment.identifier).setting is None
+
+
+def test_rerun_with_timeout(storage):
+    from autodora.runner import CommandLineRunner
+
+    t = ProductExperiment.explore("rerun", {"count": [1, 2]})
+    for timeout in [10, 10, 20]:
+        # A larger timeout can change the outcome, so the settings are run again
+        t = ProductExperiment.explore("rerun", {"count": [1, 2]})
+        CommandLineRunner(t, storage, timeout=timeout, via_cli=False).run()
+    assert sorted(
+        e["@timeout"] for e in storage.get_experiments(ProductExperiment, "rerun")
+    ) == [10, 10, 20, 20]
+
+
+class AssigningExperiment(Experiment):
+    count = Parameter(int, 1)
+    square = Parameter(int, None)
+
+    def run(self):
+        # Assigns a parameter that was not set
+        return {"square": self["count"] ** 2}
+
+
+def test_resume_assigning(storage):
+    from autodora.prediction import predict_runtimes
+    from autodora.runner import CommandLineRunner
+
+    for _ in range(3):
+        t = AssigningExperiment.explore("assigning", {"count": [2, 3]})
+        CommandLineRunner(t, storage, via_cli=False).run()
+    stored = storage.get_experiments(AssigningExperiment, "assigning")
+    assert sorted(e["square"] for e in stored) == [4, 9]
+
+    # Runtimes are found by the fingerprints of the settings before they ran
+    fingerprints = [e.fingerprint() for e in t.experiments]
+    assert len(storage.get_runtimes(AssigningExperiment, fingerprints)) == 2
+    runtimes = {e["count"]: e["@runtime"] for e in stored}
+    assert predict_runtimes(storage, t.experiments) == [runtimes[2], runtimes[3]]
+
+
+def test_derived_dependencies(storage):
+    from autodora.sql_storage import ExperimentModel
+
+    experiments = ProductExperiment.explore(
+        "dependencies", {"input": ["2x3", "3x4"]}
+    ).experiments
+    for e in experiments:
+        e.get("x")
+        e.get("y")
+    storage.save_many(experiments)
+    # Derived values stored before dependencies were recorded are invalidated by any
+    # change
+    with storage.bound():
+        ExperimentModel.update(dependencies=None).where(
+            ExperimentModel.id == experiments[1].identifier
+        ).execute()
+
+    tracked, untracked = storage.get_experiments(ProductExperiment, "dependencies")
+    assert tracked.dependencies == {
+        "x": {("parameters", "input")},
+        "y": {("parameters", "input")},
+    }
+    tracked["product"] = 36
+    untracked["product"] = 144
+    assert tracked.derived == {"x": 2, "y": 3} and untracked.derived == {}
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_derive(storage, processes):
+    from autodora.derive import derive
+
+    experiments = ProductExperiment.explore(
+        "derive", {"input": ["2x3", "3x4", "4x5"]}
+    ).experiments
+    experiments[0].get("x")
+    storage.save_many(experiments)
+
+    assert (
+        derive(
+            ProductExperiment,
+            "derive",
+            ["x", "derived.y"],
+            storage,
+            processes,
+            chunk_size=2,
+        )
+        == 3
+    )
+    stored = storage.get_experiments(ProductExperiment, "derive")
+    assert [e.derived for e in stored] == [
+        {"x": 2, "y": 3},
+        {"x": 3, "y": 4},
+        {"x": 4, "y": 5},
+    ]
+    assert stored[0].dependencies["y"] == {("parameters", "input")}
+    # Only experiments that are missing values are processed again
+    assert derive(ProductExperiment, "derive", ["x"], storage, processes) == 0
+
+    with pytest.raises(ValueError):
+        derive(ProductExperiment, "derive", ["x_square"], storage)
+
+
+class CachedExperiment(Experiment):
+    cache_results = True
+    code_version = "1"
+    value = Parameter(int, 1, "The value to square")
+    square = Result(int, None, "The squared value")
+    runs = 0
+    hooks = None  # type: list
+
+    def before_run(self):
+        CachedExperiment.hooks.append(("before", self.value))
+
+    def run(self):
+        CachedExperiment.runs += 1
+        return {"square": self.value**2}
+
+    def after_run(self):
+        CachedExperiment.hooks.append(("after", self.square))
+
+
+def test_result_cache(storage, monkeypatch):
+    def run(group, values):
+        experiments = CachedExperiment.explore(group, {"value": values}).experiments
+        storage.save_many(experiments)
+        for e in experiments:
+            e.run_wrapped()
+        return storage.get_experiments(CachedExperiment, group)
+
+    monkeypatch.setattr(CachedExperiment, "runs", 0)
+    monkeypatch.setattr(CachedExperiment, "hooks", [])
+    first = run("first", [1, 2])
+    second = run("second", [2, 3])
+    assert CachedExperiment.runs == 3
+    # The hooks are called around cache hits as well
+    assert CachedExperiment.hooks[4:] == [
+        ("before", 2),
+        ("after", 4),
+        ("before", 3),
+        ("after", 9),
+    ]
+    assert [e["square"] for e in second] == [4, 9]
+    assert (
+        second[0]["@cached_from"] == first[1].identifier
+        and second[1]["@cached_from"] is None
+    )
+    assert second[0]["@end_time"] is not None
+    # Cache hits report the runtime of their source
+    assert second[0]["@runtime_wall"] == first[1]["@runtime_wall"]
+
+    # Results of other code versions are not reused
+    monkeypatch.setattr(CachedExperiment, "code_version", "2")
+    run("third", [2])
+    assert CachedExperiment.runs == 4
+
+
+class CheckpointExperiment(Experiment):
+    steps = Parameter(int, 10, "Number of steps to sum")
+    total = Result(int, None, "Sum of all steps")
+    started_at = None
+
+    def run(self):
+        step, total = self.restore() or (0, 0)
+        CheckpointExperiment.started_at = step
+        while step < self["steps"]:
+            time.sleep(0.1)
+            step, total = step + 1, total + step
+            self.checkpoint((step, total))
+        return {"total": total}
+
+
+def test_checkpoint(storage):
+    from autodora.parallel import run_function
+    from autodora.runner import CommandLineRunner
+    from autodora.sql_storage import Checkpoint
+
+    experiment = CheckpointExperiment("checkpoint")
+    storage.save(experiment)
+    run_function(
+        CommandLineRunner.run_single,
+        storage,
+        CheckpointExperiment,
+        experiment.identifier,
+        timeout=0.5,
+    )
+    interrupted = experiment.fresh_copy()
+    assert interrupted["@end_time"] is None
+    with storage.bound():
+        assert Checkpoint.select().count() == 1
+
+    # Checkpoints are not shared between groups
+    other = CheckpointExperiment("other")
+    storage.save(other)
+    assert other.run_wrapped()["total"] == 45
+    assert CheckpointExperiment.started_at == 0
+    with storage.bound():
+        assert Checkpoint.select().count() == 1
+
+    # A rerun in the same group resumes from the last checkpoint
+    rerun = CheckpointExperiment("checkpoint")
+    storage.save(rerun)
+    resumed = rerun.run_wrapped().fresh_copy()
+    assert CheckpointExperiment.started_at > 0
+    assert resumed["total"] == 45 and resumed["@end_time"] is not None
+    with storage.bound():
+        assert Checkpoint.select().count() == 0
+
+
+class TracingExperiment(Experiment):
+    steps = Parameter(int, 5, "Number of improvements")
+
+    def run(self):
+        for step in range(self["steps"]):
+            self.report("quality", step)
+            time.sleep(0.05)
+
+
+def test_report(storage):
+    from autodora.analyze import trace_at
+    from autodora.filters import get_property
+    from autodora.parallel import run_function
+    from autodora.runner import CommandLineRunner
+
+    experiments = TracingExperiment.explore("report", {"steps": [5, 2]}).experiments
+    storage.save_many(experiments)
+    for e in experiments:
+        e.run_wrapped()
+    stored = list(
+        storage.iter_experiments(TracingExperiment, "report", fields=["quality__at10"])
+    )
+    times, values = stored[0].get_trace("quality")
+    assert (
+        list(values) == [0, 1, 2, 3, 4]
+        and times[0] < 0.05
+        and list(times) == sorted(times)
+    )
+    assert (
+        get_property(0, stored[0], "quality__at10") == 4
+        and stored[0].get_trace_value("quality", -1) is None
+    )
+    assert trace_at(stored, "quality", [0.075, 10]) == [1, 2.5]
+
+    # Reported values are stored when an experiment is terminated by a timeout
+    experiment = TracingExperiment("report", storage)
+    experiment["steps"] = 100
+    storage.save(experiment)
+    run_function(
+        CommandLineRunner.run_single,
+        storage,
+        TracingExperiment,
+        experiment.identifier,
+        timeout=0.5,
+    )
+    assert 2 < len(experiment.fresh_copy().get_trace("quality")[1]) < 100
+
+
+class InterruptedExperiment(Experiment):
+    def run(self):
+        self.report("quality", 1)
+        with self.storage.write_transaction():
+            # Terminated while writing, e.g., saving the experiment
+            os.kill(os.getpid(), signal.SIGTERM)
+            self.report("quality", 2)
+        self.report("quality", 3)
+        time.sleep(10)
+
+
+def test_report_termination(storage):
+    from autodora.parallel import run_function
+    from autodora.runner import CommandLineRunner
+
+    experiment = InterruptedExperiment("report", storage)
+    storage.save(experiment)
+    start = time.time()
+    run_function(
+        CommandLineRunner.run_single,
+        storage,
+        InterruptedExperiment,
+        experiment.identifier,
+        timeout=5,
+    )
+    assert time.time() - start < 5
+    assert list(experiment.fresh_copy().get_trace("quality")[1]) == [1, 2, 3]
+
+
+@pytest.mark.parametrize("kind", ["cpu", "memory"])
+def test_profile(storage, kind):
+    from autodora.parallel import run_function
+    from autodora.profiling import hotspots
+    from autodora.runner import CommandLineRunner
+
+    experiments = ProductExperiment.explore(
+        "profile", {"input": ["2x3", "3x4"], "@profile": [kind, kind]}
+    ).experiments
+    storage.save_many(experiments)
+    for e in experiments:
+        e.run_wrapped()
+    experiments[0].run_wrapped()  # Profiles of later runs replace earlier ones
+
+    profiles = storage.get_profiles([e.identifier for e in experiments], kind)
+    assert (
+        len(profiles) == 2
+        and storage.get_profiles([experiments[0].identifier], "other") == []
+    )
+    report = hotspots(kind, profiles, top=5)
+    assert (
+        ("product_experiment.py" in report)
+        if kind == "cpu"
+        else ("Peak traced memory" in report)
+    )
+
+    storage.remove("profile")
+    assert storage.get_profiles([e.identifier for e in experiments], kind) == []
+
+    # Profiles are stored when an experiment is terminated by a timeout
+    experiment = TracingExperiment("profile", storage)
+    experiment["steps"] = 100
+    experiment["@profile"] = kind
+    storage.save(experiment)
+    run_function(
+        CommandLineRunner.run_single,
+        storage,
+        TracingExperiment,
+        experiment.identifier,
+        timeout=0.5,
+    )
+    assert experiment.fresh_copy()["@end_time"] is None
+    assert len(storage.get_profiles([experiment.identifier], kind)) == 1
+
+
+def test_overhead(storage, monkeypatch):
+    from autodora.parallel import DISPATCH_TIME_VARIABLE
+    from autodora.runner import CommandLineRunner, overhead_summary
+
+    experiment = ProductExperiment("overhead")
+    storage.save(experiment)
+    monkeypatch.setenv(DISPATCH_TIME_VARIABLE, repr(time.time() - 0.5))
+    CommandLineRunner.run_single(storage, ProductExperiment, experiment.identifier)
+    stored = experiment.fresh_copy()
+    assert 0.5 <= stored["@overhead.startup"] < 5
+    assert stored["@overhead.load"] > 0 and stored["@overhead.initial_save"] > 0
+
+    summary = overhead_summary([stored], stored["@overhead.startup"] + 1, 0.01)
+    assert "startup" in summary and "finish" in summary and "fresh copy" in summary
+
+
+def test_warm_runner(storage):
+    from autodora.runner import CommandLineRunner
+
+    t = ProductExperiment.explore("warm", {"count": [1, 2, 3, 10000000]})
+    experiments = CommandLineRunner(
+        t, storage, processes=2, timeout=1, via_cli=False, max_tasks=2
+    ).run()
+    assert [e["@completed"] for e in experiments] == [True, True, True, False]
+    assert all(e["@overhead.startup"] < 1 for e in experiments[:3])
+
+
+class CrashingExperiment(Experiment):
+    crash = Parameter(bool, False, "Exit the process while running")
+    done = Result(bool, False, "Ran until the end")
+
+    def run(self):
+        if self["crash"]:
+            os._exit(3)
+        return {"done": True}
+
+
+class ChildExperiment(Experiment):
+    child = Result(int, None, "Identifier of the process started by the experiment")
+
+    def run(self):
+        self["child"] = subprocess.Popen(["sleep", "30"]).pid
+        self.save()
+        time.sleep(30)
+
+
+def test_run_batch(storage):
+    from autodora.runner import CommandLineRunner, experiment_status
+    from autodora.parallel import Update
+
+    t = ProductExperiment.explore("batch", {"count": [1, 10000000, 2]})
+    for e in t.experiments:
+        e.config["@timeout"] = 1
+    storage.save_many(t.experiments)
+    CommandLineRunner.run_batch(
+        storage, ProductExperiment, [e.identifier for e in t.experiments]
+    )
+    statuses = [experiment_status(e.fresh_copy()) for e in t.experiments]
+    assert statuses == [Update.DONE, Update.TIMEOUT, Update.DONE]
+
+    t = CrashingExperiment.explore("batch", {"crash": [True, False]})
+    storage.save_many(t.experiments)
+    CommandLineRunner.run_batch(
+        storage, CrashingExperiment, [e.identifier for e in t.experiments]
+    )
+    crashed, finished = [e.fresh_copy() for e in t.experiments]
+    assert crashed["@error"] == "Process exited with code 3" and not crashed["done"]
+    assert finished["done"] and finished["@completed"]
+
+    # Processes started by experiments that time out are stopped along with them
+    experiment = ChildExperiment("batch")
+    experiment.config["@timeout"] = 1
+    storage.save(experiment)
+    CommandLineRunner.run_batch(storage, ChildExperiment, [experiment.identifier])
+    child = experiment.fresh_copy()["child"]
+    time.sleep(0.1)
+    if os.path.exists("/proc/{}/stat".format(child)):
+        with open("/proc/{}/stat".format(child)) as ref:
+            # Killed, but not reaped yet
+            assert ref.read().split(")")[-1].split()[0] == "Z"
+
+
+def test_batched_runner(storage):
+    from autodora.runner import CommandLineRunner, PrintObserver
+
+    class BatchRunner(CommandLineRunner):
+        sizes = []
+
+        def command(self, batch):
+            self.sizes.append(len(batch))
+            return super().command(batch)
+
+    class Counter(PrintObserver):
+        finished = []
+
+        def experiment_finished(self, index, experiment):
+            self.finished.append(index)
+
+    t = ProductExperiment.explore("batched", {"count": list(range(1, 21))})
+    runner = BatchRunner(
+        t,
+        storage,
+        processes=2,
+        timeout=10,
+        observer=Counter(auto_load=False),
+        batch_time=2,
+    )
+    experiments = runner.run()
+    assert all(e["@completed"] for e in experiments)
+    assert sorted(Counter.finished) == list(range(20))
+    assert sum(BatchRunner.sizes) == 20 and max(BatchRunner.sizes) > 1
+
+
+def test_merge(tmp_path):
+    from autodora.sql_storage import SqliteStorage
+
+    shards = []
+    for i in range(2):
+        storage = SqliteStorage(str(tmp_path / "shard{}.sqlite".format(i)))
+        storage.get_new_run()
+        t = ProductExperiment.explore(
+            "merge", {"count": [i * 10 + j for j in range(5)]}
+        )
+        for e in t.experiments:
+            e.config["@run.count"] = 1
+        storage.save_many(t.experiments)
+        storage.save_traces(
+            t.experiments[0].identifier,
+            {"loss": (array("d", [0.0]), array("d", [float(i)]))},
+        )
+        shards.append(str(tmp_path / "shard{}.sqlite".format(i)))
+        storage.database.close()
+
+    merged = SqliteStorage(str(tmp_path / "merged.sqlite"))
+    assert [merged.merge(filename) for filename in shards] == [5, 5]
+    experiments = merged.get_experiments(ProductExperiment, "merge")
+    assert sorted(e["count"] for e in experiments) == [
+        0,
+        1,
+        2,
+        3,
+        4,
+        10,
+        11,
+        12,
+        13,
+        14,
+    ]
+    assert len(set(e.identifier for e in experiments)) == 10
+    assert sorted(set(e["@run.count"] for e in experiments)) == [1, 2]
+    assert (
+        len(
+            merged.get_experiments(
+                ProductExperiment, "merge", where=["@run.count=2", "count>=10"]
+            )
+        )
+        == 5
+    )
+    assert merged.get_traces(experiments[5].identifier)["loss"][1] == array("d", [1.0])
+    assert merged.get_new_run() == 3
+    merged.database.close()
+
+
+def test_separate_storages(tmp_path):
+    from autodora.sql_storage import SqliteStorage
+
+    first = SqliteStorage(str(tmp_path / "first.sqlite"))
+    second = SqliteStorage(str(tmp_path / "second.sqlite"))
+    first.save(ProductExperiment("separate"))
+    assert len(first.get_experiments(ProductExperiment, "separate")) == 1
+    assert second.get_experiments(ProductExperiment, "separate") == []
+    assert [first.get_new_run(), second.get_new_run(), first.get_new_run()] == [1, 1, 2]
+    first.database.close()
+    second.database.close()
@@ -0,0 +1,121 @@
+import pytest
+
+from autodora.runner import CommandLineRunner
+from autodora.simple_runner import SimpleRunner
+from autodora.trajectory import grid, as_settings, hash_shard, product
+from product_experiment import ProductExperiment
+
+
+def test_settings():
+    settings = grid(a=[1, 2, 3], b=["x", "y"]).product({"c": [True, False]})
+    assert len(settings) == 12
+    assert list(settings) == product(
+        {"a": [1, 2, 3]}, {"b": ["x", "y"]}, {"c": [True, False]}
+    )
+
+    chained = settings.chain([{"a": 0}])
+    assert len(chained) == 13 and list(chained)[-1] == {"a": 0}
+
+    filtered = settings.filter(lambda s: s["a"] != 2)
+    with pytest.raises(TypeError):
+        len(filtered)
+    assert len(list(filtered)) == 8
+    assert len(list(as_settings(filtered).filter(lambda s: s["c"]))) == 4
+    assert list(as_settings({})) == [{}]
+
+    # Sizes are known without generating any settings
+    huge = grid(**{str(i): list(range(10)) for i in range(12)})
+    assert len(huge) == 10**12
+    assert next(iter(huge)) == {str(i): 0 for i in range(12)}
+
+
+def test_constraint_pruning():
+    checked = []
+
+    def constraint(setting):
+        checked.append(setting)
+        return setting["a"] == 1
+
+    settings = grid(a=list(range(100)), b=list(range(100)), c=list(range(100))).filter(
+        constraint
+    )
+    assert len(list(settings)) == 100 * 100
+    # The constraint is checked on the partial settings {a: ...} only
+    assert len(checked) == 100 and all(set(s) == {"a"} for s in checked)
+
+    settings = grid(a=[1, 2], b=[1, 2]).filter(lambda s: s["a"] < s["b"])
+    assert list(settings) == [{"a": 1, "b": 2}]
+
+
+def test_lazy_trajectory(storage):
+    settings = grid(input=["1x2", "2x3"], count=list(range(1, 6))).filter(
+        lambda s: s["count"] % 2 == 1
+    )
+    t = ProductExperiment.explore_lazy("lazy", settings)
+    runner = SimpleRunner(t, storage)
+    runner.chunk_size = 4
+    assert runner.run() is None
+
+    experiments = storage.get_experiments(ProductExperiment, "lazy")
+    assert len(experiments) == 6
+    assert all(
+        e["product"] == (e["x"] * e["y"]) ** 2 and e["@completed"] for e in experiments
+    )
+
+    # Experiments that were run before are skipped
+    assert (
+        SimpleRunner(ProductExperiment.explore_lazy("lazy", settings), storage).run()
+        is None
+    )
+    assert len(storage.get_experiments(ProductExperiment, "lazy")) == 6
+
+    t = ProductExperiment.explore_lazy("lazy", grid(input=["3x3"], count=[1, 2]))
+    assert CommandLineRunner(t, storage, processes=2).run() is None
+    experiments = storage.get_experiments(ProductExperiment, "lazy")
+    assert len(experiments) == 8 and all(e["@completed"] for e in experiments)
+
+
+def test_shard(storage):
+    t = ProductExperiment.explore(
+        "shard",
+        product({"input": ["1x1", "2x2", "3x3"]}, {"count": list(range(1, 11))}),
+    )
+    shards = [t.shard(i, 3) for i in range(3)]
+    fingerprints = [{e.fingerprint() for e in s.experiments} for s in shards]
+    assert sum(len(s) for s in shards) == 30 and set.union(*fingerprints) == {
+        e.fingerprint() for e in t.experiments
+    }
+    assert all(len(s.settings) == len(s.experiments) for s in shards)
+    assert [len(s) for s in shards] == [len(t.shard(i, 3)) for i in range(3)]
+    lazy = ProductExperiment.explore_lazy(
+        "shard", grid(input=["1x1", "2x2", "3x3"], count=list(range(1, 11)))
+    )
+    for i in range(3):
+        assert {e.fingerprint() for e in lazy.shard(i, 3)} == fingerprints[i]
+    with pytest.raises(ValueError):
+        t.shard(3, 3)
+
+    # With runtimes of an earlier run, one long experiment is balanced by many short
+    # ones
+    history = ProductExperiment.explore("history", t.settings)
+    for e in history.experiments:
+        e["@runtime_wall"] = 20.0 if e["count"] == 10 and e["input"] == "1x1" else 1.0
+    storage.save_many(history.experiments)
+    expected = {e.fingerprint(): e["@runtime_wall"] for e in history.experiments}
+    shards = [t.shard(i, 2, storage, "history") for i in range(2)]
+    assert sorted(
+        sum(expected[e.fingerprint()] for e in s.experiments) for s in shards
+    ) == [24.0, 25.0]
+
+    # Runtimes of the group being run change while machines compute their shards, they
+    # are not used
+    for e in t.experiments[:10]:
+        e["@runtime_wall"] = 100.0
+    storage.save_many(t.experiments[:10])
+    assert [s.experiments for s in shards] == [
+        t.shard(i, 2, storage, "history").experiments for i in range(2)
+    ]
+    # Without runtime group, experiments are split by fingerprint
+    assert t.shard(0, 2, storage).experiments == [
+        e for e in t.experiments if hash_shard(e.fingerprint(), 2) == 0
+    ]
@@ -1,7 +1,21 @@
-from typing import Dict, Any, List, TYPE_CHECKING
+import heapq
+import itertools
+from typing import (
+    Dict,
+    Any,
+    List,
+    Iterator,
+    Callable,
+    Union,
+    Type,
+    Optional,
+    Tuple,
+    TYPE_CHECKING,
+)
 
 if TYPE_CHECKING:
     from .experiment import Experiment
+    from .storage import Storage
 
 
 def flatten(dict_settings):
@@ -22,7 +36,202 @@ def product(*args):
     return result
 
 
+class Settings(object):
+    """
+    A lazy collection of settings (dictionaries assigning values to experiment
+    properties).  Settings can be combined and filtered without generating them, they
+    are only generated while iterating over them.
+    """
+
+    def __iter__(self):
+        # type: () -> Iterator[Dict[str, Any]]
+        raise NotImplementedError()
+
+    def __len__(self):
+        raise TypeError(
+            "The number of filtered settings is only known after generating them"
+        )
+
+    def product(self, *others):
+        # type: (*Union[Settings, Dict, List]) -> Settings
+        return Product([self] + [as_settings(other) for other in others])
+
+    def chain(self, *others):
+        # type: (*Union[Settings, Dict, List]) -> Settings
+        return Chain([self] + [as_settings(other) for other in others])
+
+    def filter(self, *constraints):
+        # type: (*Callable[[Dict[str, Any]], bool]) -> Settings
+        """
+        Only keeps settings for which all constraints (predicates on setting
+        dictionaries) hold.
+        """
+        return Filtered(self, constraints)
+
+
+class Values(Settings):
+    def __init__(self, settings):
+        # type: (List[Dict[str, Any]]) -> None
+        self.settings = settings
+
+    def __iter__(self):
+        return iter(self.settings)
+
+    def __len__(self):
+        return len(self.settings)
+
+
+class Product(Settings):
+    """
+    All combinations of the given settings.  Constraints are checked on partial
+    combinations, as soon as they can be evaluated (constraints that raise a KeyError
+    are postponed), such that invalid combinations are pruned early.
+    """
+
+    def __init__(self, factors, constraints=()):
+        # type: (List[Settings], tuple) -> None
+        self.factors = factors
+        self.constraints = tuple(constraints)
+
+    def __iter__(self):
+        if len(self.factors) == 0:
+            return iter([dict()])
+        return self.combine(0, dict(), self.constraints)
+
+    def combine(self, depth, partial, constraints):
+        last = depth == len(self.factors) - 1
+        for setting in self.factors[depth]:
+            combined = dict(partial, **setting)
+            pending = []
+            for constraint in constraints:
+                if last:
+                    holds = constraint(combined)
+                else:
+                    try:
+                        holds = constraint(combined)
+                    except KeyError:
+                        pending.append(constraint)
+                        continue
+                if not holds:
+                    break
+            else:
+                if last:
+                    yield combined
+                else:
+                    yield from self.combine(depth + 1, combined, pending)
+
+    def __len__(self):
+        if self.constraints:
+            return super().__len__()
+        length = 1
+        for factor in self.factors:
+            length *= len(factor)
+        return length
+
+    def filter(self, *constraints):
+        return Product(self.factors, self.constraints + constraints)
+
+
+class Chain(Settings):
+    def __init__(self, parts):
+        # type: (List[Settings]) -> None
+        self.parts = parts
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self.parts)
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+
+class Filtered(Settings):
+    def __init__(self, settings, constraints):
+        self.settings = settings
+        self.constraints = tuple(constraints)
+
+    def __iter__(self):
+        for setting in self.settings:
+            if all(constraint(setting) for constraint in self.constraints):
+                yield setting
+
+
+def as_settings(settings):
+    # type: (Union[Settings, Dict[str, List], List[Dict[str, Any]]]) -> Settings
+    """
+    Settings given as dictionary assign the i-th value of every list together (see
+    flatten).
+    """
+    if isinstance(settings, Settings):
+        return settings
+    if isinstance(settings, dict):
+        return Values(flatten(settings) if len(settings) > 0 else [{}])
+    return Values(list(settings))
+
+
+def grid(**values):
+    # type: (**List) -> Settings
+    """
+    All combinations of the values given for each name, e.g., grid(a=[1, 2], b=[3, 4])
+    (4 settings).
+    """
+    return Product(
+        [
+            Values([{name: value} for value in options])
+            for name, options in values.items()
+        ]
+    )
+
+
+def create_experiment(cls, name, setting):
+    experiment = cls(name)
+    for key, value in setting.items():
+        experiment[key] = value
+    return experiment
+
+
+def parse_shard(string):
+    # type: (str) -> Tuple[int, int]
+    """Parses shards given as index/count, e.g., 0/4 is the first of four shards."""
+    index, _, count = string.partition("/")
+    index, count = int(index), int(count)
+    check_shard(index, count)
+    return index, count
+
+
+def check_shard(index, count):
+    if not 0 <= index < count:
+        raise ValueError(
+            "Shard index {} is not between 0 and {}".format(index, count - 1)
+        )
+
+
+def hash_shard(fingerprint, count):
+    # type: (str, int) -> int
+    # Fingerprints are SHA-1 digests, so they are stable across machines and processes
+    return int(fingerprint, 16) % count
+
+
+def balanced_shards(fingerprints, count, runtimes):
+    # type: (List[str], int, Dict[str, float]) -> Dict[str, int]
+    """
+    Assigns fingerprints to shards with similar total runtimes (longest first to the
+    least loaded shard), the runtime of experiments without known runtime is estimated
+    by the average runtime.
+    """
+    estimate = sum(runtimes.values()) / len(runtimes)
+    ordered = sorted(set(fingerprints), key=lambda f: (-runtimes.get(f, estimate), f))
+    loads = [(0.0, index) for index in range(count)]
+    shards = dict()
+    for fingerprint in ordered:
+        load, index = heapq.heappop(loads)
+        shards[fingerprint] = index
+        heapq.heappush(loads, (load + runtimes.get(fingerprint, estimate), index))
+    return shards
+
+
 class Trajectory(object):
+    lazy = False
+
     def __init__(self, name):
         self.experiments = []  # type: List[Experiment]
         self.settings = []
@@ -48,8 +257,100 @@ class Trajectory(object):
 
         for setting in settings:
             self.settings.append(setting)
-            experiment = cls(self.name)
-            for key, value in setting.items():
-                experiment[key] = value
+            self.add(create_experiment(cls, self.name, setting))
+
+    def iter_experiments(self):
+        # type: () -> Iterator[Experiment]
+        return iter(self.experiments)
+
+    def shard(self, index, count, storage=None, runtime_group=None):
+        # type: (int, int, Optional[Storage], Optional[str]) -> Trajectory
+        """
+        Returns the part of the trajectory that shard index (of count shards) runs.
+        Every machine that shards the same trajectory obtains the same split without
+        coordination: experiments are split by fingerprint or, given the runtimes of an
+        earlier group in the storage, such that all shards are expected to take equally
+        long.  Every machine has to see the same runtimes, so the runtime group must be
+        finished (and not the group being run).
+        """
+        check_shard(index, count)
+        fingerprints = [e.fingerprint() for e in self.experiments]
+        runtimes = dict()
+        if storage is not None and runtime_group is not None:
+            for cls in set(e.__class__ for e in self.experiments):
+                runtimes.update(
+                    storage.get_runtimes(
+                        cls,
+                        [
+                            f
+                            for e, f in zip(self.experiments, fingerprints)
+                            if e.__class__ == cls
+                        ],
+                        runtime_group,
+                    )
+                )
+        if runtimes:
+            shards = balanced_shards(fingerprints, count, runtimes)
+        else:
+            shards = {f: hash_shard(f, count) for f in fingerprints}
+
+        trajectory = Trajectory(self.name)
+        for i, (experiment, fingerprint) in enumerate(
+            zip(self.experiments, fingerprints)
+        ):
+            if shards[fingerprint] == index:
+                trajectory.add(experiment)
+                if len(self.settings) == len(self.experiments):
+                    trajectory.settings.append(self.settings[i])
+        return trajectory
+
+    def __len__(self):
+        return len(self.experiments)
+
+
+class LazyTrajectory(object):
+    """
+    Explores settings of an experiment class, experiments are only created when
+    iterating over them (runners consume them as a stream).
+    """
+
+    lazy = True
+
+    def __init__(self, name, cls, settings, shards=None):
+        # type: (str, Type[Experiment], Union[Settings, Dict[str, List], List[Dict[str, Any]]], Optional[Tuple[int, int]]) -> None
+        self.name = name
+        self.cls = cls
+        self.settings = as_settings(settings)
+        self.shards = shards
+
+    def iter_experiments(self):
+        # type: () -> Iterator[Experiment]
+        for setting in self.settings:
+            experiment = create_experiment(self.cls, self.name, setting)
+            if (
+                self.shards is None
+                or hash_shard(experiment.fingerprint(), self.shards[1])
+                == self.shards[0]
+            ):
+                yield experiment
+
+    __iter__ = iter_experiments
+
+    def shard(self, index, count, storage=None, runtime_group=None):
+        # type: (int, int, Optional[Storage], Optional[str]) -> LazyTrajectory
+        """
+        Experiments are split by fingerprint while iterating, they are not balanced by
+        runtime (which would require generating all experiments upfront).
+        """
+        check_shard(index, count)
+        if self.shards is not None:
+            raise ValueError("Trajectory is already sharded")
+        return LazyTrajectory(self.name, self.cls, self.settings, (index, count))
 
-            self.add(experiment)
+    def __len__(self):
+        if self.shards is not None:
+            raise TypeError(
+                "The number of experiments of a shard is only known after "
+                "generating them"
+            )
+        return len(self.settings)
@@ -0,0 +1,95 @@
+import os
+import platform as platform_library
+import threading
+import time
+from typing import TYPE_CHECKING, List, Optional, Type, Callable
+
+from .parallel import run_function
+from .runner import CommandLineRunner
+from .settings import DEFAULT_LEASE, MAX_ATTEMPTS
+
+if TYPE_CHECKING:
+    from .experiment import Experiment
+    from .storage import Storage
+
+
+class Lease(threading.Thread):
+    """Renews the lease on a claimed experiment while it is being run."""
+
+    def __init__(self, storage, identifier, owner, duration):
+        # type: (Storage, int, str, float) -> None
+        super().__init__(daemon=True)
+        self.storage = storage
+        self.identifier = identifier
+        self.owner = owner
+        self.duration = duration
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.duration / 3):
+            if not self.storage.renew_lease(self.identifier, self.owner, self.duration):
+                return
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def work(
+    storage,
+    classes,
+    group=None,
+    lease=DEFAULT_LEASE,
+    poll_interval=1.0,
+    wait=False,
+    max_experiments=None,
+    observer=None,
+):
+    # type: (Storage, List[Type[Experiment]], Optional[str], float, float, bool, Optional[int], Optional[Callable[[Type[Experiment], int], None]]) -> int
+    """
+    Claims queued experiments (see Storage.enqueue) from the storage and runs them one
+    by one (respecting their @timeout), until no experiments are queued anymore or, if
+    wait is set, forever.  Any number of workers can share a storage, also on different
+    machines.  The lease on a claimed experiment is renewed while it is running, if a
+    worker crashes its lease expires and the experiment is claimed again, experiments
+    that were claimed too often are abandoned (and fail with an error).  Returns the
+    number of experiments run, observer is called with the class and identifier of every
+    experiment that was run or abandoned.
+    """
+    owner = "{}:{}".format(platform_library.node(), os.getpid())
+    count = 0
+    while max_experiments is None or count < max_experiments:
+        claimed = storage.claim(classes, owner, lease, group)
+        if claimed is None:
+            abandoned = storage.abandon(classes, group)
+            for cls, identifier in abandoned:
+                experiment = storage.get_experiment(cls, identifier)
+                experiment["@error"] = (
+                    "ABANDONED\nNot finished after {} attempts".format(MAX_ATTEMPTS)
+                )
+                storage.save(experiment)
+                if observer is not None:
+                    observer(cls, identifier)
+            if abandoned:
+                continue
+            if not wait and storage.count_queued(classes, group) == 0:
+                break
+            # Other workers are still running experiments, their leases might expire
+            time.sleep(poll_interval)
+            continue
+
+        cls, identifier = claimed
+        timeout = storage.get_experiment(cls, identifier)["@timeout"]
+        heartbeat = Lease(storage, identifier, owner, lease)
+        heartbeat.start()
+        try:
+            run_function(
+                CommandLineRunner.run_single, storage, cls, identifier, timeout=timeout
+            )
+        finally:
+            heartbeat.stop()
+        storage.release(identifier, owner)
+        count += 1
+        if observer is not None:
+            observer(cls, identifier)
+    return count
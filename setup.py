@@ -10,7 +10,7 @@ DESCRIPTION = "Automate experiments and explore your data."
 URL = "http://github.com/samuelkolb/autodora"
 EMAIL = "samuel.kolb@me.com"
 AUTHOR = "Samuel Kolb"
-REQUIRES_PYTHON = ">=3.5.0"
+REQUIRES_PYTHON = ">=3.6.0"
 VERSION = "0.4.1"
 
 # What packages are required for this module to be executed?